@@ -0,0 +1,332 @@
+"""
+Screening agents
+----------------
+
+Each screening agent wraps one LLM client (one API key, per the design in
+instructions-AI-Agents.txt) and turns a claimed study into a ScreeningResult.
+The system prompts are compiled once per job from its inclusion/exclusion
+criteria (CriteriaPrompt) and shared by all of the job's agents; every study
+is then sent as a short user message, its screening text compiled at ingest
+(utils/screeningtext.py), and the model answers with a JSON decision.
+
+In batch mode the system prompt is sent once for many studies: claimed
+studies are packed into requests up to a token budget (so fewer long
+abstracts or more short ones go together), and the model answers with one
+decision per study. Studies missing from an unparseable or partial answer
+are split off and retried on their own, down to the single-study request.
+
+Every request goes through the rate limiter of the agent's API key
+(utils/ratelimit.py), shared with every other agent on that key. Rate limits
+and transient errors are retried per request; a study that still cannot be
+screened raises StudyScreeningError, so the job dead-letters that study and
+carries on with the others.
+"""
+
+from typing import Dict, Iterable, List, Optional, Union
+import asyncio
+import json
+import os
+import time
+from models import DecisionType, ScreeningCriteria, ScreeningResult
+from utils.metrics import LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_RETRIES, record_llm_usage
+from utils.ratelimit import (
+    LLM_MAX_ATTEMPTS, KeyRateLimiter, backoff_seconds, classify_error, get_rate_limiter, retry_after_seconds
+)
+from utils.screeningtext import CHARS_PER_TOKEN, compile_screening_text, count_tokens, normalize_text
+
+try:
+    from openai import AsyncOpenAI
+except ImportError:  # Only needed when screening against the real API
+    AsyncOpenAI = None
+
+DEFAULT_MODEL = os.getenv("SCREENING_MODEL", "gpt-4o-mini")
+BATCH_TOKEN_BUDGET = int(os.getenv("SCREENING_BATCH_TOKEN_BUDGET", 6000))  # per request
+BATCH_MAX_STUDIES = int(os.getenv("SCREENING_BATCH_MAX_STUDIES", 20))
+ANSWER_TOKENS_PER_STUDY = 80  # room left in the budget for each study's decision and rationale
+
+SYSTEM_PROMPT = """You are a screening agent for a systematic review.
+Decide whether each study should be included, excluded, or marked as maybe, using only
+its title, abstract and keywords and the criteria below.
+
+Inclusion criteria:
+{inclusion}
+
+Exclusion criteria:
+{exclusion}
+
+{answer_format}
+Use "maybe" when the abstract does not contain enough information to decide."""
+
+DECISION_FORMAT = '{"decision": "include" | "exclude" | "maybe", "confidence": <0.0-1.0>, "rationale": "<one or two sentences>"}'
+SINGLE_ANSWER = "Answer with a JSON object: " + DECISION_FORMAT + "."
+BATCH_ANSWER = (
+    'You will be given several numbered studies. Answer with a JSON object {"results": [...]} holding one '
+    + DECISION_FORMAT + ' per study, each with the study\'s number added as "id".'
+)
+
+
+def _criteria_items(items: List[str]) -> str:
+    unique = dict.fromkeys(normalize_text(item) for item in items)
+    return "\n".join(f"- {item}" for item in unique if item)
+
+
+def build_system_prompt(criteria: ScreeningCriteria, batch: bool = False) -> str:
+    """Render the inclusion/exclusion criteria into the agent's system prompt"""
+    return SYSTEM_PROMPT.format(
+        inclusion=_criteria_items(criteria.inclusion),
+        exclusion=_criteria_items(criteria.exclusion),
+        answer_format=BATCH_ANSWER if batch else SINGLE_ANSWER
+    )
+
+
+class CriteriaPrompt:
+    """A job's system prompts (single and batch) and their token counts, compiled once for all its agents"""
+
+    def __init__(self, criteria: ScreeningCriteria):
+        self.single = build_system_prompt(criteria)
+        self.batch = build_system_prompt(criteria, batch=True)
+        self.single_tokens = count_tokens(self.single)
+        self.batch_tokens = count_tokens(self.batch)
+
+
+def build_study_prompt(study: Dict) -> str:
+    """The study's screening text: compiled at ingest, or now for studies stored before it was"""
+    if study.get("screening_text"):
+        return study["screening_text"]
+    return compile_screening_text(study.get("title"), study.get("abstract"), study.get("keywords"))[0]
+
+
+def study_tokens(study: Dict) -> int:
+    return study.get("screening_tokens") or count_tokens(build_study_prompt(study))
+
+
+def build_batch_prompt(studies: List[Dict]) -> str:
+    """Number the studies so the answer can refer to them without repeating their ids"""
+    return "\n\n".join(
+        f"Study {number}\n{build_study_prompt(study)}"
+        for number, study in enumerate(studies, start=1)
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def pack_token_counts(
+    token_counts: Iterable[int],
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_studies: int = BATCH_MAX_STUDIES
+) -> List[int]:
+    """Studies per request when studies of these prompt sizes are packed in order"""
+    sizes: List[int] = []
+    size = used = 0
+    for tokens in token_counts:
+        cost = tokens + ANSWER_TOKENS_PER_STUDY
+        # A study that is over budget on its own still gets a request of its own
+        if size and (used + cost > token_budget or size >= max_studies):
+            sizes.append(size)
+            size = used = 0
+        size += 1
+        used += cost
+    if size:
+        sizes.append(size)
+    return sizes
+
+
+def pack_batches(
+    studies: List[Dict],
+    token_budget: int = BATCH_TOKEN_BUDGET,
+    max_studies: int = BATCH_MAX_STUDIES
+) -> List[List[Dict]]:
+    """Group studies into requests that fit the token budget, so batch size follows abstract length"""
+    batches: List[List[Dict]] = []
+    start = 0
+    for size in pack_token_counts((study_tokens(study) for study in studies), token_budget, max_studies):
+        batches.append(studies[start:start + size])
+        start += size
+    return batches
+
+
+class StudyScreeningError(Exception):
+    """Screening gave up on a study: its answer was unusable, or its request kept failing"""
+
+    def __init__(self, message: str, attempts: int, transient: bool):
+        super().__init__(message)
+        self.attempts = attempts
+        self.transient = transient  # True when retries ran out (rate limits, outages), not the study's fault
+
+
+def _result_from_data(data: Dict) -> ScreeningResult:
+    return ScreeningResult(
+        decision=DecisionType(str(data["decision"]).strip().lower()),
+        confidence=min(max(float(data.get("confidence", 0.0)), 0.0), 1.0),
+        rationale=str(data.get("rationale", "")).strip()
+    )
+
+
+def parse_screening_result(content: str) -> ScreeningResult:
+    """Parse the model's JSON answer into a ScreeningResult"""
+    return _result_from_data(json.loads(content))
+
+
+def parse_batch_results(content: str, studies: List[Dict]) -> Dict[str, ScreeningResult]:
+    """Map a batch answer back to study ids, skipping entries that are missing or malformed"""
+    data = json.loads(content)
+    items = data.get("results", []) if isinstance(data, dict) else data
+    results: Dict[str, ScreeningResult] = {}
+    for item in items if isinstance(items, list) else []:
+        try:
+            number = int(item["id"])
+            if not 1 <= number <= len(studies) or studies[number - 1]["id"] in results:
+                continue
+            results[studies[number - 1]["id"]] = _result_from_data(item)
+        except (KeyError, TypeError, ValueError):
+            continue
+    return results
+
+
+class ScreeningAgent:
+    def __init__(
+        self,
+        name: str,
+        criteria: ScreeningCriteria,
+        api_key: Optional[str] = None,
+        model: str = DEFAULT_MODEL,
+        client=None,
+        rate_limiter: Optional[KeyRateLimiter] = None,
+        prompt: Optional[CriteriaPrompt] = None
+    ):
+        self.name = name
+        self.model = model
+        self.prompt = prompt or CriteriaPrompt(criteria)
+        self.system_prompt = self.prompt.single
+        self.batch_system_prompt = self.prompt.batch
+        self.client = client
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter or get_rate_limiter(api_key)
+        self.usage = {"requests": 0, "studies": 0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0}
+
+    def _get_client(self):
+        if self.client is None:
+            if AsyncOpenAI is None:
+                raise RuntimeError("The openai package is required for LLM screening")
+            # Retries are ours (per request, through the key's rate limiter), not the client's
+            self.client = AsyncOpenAI(api_key=self.api_key, max_retries=0)
+        return self.client
+
+    async def _complete(self, system_prompt: str, prompt: str) -> str:
+        """Send one chat request through the key's rate limiter and add its token usage to the agent's counters"""
+        estimated = estimate_tokens(system_prompt + prompt) + ANSWER_TOKENS_PER_STUDY
+        attempt = 0
+        while True:
+            attempt += 1
+            started_at = await self.rate_limiter.acquire(estimated)
+            started = time.perf_counter()
+            try:
+                response = await self._get_client().chat.completions.create(
+                    model=self.model,
+                    temperature=0,
+                    response_format={"type": "json_object"},
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+            except Exception as error:
+                self.rate_limiter.release()
+                LLM_REQUEST_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+                await self._before_retry(error, attempt, started_at)
+                continue
+            except BaseException:
+                self.rate_limiter.release()
+                raise
+            LLM_REQUEST_SECONDS.labels(self.name).observe(time.perf_counter() - started)
+            content = response.choices[0].message.content
+            
+            usage = getattr(response, "usage", None)
+            prompt_tokens = getattr(usage, "prompt_tokens", None) or estimate_tokens(system_prompt + prompt)
+            completion_tokens = getattr(usage, "completion_tokens", None) or estimate_tokens(content or "")
+            self.rate_limiter.release(prompt_tokens + completion_tokens, estimated)
+            self.rate_limiter.on_success()
+            self.usage["requests"] += 1
+            self.usage["prompt_tokens"] += prompt_tokens
+            self.usage["completion_tokens"] += completion_tokens
+            LLM_REQUESTS.labels(self.name, "ok").inc()
+            record_llm_usage(self.name, prompt_tokens, completion_tokens)
+            return content
+    
+    async def _before_retry(self, error: Exception, attempt: int, started_at: float):
+        """Raise unless the failed request is worth another attempt, else wait until it may go again"""
+        kind = classify_error(error)
+        LLM_REQUESTS.labels(self.name, "rate_limited" if kind == "rate_limited" else "error").inc()
+        if kind == "fatal":
+            raise error
+        message = f"{type(error).__name__}: {error}"
+        if kind == "permanent":
+            raise StudyScreeningError(message, attempt, transient=False) from error
+        
+        retry_after = retry_after_seconds(error)
+        if kind == "rate_limited":
+            self.rate_limiter.on_rate_limited(started_at, retry_after)
+        if attempt >= LLM_MAX_ATTEMPTS:
+            raise StudyScreeningError(f"Gave up after {attempt} attempts: {message}", attempt, transient=True) from error
+        LLM_RETRIES.labels(self.name, kind).inc()
+        self.usage["retries"] += 1
+        await asyncio.sleep(backoff_seconds(attempt, retry_after))
+    
+    async def screen(self, study: Dict) -> ScreeningResult:
+        """Ask the LLM for a decision on a single study"""
+        content = await self._complete(self.system_prompt, build_study_prompt(study))
+        try:
+            result = parse_screening_result(content)
+        except (KeyError, TypeError, ValueError) as error:
+            raise StudyScreeningError(f"Unusable answer: {error}", 1, transient=False) from error
+        self.usage["studies"] += 1
+        return result
+    
+    async def screen_batch(self, studies: List[Dict]) -> Dict[str, Union[ScreeningResult, StudyScreeningError]]:
+        """Screen several studies in one request, retrying only the studies the answer missed"""
+        if len(studies) == 1:
+            try:
+                return {studies[0]["id"]: await self.screen(studies[0])}
+            except StudyScreeningError as error:
+                return {studies[0]["id"]: error}
+        
+        try:
+            content = await self._complete(self.batch_system_prompt, build_batch_prompt(studies))
+            results = parse_batch_results(content, studies)
+        except StudyScreeningError as error:
+            if error.transient:
+                # Splitting the batch would only send more requests against an exhausted quota
+                return {study["id"]: error for study in studies}
+            results = {}  # e.g. over the context length: smaller batches may fit
+        except ValueError:  # Not JSON at all
+            results = {}
+        self.usage["studies"] += len(results)
+        
+        missing = [study for study in studies if study["id"] not in results]
+        if len(missing) == len(studies):
+            # Nothing usable came back: halve the batch and try each half
+            middle = len(studies) // 2
+            groups = [studies[:middle], studies[middle:]]
+        else:
+            groups = [missing] if missing else []
+        for group in groups:
+            results.update(await self.screen_batch(group))
+        return results
+
+
+def get_agent_api_keys() -> List[Optional[str]]:
+    """One API key per screening agent (OPENAI_API_KEY_1..3), falling back to OPENAI_API_KEY"""
+    keys = [os.getenv(f"OPENAI_API_KEY_{i}") for i in range(1, 4)]
+    keys = [key for key in keys if key]
+    return keys or [os.getenv("OPENAI_API_KEY")]
+
+
+def build_screening_agents(criteria: ScreeningCriteria) -> List[ScreeningAgent]:
+    """Create one screening agent per configured API key"""
+    prompt = CriteriaPrompt(criteria)
+    return [
+        ScreeningAgent(f"screening-agent-{i + 1}", criteria, api_key=key, prompt=prompt)
+        for i, key in enumerate(get_agent_api_keys())
+    ]
@@ -0,0 +1,96 @@
+"""
+Benchmark: LLM calls saved by the confidence-gated cascade
+----------------------------------------------------------
+
+Screens the same synthetic job with FakeChatClient agents, first the usual
+way (every study screened once, by one of the agents), then through a
+ScreeningCascade (cascade.py) at each --thresholds value. Each tier's
+client is salted differently, so the tiers answer independently: about a
+quarter of answers are "maybe" and confidence is spread over 0.5-1.0.
+
+Reports, per run: LLM requests per study, the share of studies settled by
+each tier, how many the cascade left as "maybe", and the final decision
+counts. The single-agent run is the cost floor; a cascade that always
+consulted all three agents would cost 3 requests per study.
+
+Usage (from backend/):
+    python -m benchmarks.bench_cascade --studies 2000 --thresholds 0.6 0.7 0.8 0.9
+"""
+
+import argparse
+import asyncio
+import os
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+from agents import ScreeningAgent
+from cascade import ScreeningCascade
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from models import JobStatus, ScreeningCriteria
+from utils.risfileparsing import iter_ris_entries
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+from benchmarks.synthetic import generate_records
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+
+
+def tier_agents(criteria, tier: int, args):
+    return [
+        ScreeningAgent(f"tier-{tier + 1}-agent-{i + 1}", criteria,
+                       client=FakeChatClient(args.llm_latency_ms / 1000, seed=tier * 10 + i, salt=f"tier-{tier}"))
+        for i in range(args.agents)
+    ]
+
+
+async def run(entries, threshold, args):
+    db = InMemoryDatabase()
+    await db.store_ris_entries("bench", entries)
+    queue = JobQueue(
+        db=db,
+        agent_factory=lambda criteria: tier_agents(criteria, 0, args),
+        cascade_factory=lambda criteria: ScreeningCascade(
+            [tier_agents(criteria, tier, args) for tier in range(args.tiers)], threshold
+        ),
+        job_store=MemoryJobStore()
+    )
+    queue.cascade_mode = threshold is not None
+    queue.workers_per_job = args.workers_per_job
+    job = await queue.add_job("bench", CRITERIA, len(entries))
+    await queue.process_job(job)
+    assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+
+    status = await queue.get_job_status("bench")
+    requests = status["throughput"]["requests"]
+    counts = status["decision_counts"]
+    label = "single" if threshold is None else f"@{threshold}"
+    line = f"{label:>7}  {requests / len(entries):5.2f} requests/study"
+    stats = status["cascade"]
+    if stats:
+        resolved = "  ".join(f"tier {n + 1} {tier['resolved'] / len(entries):4.0%}" for n, tier in enumerate(stats["tiers"]))
+        line += f"   {resolved}  unresolved {stats['unresolved'] / len(entries):4.0%}  overruled {stats['overruled']:>5}"
+    print(line + f"   include {counts['include']:>5}  exclude {counts['exclude']:>5}  maybe {counts['maybe']:>5}")
+    return stats
+
+
+async def main(args):
+    text = "".join(generate_records(args.studies, duplicate_rate=0.0)).encode()
+    entries = list(iter_ris_entries([text]))
+    await run(entries, None, args)
+    stats = None
+    for threshold in args.thresholds:
+        stats = await run(entries, threshold, args)
+    if stats:
+        print("first-tier confidence by decile:", stats["first_tier_confidence"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="LLM calls per study with and without the cascade")
+    parser.add_argument("--studies", type=int, default=2000)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--tiers", type=int, default=3)
+    parser.add_argument("--agents", type=int, default=3, help="agents (API keys) per tier")
+    parser.add_argument("--workers-per-job", type=int, default=6)
+    parser.add_argument("--llm-latency-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
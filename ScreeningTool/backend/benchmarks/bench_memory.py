@@ -0,0 +1,73 @@
+"""
+Benchmark: memory held per parsed study
+---------------------------------------
+
+Parses the same RIS export (synthetic, or --file) twice, keeping every entry in a list
+the way an upload does between parsing and storage:
+
+- dicts:   compact=False, one dict per study (the rispy entry plus copies)
+- compact: StudyView rows of StudyColumns blocks (utils/studycolumns.py)
+
+and reports the Python heap held per study (tracemalloc), against the size
+of the RIS text itself, and the parse rate of each (measured separately,
+without tracemalloc). STUDY_ZLIB_LEVEL=0 measures compact rows stored
+uncompressed.
+
+Usage (from backend/):
+    python -m benchmarks.bench_memory --records 20000
+    python -m benchmarks.bench_memory --file "../test-ris-file/2.3 embase Novel (715).ris"
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from utils.risfileparsing import iter_ris_entries
+from benchmarks.synthetic import generate_records
+
+
+def held_bytes(text: bytes, compact: bool):
+    gc.collect()
+    tracemalloc.start()
+    entries = list(iter_ris_entries([text], compact=compact))
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return entries, held
+
+
+def parse_rate(text: bytes, compact: bool) -> float:
+    started = time.perf_counter()
+    count = sum(1 for _ in iter_ris_entries([text], compact=compact))
+    return count / (time.perf_counter() - started)
+
+
+def main(args):
+    if args.file:
+        with open(args.file, "rb") as f:
+            text = f.read()
+    else:
+        text = "".join(generate_records(args.records, duplicate_rate=0.0)).encode()
+
+    # Rates first, while nothing else is held (a heap full of dicts slows every garbage collection)
+    rates = {compact: parse_rate(text, compact) for compact in (False, True)}
+    results = {}
+    for compact in (False, True):
+        entries, held = held_bytes(text, compact)
+        if not compact:
+            print(f"{len(entries)} studies, RIS text {len(text) / len(entries):7.0f} bytes/study")
+        results[compact] = entries
+        label = "compact" if compact else "dicts"
+        print(f"{label:>8}: {held / len(entries):7.0f} bytes/study   parse {rates[compact]:7.0f} records/s")
+
+    # Same studies either way (compact rows also carry the DOI they are deduplicated on)
+    for plain, view in zip(results[False], results[True]):
+        assert all(view[key] == value for key, value in plain.items()), plain["title"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory held per parsed study")
+    parser.add_argument("--records", type=int, default=20000, help="synthetic records to parse")
+    parser.add_argument("--file", help="an RIS export to parse instead")
+    main(parser.parse_args())
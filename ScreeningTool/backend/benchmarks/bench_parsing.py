@@ -0,0 +1,136 @@
+"""
+Benchmark: parse throughput and event-loop lag by parsing processes
+-------------------------------------------------------------------
+
+Parses the same RIS upload (synthetic, split into --files files, or the
+given --file exports) through:
+
+- inline:  aiter_ris_entries on the event loop, as uploads were parsed before
+- thread:  utils/parallelparsing.py with PARSE_WORKERS=0 (one thread)
+- N procs: utils/parallelparsing.py with a pool of N processes
+
+and reports records/s, plus how late a 10 ms timer on the event loop fires
+while parsing runs (p50/p99/max): the delay every other API request would
+see during an ingest. Pools are started before timing, as the API's pool
+is after its first upload. It also reports what hashing the term features
+(utils/relevance.py) adds to parsing, one study at a time (plain dicts)
+and a StudyColumns block at a time (compact entries).
+
+Usage (from backend/):
+    python -m benchmarks.bench_parsing --records 50000 --files 4 --workers 1 2 4 8
+    python -m benchmarks.bench_parsing --file "../test-ris-file/2.3 embase Novel (715).ris" --workers 2
+"""
+
+import argparse
+import asyncio
+import io
+import os
+import time
+
+from utils import parallelparsing
+from utils.relevance import term_features, term_features_batch
+from utils.risfileparsing import aiter_ris_entries, aread_chunks, iter_ris_entries
+from utils.studycolumns import BLOCK_ROWS
+from benchmarks.synthetic import generate_records
+
+
+class BytesReader:
+    def __init__(self, data: bytes):
+        self.buffer = io.BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return await asyncio.to_thread(self.buffer.read, size)  # as the spooled upload is read
+
+
+async def measure(label: str, entries, count_expected: int):
+    lags = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - started - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    count = 0
+    async for _ in entries:
+        count += 1
+    seconds = time.perf_counter() - started
+    done.set()
+    await tick
+    assert count == count_expected, (label, count)
+    lags.sort()
+    print(
+        f"{label:>8}  {count / seconds:9.0f} records/s   loop lag p50 {lags[len(lags) // 2] * 1000:6.1f} ms"
+        f"  p99 {lags[int(len(lags) * 0.99)] * 1000:6.1f} ms  max {lags[-1] * 1000:6.1f} ms"
+    )
+
+
+def measure_terms(files):
+    texts = [
+        f"{entry['title']} {entry['abstract']}"
+        for _, data in files for entry in iter_ris_entries([data], compact=False)
+    ]
+    started = time.perf_counter()
+    for text in texts:
+        term_features(text)
+    per_study = time.perf_counter() - started
+    started = time.perf_counter()
+    for offset in range(0, len(texts), BLOCK_ROWS):
+        term_features_batch(texts[offset:offset + BLOCK_ROWS])
+    per_block = time.perf_counter() - started
+    print(
+        f"{'terms':>8}  {per_study / len(texts) * 1e4:.2f} s per 10k studies one by one,"
+        f" {per_block / len(texts) * 1e4:.2f} s by block ({per_study / per_block:.1f}x)"
+    )
+
+
+async def main(args):
+    if args.file:
+        files = []
+        for path in args.file:
+            with open(path, "rb") as f:
+                files.append((os.path.basename(path), f.read()))
+    else:
+        per_file = args.records // args.files
+        files = [
+            (f"export-{n + 1}.ris", "".join(generate_records(per_file, duplicate_rate=0.0)).encode())
+            for n in range(args.files)
+        ]
+    expected = 0
+    for _, data in files:
+        expected += sum(1 for _ in iter_ris_entries([data]))
+    print(f"{len(files)} files, {expected} records, {sum(len(data) for _, data in files) / 1e6:.1f} MB")
+    measure_terms(files)
+
+    async def _inline():
+        for _, data in files:
+            async for entry in aiter_ris_entries(aread_chunks(BytesReader(data))):
+                yield entry
+    await measure("inline", _inline(), expected)
+
+    for workers in [0, *args.workers]:
+        parallelparsing.shutdown_parse_pool()
+        parallelparsing.PARSE_WORKERS = workers
+        pool = parallelparsing.get_parse_pool()
+        if pool is not None:
+            # Start every process before timing
+            list(pool.map(parallelparsing.parse_piece, [b""] * workers * 4, [None] * workers * 4))
+        entries = parallelparsing.aparse_ris_files(
+            [(name, BytesReader(data)) for name, data in files], [],
+            piece_bytes=args.piece_kb * 1024, max_pending=2 * max(workers, 1)
+        )
+        await measure(f"{workers} procs" if workers else "thread", entries, expected)
+    parallelparsing.shutdown_parse_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parse throughput and event-loop lag by parsing processes")
+    parser.add_argument("--records", type=int, default=50000, help="synthetic records, over all files")
+    parser.add_argument("--files", type=int, default=4, help="synthetic files to split the records over")
+    parser.add_argument("--file", nargs="+", help="RIS exports to parse instead")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--piece-kb", type=int, default=1024, help="bytes per parsed piece, in KB")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,162 @@
+"""
+Benchmark: includes found per LLM call, in id order and in ranked order
+-----------------------------------------------------------------------
+
+Builds a synthetic corpus in which --prevalence of the studies are about
+one topic (a few words from a small topic vocabulary are planted in their
+abstracts; some other studies get one or two of them as noise), and fake
+agents that include a study when it mentions enough topic words. The same
+job is then screened three ways:
+
+- id order:  RELEVANCE_RANKING off, studies claimed in id order
+- ranked:    claimed by similarity to the includes found so far (utils/relevance.py)
+- stopping:  ranked, with the stopping rule at --stop-recall
+
+and the report shows how many LLM calls it took to find 50/90/95/100% of
+the includes, and for the stopping run, the recall it actually reached and
+the calls it saved.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ranking --studies 20000 --prevalence 0.02 --stop-recall 0.95
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import random
+import re
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+from agents import ScreeningAgent
+import job_queue
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from models import JobStatus, ScreeningCriteria
+from utils.relevance import RelevanceRanker
+from utils.risfileparsing import iter_ris_entries
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+from benchmarks.synthetic import generate_records
+
+TOPIC = [
+    "septic", "shock", "vasopressor", "norepinephrine", "vasopressin", "lactate", "sepsis", "resuscitation",
+    "hypotension", "corticosteroids", "hydrocortisone", "perfusion", "icu", "organ", "dysfunction", "bacteremia"
+]
+TOPIC_WORDS = set(TOPIC)
+INCLUDE_AT = 4  # distinct topic words a study needs to be included
+CRITERIA = ScreeningCriteria(
+    inclusion=["adults with septic shock", "vasopressor or corticosteroid treatment"],
+    exclusion=["animal model"]
+)
+_WORD = re.compile(r"[a-z]+")
+_STUDY_TEXT = re.compile(r"^Title: (.*?)^Keywords:", re.MULTILINE | re.DOTALL)  # title and abstract, not the criteria
+
+
+def topic_words(text: str) -> int:
+    return len(TOPIC_WORDS.intersection(_WORD.findall(text.lower())))
+
+
+class TopicChatClient(FakeChatClient):
+    """Includes the studies that mention at least INCLUDE_AT topic words"""
+
+    def _decision(self, text: str):
+        study = _STUDY_TEXT.search(text)
+        return ("include", 0.9) if study and topic_words(study.group(1)) >= INCLUDE_AT else ("exclude", 0.9)
+
+
+def build_corpus(args) -> bytes:
+    rng = random.Random(args.seed)
+    records = []
+    for record in generate_records(args.studies, duplicate_rate=0.0):
+        draw = rng.random()
+        if draw < args.prevalence:
+            planted = rng.sample(TOPIC, rng.randint(INCLUDE_AT, 8))
+        elif draw < args.prevalence + args.noise:
+            planted = rng.sample(TOPIC, rng.randint(1, INCLUDE_AT - 1))
+        else:
+            planted = []
+        if planted:
+            record = record.replace("\nN2  - ", "\nN2  - " + " ".join(planted) + " ", 1)
+        records.append(record)
+    return "".join(records).encode()
+
+
+async def run(entries, label: str, ranking: bool, stop_recall, args):
+    db = InMemoryDatabase()
+    await db.store_ris_entries("bench", entries)
+    truth = sum(1 for entry in entries if topic_words(entry["title"] + " " + entry["abstract"]) >= INCLUDE_AT)
+    clients = [TopicChatClient(0.001, seed=i) for i in range(3)]
+    queue = JobQueue(
+        db=db,
+        agent_factory=lambda criteria: [
+            ScreeningAgent(f"agent-{i}", criteria, client=client) for i, client in enumerate(clients)
+        ],
+        job_store=MemoryJobStore()
+    )
+    queue.relevance_ranking = ranking
+    queue.workers_per_job = args.workers_per_job
+    # The queue builds its rankers with the RELEVANCE_* settings: give it this run's instead
+    job_queue.RelevanceRanker = functools.partial(
+        RelevanceRanker, rerank_every=args.rerank_every, stop_recall=stop_recall,
+        stop_window=args.stop_window, stop_confidence=args.stop_confidence
+    )
+
+    # Which LLM answers were includes, in the order they were made
+    answers = []
+    for client in clients:
+        decide = client._decision
+
+        def _record(text, decide=decide):
+            decision = decide(text)
+            answers.append(decision[0] == "include")
+            return decision
+        client._decision = _record
+
+    job = await queue.add_job("bench", CRITERIA, len(entries))
+    await queue.process_job(job)
+    assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+
+    found, calls_to = 0, {}
+    for calls, include in enumerate(answers, start=1):
+        found += include
+        for target in (0.5, 0.9, 0.95, 1.0):
+            if target not in calls_to and found >= target * truth:
+                calls_to[target] = calls
+    reached = "  ".join(
+        f"{int(target * 100)}%: {calls_to[target] / len(entries):5.1%}" if target in calls_to else f"{int(target * 100)}%:   n/a"
+        for target in (0.5, 0.9, 0.95, 1.0)
+    )
+    line = f"{label:>9}  includes found after (share of corpus screened)  {reached}"
+    ranking_stats = job["ranking"]
+    if ranking_stats and ranking_stats["stopped_after"] is not None:
+        line += (
+            f"\n{'':>9}  stopped after {len(answers)} LLM calls ({len(answers) / len(entries):.1%} of the corpus),"
+            f" recall {found / truth:.1%} (estimated {ranking_stats['estimated_recall']:.1%}),"
+            f" {ranking_stats['not_screened']} studies not screened"
+        )
+    print(line)
+
+
+async def main(args):
+    entries = list(iter_ris_entries([build_corpus(args)]))
+    truth = sum(1 for entry in entries if topic_words(entry["title"] + " " + entry["abstract"]) >= INCLUDE_AT)
+    print(f"{len(entries)} studies, {truth} includes ({truth / len(entries):.1%})")
+    await run(entries, "id order", False, None, args)
+    await run(entries, "ranked", True, None, args)
+    await run(entries, "stopping", True, args.stop_recall, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Includes found per LLM call, unranked and ranked")
+    parser.add_argument("--studies", type=int, default=20000)
+    parser.add_argument("--prevalence", type=float, default=0.02, help="share of studies about the topic")
+    parser.add_argument("--noise", type=float, default=0.1, help="share of other studies with a few topic words")
+    parser.add_argument("--stop-recall", type=float, default=0.95)
+    parser.add_argument("--stop-window", type=int, default=500)
+    parser.add_argument("--stop-confidence", type=float, default=0.95)
+    parser.add_argument("--rerank-every", type=int, default=100)
+    parser.add_argument("--workers-per-job", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+"""
+Benchmark: small reviews screened next to a huge one
+----------------------------------------------------
+
+Submits one large job, then a few small ones shortly after, to a JobQueue
+whose worker slots (SCREENING_MAX_WORKERS) stand for the LLM concurrency
+the API keys allow. Runs the same workload twice:
+
+- serial: one job admitted at a time, the small jobs wait for the big one
+- fair:   --concurrent jobs admitted, worker slots shared fairly
+
+and reports how long the small jobs took from submission to completion,
+and the large job's duration.
+
+Usage (from backend/):
+    python -m benchmarks.bench_scheduler --large 3000 --small 5 --small-size 100 --slots 6
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+from agents import ScreeningAgent
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from models import JobStatus, ScreeningCriteria
+from utils.risfileparsing import iter_ris_entries
+from utils.scheduler import WorkerSlots
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+from benchmarks.synthetic import generate_records
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+
+
+def load_entries(count: int):
+    text = "".join(generate_records(count, duplicate_rate=0.0)).encode()
+    return list(iter_ris_entries([text]))
+
+
+async def wait_until_done(job) -> float:
+    while job["status"] not in (JobStatus.COMPLETED, JobStatus.FAILED):
+        await asyncio.sleep(0.02)
+    return time.perf_counter()
+
+
+async def run(mode: str, args):
+    db = InMemoryDatabase(latency=args.db_latency_ms / 1000)
+    await db.store_ris_entries("large", load_entries(args.large))
+    for n in range(args.small):
+        await db.store_ris_entries(f"small-{n}", load_entries(args.small_size))
+
+    def agent_factory(criteria):
+        return [ScreeningAgent(f"agent-{i}", criteria, client=FakeChatClient(args.llm_latency_ms / 1000, seed=i))
+                for i in range(3)]
+
+    queue = JobQueue(db=db, agent_factory=agent_factory, job_store=MemoryJobStore())
+    queue.workers_per_job = args.slots  # a lone job may use every slot
+    queue.worker_slots = WorkerSlots(args.slots)
+    queue.max_concurrent_jobs = 1 if mode == "serial" else args.concurrent
+
+    large = await queue.add_job("large", CRITERIA, args.large)
+    large_started = time.perf_counter()
+    queue.submit(large)
+    await asyncio.sleep(args.small_delay)
+
+    small_started = time.perf_counter()
+    small = []
+    for n in range(args.small):
+        job = await queue.add_job(f"small-{n}", CRITERIA, args.small_size)
+        queue.submit(job)
+        small.append(job)
+    small_finished = await asyncio.gather(*(wait_until_done(job) for job in small))
+    large_finished = await wait_until_done(large)
+
+    for job in [large, *small]:
+        assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+    small_seconds = sorted(finished - small_started for finished in small_finished)
+    print(
+        f"{mode:>7}  small jobs: median {small_seconds[len(small_seconds) // 2]:7.1f}s  slowest {small_seconds[-1]:7.1f}s"
+        f"   large job: {large_finished - large_started:7.1f}s"
+    )
+
+
+async def main(args):
+    for mode in ("serial", "fair"):
+        await run(mode, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Small jobs screened next to a large one")
+    parser.add_argument("--large", type=int, default=3000, help="studies in the large job")
+    parser.add_argument("--small", type=int, default=5, help="number of small jobs")
+    parser.add_argument("--small-size", type=int, default=100, help="studies per small job")
+    parser.add_argument("--small-delay", type=float, default=1.0, help="seconds between the large and the small jobs")
+    parser.add_argument("--slots", type=int, default=6, help="global worker slots (LLM concurrency)")
+    parser.add_argument("--concurrent", type=int, default=3, help="jobs admitted at once in fair mode")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    asyncio.run(main(parser.parse_args()))
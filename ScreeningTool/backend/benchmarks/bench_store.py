@@ -0,0 +1,108 @@
+"""
+Benchmark: storing parsed RIS entries
+-------------------------------------
+
+Compares the one-request-per-study insert path with the chunked, concurrent
+bulk path of Database.bulk_store_ris_entries and reports rows/sec for each.
+
+By default the database is a local PostgREST stand-in that mimics
+AsyncPostgrestClient.insert: every request costs a fixed round trip plus a
+small per-row cost, and can be made to fail at random to exercise the retry
+path. Pass --live to run against the Supabase/PostgREST instance configured
+by SUPABASE_URL and SUPABASE_KEY instead.
+
+Usage (from backend/):
+    python -m benchmarks.bench_store --rows 10000 --latency-ms 20
+    python -m benchmarks.bench_store --live --rows 2000
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import time
+import uuid
+from typing import Dict, List
+
+from database import Database, DatabaseError
+from utils.risfileparsing import iter_ris_entries
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "test-ris-file", "2.3 embase Novel (715).ris")
+
+
+class LocalPostgrest:
+    """In-process stand-in for the PostgREST `studies` endpoint"""
+
+    def __init__(self, latency: float, per_row: float, failure_rate: float = 0.0):
+        self.latency = latency
+        self.per_row = per_row
+        self.failure_rate = failure_rate
+        self.rows: List[Dict] = []
+        self.requests = 0
+
+    async def insert(self, table: str, rows: List[Dict], returning: str = "id") -> List[Dict]:
+        await asyncio.sleep(self.latency + self.per_row * len(rows))
+        self.requests += 1
+        if random.random() < self.failure_rate:
+            raise DatabaseError("503: simulated transient failure", 503)
+        self.rows.extend(rows)
+        return [{"id": len(self.rows) - len(rows) + i} for i in range(len(rows))]
+
+
+def load_entries(count: int) -> List[Dict]:
+    """Cycle the sample Embase export up to `count` entries"""
+    with open(SAMPLE_FILE, "rb") as f:
+        sample = list(iter_ris_entries(iter(lambda: f.read(64 * 1024), b"")))
+    return list(itertools.islice(itertools.cycle(sample), count))
+
+
+async def run_scenario(db: Database, entries: List[Dict], chunk_size: int, concurrency: int) -> Dict:
+    started = time.perf_counter()
+    result = await db.bulk_store_ris_entries(
+        f"bench-{uuid.uuid4()}", entries, chunk_size=chunk_size, max_concurrent_chunks=concurrency
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        "rows": len(entries),
+        "stored": result.stored_count,
+        "failed": len(result.failed_rows),
+        "chunks": result.chunk_count,
+        "retries": result.retry_count,
+        "seconds": elapsed,
+        "rows_per_sec": result.stored_count / elapsed if elapsed else 0.0,
+    }
+
+
+async def main(args):
+    db = Database()
+    db.insert_retry_delay = args.retry_delay
+    if not args.live:
+        db.client = LocalPostgrest(args.latency_ms / 1000, args.per_row_us / 1e6, args.failure_rate)
+
+    entries = load_entries(args.rows)
+    scenarios = [("per-row (previous behaviour)", 1, 1, entries[:args.baseline_rows])]
+    scenarios += [
+        (f"bulk chunk={chunk} in-flight={concurrency}", chunk, concurrency, entries)
+        for chunk, concurrency in ((100, 1), (500, 1), (500, 4), (1000, 8))
+    ]
+
+    print(f"{'scenario':<34}{'rows':>8}{'stored':>8}{'failed':>8}{'retries':>9}{'seconds':>10}{'rows/sec':>12}")
+    for name, chunk, concurrency, rows in scenarios:
+        stats = await run_scenario(db, rows, chunk, concurrency)
+        print(
+            f"{name:<34}{stats['rows']:>8}{stats['stored']:>8}{stats['failed']:>8}"
+            f"{stats['retries']:>9}{stats['seconds']:>10.2f}{stats['rows_per_sec']:>12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bulk study ingestion")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--baseline-rows", type=int, default=500, help="rows for the slow per-row scenario")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="stand-in round trip per request")
+    parser.add_argument("--per-row-us", type=float, default=50.0, help="stand-in cost per inserted row")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--retry-delay", type=float, default=0.05)
+    parser.add_argument("--live", action="store_true", help="use SUPABASE_URL/SUPABASE_KEY instead of the stand-in")
+    asyncio.run(main(parser.parse_args()))
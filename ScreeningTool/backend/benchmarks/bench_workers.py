@@ -0,0 +1,90 @@
+"""
+Benchmark: screening throughput against the number of worker processes
+----------------------------------------------------------------------
+
+Publishes one job through an in-process MemoryBroker and lets N
+ScreeningWorkers (each with its own agents, as separate processes would
+have) screen it against the in-memory PostgREST stand-in and fake LLM
+clients. The API side follows the job through JobQueue.dispatch, as it
+would with a real broker. Reports studies/sec for each worker count.
+
+Usage (from backend/):
+    python -m benchmarks.bench_workers --studies 2000 --workers 1 2 4 8
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+from agents import ScreeningAgent
+from broker import MemoryBroker
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from models import JobStatus, ScreeningCriteria
+from utils.risfileparsing import iter_ris_entries
+from worker import ScreeningWorker
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+from benchmarks.synthetic import generate_records
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+
+
+async def run(entries, worker_count: int, args) -> float:
+    db = InMemoryDatabase(latency=args.db_latency_ms / 1000)
+    await db.store_ris_entries("bench", entries)
+    broker = MemoryBroker()
+
+    def agent_factory(seed):
+        def build(criteria):
+            return [
+                ScreeningAgent(f"agent-{seed}-{i}", criteria, client=FakeChatClient(args.llm_latency_ms / 1000, seed=seed * 10 + i))
+                for i in range(args.agents)
+            ]
+        return build
+
+    workers = [
+        ScreeningWorker(broker, db=db, agent_factory=agent_factory(n), workers_per_job=args.workers_per_job,
+                        poll_interval=0.2, name=f"worker-{n}")
+        for n in range(worker_count)
+    ]
+    api = JobQueue(db=db, job_store=MemoryJobStore(), broker=broker)
+    api.progress_hub.min_interval = 0.05
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(worker.run(stop)) for worker in workers]
+
+    started = time.perf_counter()
+    job = await api.add_job("bench", CRITERIA, await db.count_studies("bench"))
+    await api.dispatch(job)
+    while job["status"] not in (JobStatus.COMPLETED, JobStatus.FAILED):
+        await asyncio.sleep(0.05)
+    seconds = time.perf_counter() - started
+
+    stop.set()
+    await asyncio.gather(*tasks)
+    assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+    return job["processed_studies"] / seconds
+
+
+async def main(args):
+    text = "".join(generate_records(args.studies, duplicate_rate=0.0)).encode()
+    entries = list(iter_ris_entries([text]))
+    baseline = None
+    for count in args.workers:
+        rate = await run(entries, count, args)
+        baseline = baseline or rate / count
+        print(f"{count:>3} workers  {rate:>10.1f} studies/s  ({rate / baseline / count:.0%} of linear)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screening throughput by worker count")
+    parser.add_argument("--studies", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--workers-per-job", type=int, default=3, help="claim loops per job in each worker")
+    parser.add_argument("--agents", type=int, default=3, help="agents (API keys) per worker")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--db-latency-ms", type=float, default=2.0)
+    asyncio.run(main(parser.parse_args()))
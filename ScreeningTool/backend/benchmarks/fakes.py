@@ -0,0 +1,319 @@
+"""
+Offline stand-ins for the benchmark suite
+-----------------------------------------
+
+InMemoryPostgrest replaces AsyncPostgrestClient under an unmodified
+Database: it keeps the `studies` table in memory and understands the
+PostgREST parameters Database actually sends (select with aliases and
+JSON paths, eq/gt/in/is filters, nested or/and trees, order, limit, HEAD
+counts) plus the lease RPCs from schema.sql. Every request can be given a
+fixed latency, and request latencies are recorded.
+
+FakeChatClient replaces the OpenAI client of a ScreeningAgent. It answers
+single and batched screening prompts with deterministic decisions after a
+configurable latency, and fails a configurable share of calls with a 429.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
+import heapq
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+
+from database import Database, DatabaseError
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Split on commas that are not inside parentheses"""
+    parts, depth, start = [], 0, 0
+    for position, char in enumerate(text):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(text[start:position])
+            start = position + 1
+    parts.append(text[start:])
+    return parts
+
+
+def _matches(row: Dict, column: str, expression: str) -> bool:
+    """Evaluate one PostgREST filter such as `eq.x`, `not.is.null` or `in.(a,b)`"""
+    if expression.startswith("not."):
+        return not _matches(row, column, expression[4:])
+    operator, _, value = expression.partition(".")
+    current = row.get(column)
+    if operator == "is":
+        return current is None if value == "null" else current == (value == "true")
+    if operator == "in":
+        return current is not None and str(current) in set(value.strip("()").split(","))
+    if current is None:
+        return False
+    if operator == "eq":
+        return str(current) == value
+    if operator == "neq":
+        return str(current) != value
+    if operator == "gt":
+        return str(current) > value
+    if operator == "lt":
+        return str(current) < value
+    raise ValueError(f"Unsupported filter operator: {operator}")
+
+
+def _compile_tree(tree: str) -> Callable[[Dict], bool]:
+    """Turn a logic tree condition (`and(...)`, `or(...)` or `column.operator.value`) into a predicate"""
+    for keyword, combine in (("and(", all), ("or(", any)):
+        if tree.startswith(keyword):
+            parts = [_compile_tree(part) for part in _split_top_level(tree[len(keyword):-1])]
+            return lambda row: combine(part(row) for part in parts)
+    column, _, expression = tree.partition(".")
+    return lambda row: _matches(row, column, expression)
+
+
+_ID_CONDITION = re.compile(r"(?<![\w])id\.(?:eq\.([^,()]+)|in\.\(([^)]*)\))")
+
+
+class InMemoryPostgrest:
+    """In-process stand-in for the PostgREST API used by Database"""
+
+    _RESERVED = {"select", "order", "limit", "offset"}
+    _PRIMARY_KEYS = {"criteria_versions": ("job_id", "version"), "screening_ingests": ("job_id",)}  # not keyed by `id`
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency  # seconds per request
+        self.tables: Dict[str, Dict[Any, Dict]] = {"studies": {}, "screening_jobs": {}, "criteria_versions": {}}
+        self.request_latencies: List[float] = []
+        self.requests = 0
+        self._lock = asyncio.Lock()
+        # Indexes, so a request does not scan every study of every job
+        self._by_job: Dict[Tuple[str, Any], Dict[Any, Dict]] = {}
+        self._duplicates: Dict[Any, List[Any]] = {}
+
+    async def _round_trip(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _candidates(self, table: str, params: Dict):
+        """Rows a request can match, narrowed by id, duplicate_of, job_id or an id-based `or` tree"""
+        stored = self.tables.setdefault(table, {})
+        ids = None
+        if str(params.get("id", "")).startswith(("eq.", "in.")):
+            ids = params["id"].partition(".")[2].strip("()").split(",")
+        elif str(params.get("duplicate_of", "")).startswith("eq."):
+            ids = self._duplicates.get(params["duplicate_of"][3:], [])
+        elif "or" in params and _ID_CONDITION.search(params["or"]):
+            ids = []
+            for single, listed in _ID_CONDITION.findall(params["or"]):
+                ids.extend([single] if single else listed.split(","))
+            ids += [duplicate for study_id in ids for duplicate in self._duplicates.get(study_id, [])]
+        if ids is not None:
+            return [stored[study_id] for study_id in dict.fromkeys(ids) if study_id in stored]
+        job_id = str(params.get("job_id", ""))
+        if job_id.startswith("eq."):
+            return self._by_job.get((table, job_id[3:]), {}).values()
+        return stored.values()
+
+    def _filter(self, table: str, params: Dict) -> List[Dict]:
+        rows = self._candidates(table, params)
+        conditions = []
+        for key, value in params.items():
+            if key in self._RESERVED:
+                continue
+            if key == "or":
+                conditions.append(_compile_tree(f"or{value}"))
+            else:
+                conditions.append(lambda row, column=key, expression=str(value): _matches(row, column, expression))
+        matched = [row for row in rows if all(condition(row) for condition in conditions)]
+        limit = int(params["limit"]) if params.get("limit") is not None else None
+        if params.get("order"):
+            column = params["order"].split(".")[0]
+            # Numbers (e.g. criteria versions) in numeric order, everything else (uuids, timestamps) as text
+            key = lambda row: row[column] if isinstance(row.get(column), int) else str(row.get(column))
+            return heapq.nsmallest(limit, matched, key=key) if limit is not None else sorted(matched, key=key)
+        return matched[:limit]
+
+    @staticmethod
+    def _project(row: Dict, select: Optional[str]) -> Dict:
+        if not select or select == "*":
+            return dict(row)
+        projected = {}
+        for column in select.split(","):
+            alias, _, source = column.rpartition(":")
+            path = source.split("->")
+            value = row.get(path[0])
+            for key in path[1:]:
+                value = value.get(key) if isinstance(value, dict) else None
+            projected[alias or path[-1]] = value
+        return projected
+
+    async def insert(self, table: str, rows: List[Dict], returning: str = "id", upsert: bool = False) -> List[Dict]:
+        started = time.perf_counter()
+        await self._round_trip()
+        stored = self.tables.setdefault(table, {})
+        columns = self._PRIMARY_KEYS.get(table)
+        key = (lambda row: tuple(row[column] for column in columns)) if columns else (lambda row: row["id"])
+        for row in rows:
+            if key(row) in stored and not upsert:
+                raise DatabaseError(f"409: duplicate key value {key(row)}", 409)
+        for row in rows:
+            merged = stored[key(row)] = {**stored.get(key(row), {}), **row}
+            if "job_id" in merged:
+                self._by_job.setdefault((table, str(merged["job_id"])), {})[key(row)] = merged
+            if merged.get("duplicate_of"):
+                self._duplicates.setdefault(str(merged["duplicate_of"]), []).append(row["id"])
+        self.request_latencies.append(time.perf_counter() - started)
+        return [self._project(row, returning) for row in rows]
+
+    async def select(self, table: str, params: Dict, timeout: Optional[float] = None) -> List[Dict]:
+        started = time.perf_counter()
+        await self._round_trip()
+        rows = [self._project(row, params.get("select")) for row in self._filter(table, params)]
+        self.request_latencies.append(time.perf_counter() - started)
+        return rows
+
+    async def count(self, table: str, params: Dict) -> int:
+        await self._round_trip()
+        return len(self._filter(table, params))
+
+    async def update(self, table: str, values: Dict, params: Dict) -> List[Dict]:
+        started = time.perf_counter()
+        await self._round_trip()
+        rows = self._filter(table, params)
+        for row in rows:
+            row.update(values)
+        self.request_latencies.append(time.perf_counter() - started)
+        return [dict(row) for row in rows]
+
+    async def rpc(self, function: str, params: Dict) -> Any:
+        started = time.perf_counter()
+        await self._round_trip()
+        if function == "claim_studies_batch":
+            result = await self._claim(params)
+        elif function == "extend_study_leases":
+            result = self._extend(params)
+        else:
+            raise DatabaseError(f"404: function {function} not found", 404)
+        self.request_latencies.append(time.perf_counter() - started)
+        return result
+
+    async def _claim(self, params: Dict) -> List[Dict]:
+        # The whole claim runs under one lock, like the row-locking SQL function
+        async with self._lock:
+            now = time.time()
+            filters = {"decision": "is.null", "duplicate_of": "is.null", "screening_error": "is.null"}
+            if params.get("job_id"):
+                filters["job_id"] = f"eq.{params['job_id']}"
+            order = lambda row: str(row["id"])
+            if params.get("study_ids") is not None:
+                positions = {str(study_id): position for position, study_id in enumerate(params["study_ids"])}
+                filters["id"] = f"in.({','.join(positions)})"
+                order = lambda row: positions[str(row["id"])]
+            claimable = [
+                row for row in self._filter("studies", filters)
+                if row.get("claimed_by") is None or (row.get("lease_expires_at") or 0) < now
+            ]
+            claimed = heapq.nsmallest(params.get("batch_size", 10), claimable, key=order)
+            result = []
+            for row in claimed:
+                result.append({
+                    key: row.get(key)
+                    for key in ("id", "title", "abstract", "keywords", "screening_text", "screening_tokens")
+                })
+                result[-1]["reclaimed"] = row.get("claimed_by") is not None
+                row["claimed_by"] = params.get("worker_id") or "anonymous"
+                row["claimed_at"] = now
+                row["lease_expires_at"] = now + params.get("lease_seconds", 300)
+        return result
+
+    def _extend(self, params: Dict) -> List[Dict]:
+        stored = self.tables["studies"]
+        held = []
+        for study_id in params["study_ids"]:
+            row = stored.get(study_id)
+            if row and row.get("claimed_by") == params["worker_id"] and row.get("decision") is None:
+                row["lease_expires_at"] = time.time() + params.get("lease_seconds", 300)
+                held.append({"id": study_id})
+        return held
+
+    async def aclose(self):
+        pass
+
+
+class InMemoryDatabase(Database):
+    """The real Database class on top of InMemoryPostgrest"""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.client = InMemoryPostgrest(latency)
+
+    async def connect(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def health_check(self) -> Dict:
+        return {"status": "healthy", "latency_ms": 0.0, "http2": False, "pool_size": 0, "error": None}
+
+
+class FakeRateLimitError(Exception):
+    """Mimics the API's 429 response"""
+    status_code = 429
+
+
+_STUDY_NUMBER = re.compile(r"^Study (\d+)$", re.MULTILINE)
+
+
+class FakeChatClient:
+    """Answers screening prompts like the chat completions API, without the network"""
+
+    def __init__(
+        self, latency: float = 0.05, jitter: float = 0.5, rate_limit_rate: float = 0.0, seed: int = 1, salt: str = ""
+    ):
+        self.latency = latency  # mean seconds per call
+        self.jitter = jitter  # lognormal sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.salt = salt  # clients with different salts answer the same study differently (e.g. cascade tiers)
+        self.random = random.Random(seed)
+        self.call_latencies: List[float] = []
+        self.rate_limited = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _decision(self, text: str) -> Tuple[str, float]:
+        digest = hashlib.sha256((self.salt + text).encode("utf-8")).digest()
+        return ("include", "exclude", "exclude", "maybe")[digest[0] % 4], round(0.5 + digest[1] / 510, 2)
+
+    def _answer(self, prompt: str) -> str:
+        numbers = _STUDY_NUMBER.findall(prompt)
+        if not numbers:
+            decision, confidence = self._decision(prompt)
+            return json.dumps({"decision": decision, "confidence": confidence, "rationale": "Synthetic decision."})
+        studies = re.split(r"^Study \d+$", prompt, flags=re.MULTILINE)[1:]
+        results = []
+        for number, text in zip(numbers, studies):
+            decision, confidence = self._decision(text)
+            results.append({"id": int(number), "decision": decision, "confidence": confidence, "rationale": "Synthetic decision."})
+        return json.dumps({"results": results})
+
+    async def create(self, model: str, messages: List[Dict], **kwargs):
+        started = time.perf_counter()
+        delay = self.latency * self.random.lognormvariate(0, self.jitter) / (2.718281828 ** (self.jitter ** 2 / 2))
+        await asyncio.sleep(delay)
+        if self.random.random() < self.rate_limit_rate:
+            self.rate_limited += 1
+            raise FakeRateLimitError("429: Rate limit reached for requests")
+
+        prompt = messages[-1]["content"]
+        content = self._answer(prompt)
+        self.call_latencies.append(time.perf_counter() - started)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(message["content"]) for message in messages) // 4,
+            completion_tokens=len(content) // 4
+        )
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
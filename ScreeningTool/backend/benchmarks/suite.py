@@ -0,0 +1,259 @@
+"""
+Benchmark suite: parse -> store -> screen -> export, fully offline
+------------------------------------------------------------------
+
+Runs the real pipeline code against the stand-ins in benchmarks/fakes.py
+and a synthetic corpus from benchmarks/synthetic.py, and reports, per stage:
+throughput, latency percentiles (p50/p90/p99/max, in ms) and peak RSS.
+
+    parse   per record, through iter_ris_entries (the loop parse_ris_file runs)
+    store   Database.store_ris_entries into InMemoryPostgrest; latency per insert request
+    screen  JobQueue.process_job with FakeChatClient agents; latency per LLM call
+    export  the RIS and JSON Lines exporters over every stored study; latency per chunk
+
+Results are written as JSON (with the git commit) so runs can be compared
+across commits.
+
+Usage (from backend/):
+    python -m benchmarks.suite --records 10000
+    python -m benchmarks.suite --records 1000000 --screen-records 5000 --output /tmp/1m.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+# The suite must never touch the developer's caches or job store
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("JOB_STORE", "memory")
+
+from agents import ScreeningAgent
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from utils.risfileparsing import iter_bytes, iter_ris_entries
+from utils.resultexport import export_results
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+from benchmarks.synthetic import write_corpus
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class PeakRSS:
+    """Sample the resident set size in a thread while a stage runs"""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+    def _rss(self) -> int:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_size
+        except OSError:  # Not Linux: fall back to the process-wide maximum
+            scale = 1 if sys.platform == "darwin" else 1024
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self._rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._rss())
+
+
+def percentiles(samples: List[float]) -> Dict:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(fraction):
+        return round(ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] * 1000, 3)
+
+    return {"count": len(ordered), "p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99), "max_ms": at(1.0)}
+
+
+def stage_result(items: int, unit: str, seconds: float, latencies: List[float], rss: PeakRSS, **extra) -> Dict:
+    return {
+        "items": items,
+        "unit": unit,
+        "seconds": round(seconds, 3),
+        "throughput_per_sec": round(items / seconds, 1) if seconds else None,
+        "latency": percentiles(latencies),
+        "peak_rss_mb": round(rss.peak / 1e6, 1),
+        **extra
+    }
+
+
+def bench_parse(content: bytes) -> (Dict, List[Dict]):
+    errors: List[Dict] = []
+    entries, latencies = [], []
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        last = started
+        for entry in iter_ris_entries(iter_bytes(content), errors):
+            now = time.perf_counter()
+            latencies.append(now - last)
+            last = now
+            entries.append(entry)
+        seconds = time.perf_counter() - started
+    return stage_result(len(entries), "records", seconds, latencies, rss, bytes=len(content), errors=len(errors)), entries
+
+
+async def bench_store(db: InMemoryDatabase, job_id: str, entries: List[Dict]) -> Dict:
+    db.client.request_latencies.clear()
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        stored = await db.store_ris_entries(job_id, entries)
+        seconds = time.perf_counter() - started
+    return stage_result(stored, "rows", seconds, db.client.request_latencies, rss, requests=db.client.requests)
+
+
+async def bench_screen(db: InMemoryDatabase, entries: List[Dict], args) -> Dict:
+    job_id = "bench-screen"
+    await db.store_ris_entries(job_id, entries[:args.screen_records])
+    clients = [
+        FakeChatClient(args.llm_latency_ms / 1000, rate_limit_rate=args.rate_limit_rate, seed=i + 1)
+        for i in range(args.agents)
+    ]
+
+    def agent_factory(criteria):
+        return [ScreeningAgent(f"bench-agent-{i + 1}", criteria, client=client) for i, client in enumerate(clients)]
+
+    queue = JobQueue(db=db, agent_factory=agent_factory, job_store=MemoryJobStore())
+    queue.retry_delay = 0.1
+    if args.workers:
+        queue.workers_per_job = args.workers
+    criteria = {"inclusion": ["adult patients", "randomized controlled trial"], "exclusion": ["animal model"]}
+    from models import ScreeningCriteria
+    job = await queue.add_job(job_id, ScreeningCriteria(**criteria), await db.count_studies(job_id))
+
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        await queue.process_job(job)
+        seconds = time.perf_counter() - started
+    status = await queue.get_job_status(job_id)
+    latencies = [latency for client in clients for latency in client.call_latencies]
+    return stage_result(
+        status["processed_studies"], "studies", seconds, latencies, rss,
+        status=status["status"].value,
+        total_studies=status["total_studies"],
+        rate_limited_calls=sum(client.rate_limited for client in clients),
+        workers=queue.workers_per_job,
+        throughput=status["throughput"]
+    )
+
+
+async def bench_export(db: InMemoryDatabase, job_id: str, format: str) -> Dict:
+    # Give every stored study a decision directly, so the whole corpus is exported
+    for index, row in enumerate(db.client.tables["studies"].values()):
+        if row["job_id"] == job_id and row.get("decision") is None:
+            row["decision"] = ("include", "exclude", "maybe")[index % 3]
+            row["decision_rationale"] = "Synthetic decision."
+
+    latencies: List[float] = []
+    size = 0
+    first_byte = None
+    with PeakRSS() as rss:
+        started = time.perf_counter()
+        last = started
+        async for chunk in export_results(db, job_id, format):
+            now = time.perf_counter()
+            if first_byte is None:
+                first_byte = now - started
+            latencies.append(now - last)
+            last = now
+            size += len(chunk)
+        seconds = time.perf_counter() - started
+    rows = await db.count_studies(job_id)
+    return stage_result(
+        rows, "studies", seconds, latencies, rss,
+        bytes=size, first_byte_ms=round((first_byte or 0) * 1000, 3)
+    )
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+async def main(args):
+    commit = git_commit()
+    corpus = args.corpus
+    if not corpus:
+        corpus = os.path.join(tempfile.gettempdir(), f"bench-corpus-{args.records}-{args.seed}.ris")
+        if not os.path.exists(corpus):
+            started = time.perf_counter()
+            write_corpus(corpus, args.records, args.duplicate_rate, args.seed)
+            print(f"generated {corpus} in {time.perf_counter() - started:.1f}s")
+    with open(corpus, "rb") as f:
+        content = f.read()
+
+    stages = {}
+    stages["parse"], entries = bench_parse(content)
+    del content
+    print(f"parse   {stages['parse']['throughput_per_sec']:>12} records/s")
+
+    db = InMemoryDatabase(latency=args.db_latency_ms / 1000)
+    stages["store"] = await bench_store(db, "bench-store", entries)
+    print(f"store   {stages['store']['throughput_per_sec']:>12} rows/s")
+
+    stages["screen"] = await bench_screen(db, entries, args)
+    print(f"screen  {stages['screen']['throughput_per_sec']:>12} studies/s")
+
+    del entries
+    for format in ("ris", "json"):
+        stages[f"export_{format}"] = await bench_export(db, "bench-store", format)
+        print(f"export  {stages[f'export_{format}']['throughput_per_sec']:>12} studies/s ({format})")
+
+    report = {
+        "commit": commit,
+        "created_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "stages": stages
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit}-{args.records}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark of the screening pipeline")
+    parser.add_argument("--records", type=int, default=10000, help="synthetic corpus size")
+    parser.add_argument("--duplicate-rate", type=float, default=0.08)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--corpus", help="use an existing RIS file instead of a synthetic one")
+    parser.add_argument("--db-latency-ms", type=float, default=2.0, help="stand-in round trip per database request")
+    parser.add_argument("--screen-records", type=int, default=2000, help="studies screened in the screen stage")
+    parser.add_argument("--llm-latency-ms", type=float, default=20.0, help="mean fake LLM latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of LLM calls answered with 429")
+    parser.add_argument("--agents", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=0, help="workers per job (default: SCREENING_WORKERS_PER_JOB)")
+    parser.add_argument("--output", help=f"results file (default: {RESULTS_DIR}/<commit>-<records>.json)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,163 @@
+"""
+Synthetic RIS corpora
+---------------------
+
+Generates RIS files of any size (1k to 1M+ records) that look like the
+exports in test-ris-file/. A profile is taken from those files once:
+
+- the joint distribution of title length, abstract length, keyword count
+  and author count (records are drawn from it, so lengths stay realistic)
+- the word frequencies of titles and abstracts, and the keyword, journal
+  and year values
+
+Records are written in the Embase tag layout (T1, A1, N2, KW, ...). A share
+of them (duplicate_rate) repeat an earlier record, the way merged database
+exports do: half are exact repeats with the same DOI, a quarter repeat the
+text without a DOI, and a quarter are near-duplicates (different title
+case, a few abstract words dropped, no DOI).
+
+Generation is seeded, so the same arguments always give the same file.
+
+Usage (from backend/):
+    python -m benchmarks.synthetic --records 100000 --output /tmp/corpus.ris
+"""
+
+from typing import Dict, Iterator, List, Optional
+import argparse
+import collections
+import glob
+import os
+import random
+import numpy as np
+
+from utils.risfileparsing import iter_ris_entries
+
+SAMPLE_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "test-ris-file")
+
+
+class CorpusProfile:
+    def __init__(self, shapes, words, word_counts, keywords, journals, years):
+        self.shapes = shapes  # (title words, abstract words, keywords, authors) per sample record
+        self.words = words
+        self.cumulative = np.cumsum(np.asarray(word_counts, dtype=np.float64))
+        self.cumulative /= self.cumulative[-1]
+        self.keywords = keywords
+        self.journals = journals
+        self.years = years
+
+    @classmethod
+    def from_files(cls, paths: Optional[List[str]] = None) -> "CorpusProfile":
+        """Measure the sample exports (test-ris-file/*.ris by default)"""
+        paths = paths or sorted(glob.glob(os.path.join(SAMPLE_DIR, "*.ris")))
+        shapes, keywords, journals, years = [], [], [], []
+        word_counts = collections.Counter()
+        for path in paths:
+            with open(path, "rb") as f:
+                for entry in iter_ris_entries(iter(lambda: f.read(64 * 1024), b"")):
+                    metadata = entry["metadata"]
+                    title_words = entry["title"].split()
+                    abstract_words = entry["abstract"].split()
+                    authors = metadata.get("authors") or metadata.get("first_authors") or []
+                    shapes.append((len(title_words), len(abstract_words), len(entry["keywords"]), len(authors)))
+                    word_counts.update(word.strip(".,;:()[]").lower() for word in title_words + abstract_words)
+                    keywords.extend(entry["keywords"])
+                    journal = metadata.get("journal_name") or metadata.get("secondary_title")
+                    if journal:
+                        journals.append(journal)
+                    year = metadata.get("publication_year") or metadata.get("year")
+                    if year:
+                        years.append(str(year)[:4])
+        word_counts.pop("", None)
+        words, counts = zip(*word_counts.most_common())
+        return cls(shapes, list(words), counts, keywords or ["screening"], journals or ["Journal"], years or ["2024"])
+
+    def sample_words(self, rng: np.random.Generator, count: int) -> List[str]:
+        indices = np.searchsorted(self.cumulative, rng.random(count), side="right")
+        return [self.words[min(i, len(self.words) - 1)] for i in indices.tolist()]
+
+
+def _sentence_case(words: List[str]) -> str:
+    text = " ".join(words)
+    return text[:1].upper() + text[1:]
+
+
+def _format_record(record: Dict) -> str:
+    lines = ["TY  - JOUR", f"T1  - {record['title']}"]
+    lines += [f"A1  - {author}" for author in record["authors"]]
+    lines += [f"Y1  - {record['year']}", f"JF  - {record['journal']}"]
+    lines += [f"KW  - {keyword}" for keyword in record["keywords"]]
+    if record["doi"]:
+        lines.append(f"DO  - {record['doi']}")
+    lines += [f"N2  - {record['abstract']}", "ER  - ", ""]
+    return "\n".join(lines) + "\n"
+
+
+def _near_duplicate(record: Dict, rng: random.Random) -> Dict:
+    words = record["abstract"].split()
+    kept = [word for word in words if rng.random() > 0.03] or words
+    return {**record, "title": record["title"].upper(), "abstract": " ".join(kept), "doi": None}
+
+
+def generate_records(
+    count: int,
+    profile: Optional[CorpusProfile] = None,
+    duplicate_rate: float = 0.08,
+    seed: int = 1
+) -> Iterator[str]:
+    """Yield `count` RIS records as text"""
+    profile = profile or CorpusProfile.from_files()
+    rng = np.random.default_rng(seed)
+    choice = random.Random(seed)
+    recent: collections.deque = collections.deque(maxlen=1000)
+
+    for index in range(count):
+        if recent and choice.random() < duplicate_rate:
+            original = choice.choice(recent)
+            variant = choice.random()
+            if variant < 0.5:
+                record = original
+            elif variant < 0.75:
+                record = {**original, "doi": None}
+            else:
+                record = _near_duplicate(original, choice)
+            yield _format_record(record)
+            continue
+
+        title_words, abstract_words, keyword_count, author_count = choice.choice(profile.shapes)
+        words = profile.sample_words(rng, max(title_words, 3) + abstract_words)
+        record = {
+            "title": _sentence_case(words[:max(title_words, 3)]),
+            "abstract": _sentence_case(words[max(title_words, 3):]) + ("." if abstract_words else ""),
+            "authors": [f"Author{choice.randrange(100000)} A." for _ in range(author_count)],
+            "year": choice.choice(profile.years),
+            "journal": choice.choice(profile.journals),
+            "keywords": choice.sample(profile.keywords, min(keyword_count, len(profile.keywords))),
+            "doi": f"10.5555/synthetic.{seed}.{index}"
+        }
+        recent.append(record)
+        yield _format_record(record)
+
+
+def write_corpus(path: str, count: int, duplicate_rate: float = 0.08, seed: int = 1) -> int:
+    """Write a synthetic RIS file and return its size in bytes"""
+    profile = CorpusProfile.from_files()
+    with open(path, "w", encoding="utf-8") as f:
+        buffer = []
+        for record in generate_records(count, profile, duplicate_rate, seed):
+            buffer.append(record)
+            if len(buffer) >= 1000:
+                f.write("".join(buffer))
+                buffer = []
+        f.write("".join(buffer))
+    return os.path.getsize(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic RIS corpus")
+    parser.add_argument("--records", type=int, default=10000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.08)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+    size = write_corpus(args.output, args.records, args.duplicate_rate, args.seed)
+    print(f"wrote {args.records} records ({size / 1e6:.1f} MB) to {args.output}")
@@ -0,0 +1,227 @@
+"""
+Job broker between the API and the screening workers
+----------------------------------------------------
+
+With a broker configured (SCREENING_BROKER), the API no longer screens:
+/api/screen only publishes the job, and every worker process (worker.py,
+on any number of machines) picks it up. Workers never split a job between
+them up front. They all run claim loops on every active job, and the
+database hands each study to exactly one of them, so adding workers adds
+throughput until the LLM quota is reached.
+
+The broker holds:
+- the active jobs (job id -> criteria and study count), read by workers
+- each job's shared progress: status, per-decision and cache-hit counters
+  that every worker increments, the number of claim loops currently on
+  the job, the prefilter summary and the last error
+- short locks, so one-off steps (the lexical prefilter) run on one worker
+
+SCREENING_BROKER selects the implementation:
+- unset:      no broker, jobs run inside the API process
+- memory:     MemoryBroker, one process only (tests and local development)
+- redis://…:  RedisBroker
+"""
+
+from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import time
+from job_store import MemoryJobStore
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # Only needed for the Redis broker
+    aioredis = None
+
+COUNTERS = ("processed_studies", "include", "exclude", "maybe", "cache_hits", "dead_letters", "claim_loops")
+
+
+class MemoryBroker:
+    """In-process broker: the API and the workers must share one event loop"""
+
+    def __init__(self):
+        self._active: Dict[str, Dict] = {}
+        self._status: Dict[str, Dict] = {}
+        self._locks: Dict[str, float] = {}
+        self._changed = asyncio.Event()
+
+    async def enqueue(self, spec: Dict) -> None:
+        """Publish a job for the workers"""
+        self._status[spec["job_id"]] = {"status": "pending", **{counter: 0 for counter in COUNTERS}}
+        self._active[spec["job_id"]] = spec
+        self._changed.set()
+
+    async def active_jobs(self) -> List[Dict]:
+        return list(self._active.values())
+
+    async def wait_for_jobs(self, timeout: float) -> None:
+        """Return when a job is published, or after `timeout` seconds"""
+        self._changed.clear()
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def increment(self, job_id: str, counts: Dict[str, int]) -> None:
+        status = self._status.setdefault(job_id, {counter: 0 for counter in COUNTERS})
+        for counter, amount in counts.items():
+            status[counter] = status.get(counter, 0) + amount
+
+    async def set_fields(self, job_id: str, values: Dict) -> None:
+        self._status.setdefault(job_id, {counter: 0 for counter in COUNTERS}).update(values)
+
+    async def mark_started(self, job_id: str) -> None:
+        """Record when the first worker started on the job"""
+        self._status.setdefault(job_id, {counter: 0 for counter in COUNTERS}).setdefault("started_at", time.time())
+
+    async def get_status(self, job_id: str) -> Optional[Dict]:
+        status = self._status.get(job_id)
+        return dict(status) if status is not None else None
+
+    async def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        """Retire the job: workers stop picking it up"""
+        self._active.pop(job_id, None)
+        await self.set_fields(job_id, {"status": status, **({"last_error": error} if error else {})})
+
+    async def acquire(self, key: str, ttl: float) -> bool:
+        """Take a lock for `ttl` seconds unless someone else holds it"""
+        now = time.monotonic()
+        if self._locks.get(key, 0) > now:
+            return False
+        self._locks[key] = now + ttl
+        return True
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBroker:
+    """
+    Broker in Redis, shared by the API and any number of worker processes:
+    - screening:active          hash   job id -> job spec (JSON)
+    - screening:job:{job_id}    hash   status, counters (HINCRBY), started_at, prefilter, last_error
+    - screening:lock:{key}      string SET NX PX
+    - screening:jobs            channel, a message per published job so idle workers wake up at once
+    """
+
+    def __init__(self, url: str, prefix: str = "screening"):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for the Redis broker")
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._pubsub = None
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    async def enqueue(self, spec: Dict) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._key("job", spec["job_id"]))
+            pipe.hset(self._key("job", spec["job_id"]), mapping={"status": "pending", **{c: 0 for c in COUNTERS}})
+            pipe.hset(self._key("active"), spec["job_id"], json.dumps(spec))
+            pipe.publish(self._key("jobs"), spec["job_id"])
+            await pipe.execute()
+
+    async def active_jobs(self) -> List[Dict]:
+        return [json.loads(spec) for spec in (await self.redis.hgetall(self._key("active"))).values()]
+
+    async def wait_for_jobs(self, timeout: float) -> None:
+        if self._pubsub is None:
+            self._pubsub = self.redis.pubsub()
+            await self._pubsub.subscribe(self._key("jobs"))
+        await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+
+    async def increment(self, job_id: str, counts: Dict[str, int]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for counter, amount in counts.items():
+                pipe.hincrby(self._key("job", job_id), counter, amount)
+            await pipe.execute()
+
+    async def set_fields(self, job_id: str, values: Dict) -> None:
+        mapping = {key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                   for key, value in values.items() if value is not None}
+        if mapping:
+            await self.redis.hset(self._key("job", job_id), mapping=mapping)
+
+    async def mark_started(self, job_id: str) -> None:
+        await self.redis.hsetnx(self._key("job", job_id), "started_at", time.time())
+
+    async def get_status(self, job_id: str) -> Optional[Dict]:
+        status = await self.redis.hgetall(self._key("job", job_id))
+        if not status:
+            return None
+        for counter in COUNTERS:
+            status[counter] = int(status.get(counter, 0))
+        if status.get("prefilter"):
+            status["prefilter"] = json.loads(status["prefilter"])
+        return status
+
+    async def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(self._key("active"), job_id)
+            pipe.hset(self._key("job", job_id), mapping={"status": status, **({"last_error": error} if error else {})})
+            await pipe.execute()
+
+    async def acquire(self, key: str, ttl: float) -> bool:
+        return bool(await self.redis.set(self._key("lock", key), "1", nx=True, px=int(ttl * 1000)))
+
+    async def close(self) -> None:
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+        await self.redis.aclose()
+
+
+class BrokerJobStore(MemoryJobStore):
+    """A worker's job store: adds its decisions and cache hits to the job's shared counters"""
+
+    def __init__(self, broker):
+        self.broker = broker
+        self._synced_cache_hits: Dict[str, int] = {}
+
+    def _cache_hits_delta(self, job: Dict) -> int:
+        delta = job["cache_hits"] - self._synced_cache_hits.get(job["id"], 0)
+        self._synced_cache_hits[job["id"]] = job["cache_hits"]
+        return delta
+
+    async def save_job(self, job: Dict) -> None:
+        values = {"prefilter": job["prefilter"]} if job["prefilter"] else {}
+        if job["last_error"]:
+            values["last_error"] = job["last_error"]
+        if values:
+            await self.broker.set_fields(job["id"], values)
+        delta = self._cache_hits_delta(job)
+        if delta:
+            await self.broker.increment(job["id"], {"cache_hits": delta})
+
+    async def record_results(self, job: Dict, study_ids: List[str], decision: str) -> None:
+        counts = {"processed_studies": len(study_ids), decision: len(study_ids)}
+        delta = self._cache_hits_delta(job)
+        if delta:
+            counts["cache_hits"] = delta
+        await self.broker.increment(job["id"], counts)
+
+    async def record_dead_letters(self, job: Dict, count: int) -> None:
+        await self.broker.increment(job["id"], {"dead_letters": count})
+
+    def forget(self, job_id: str) -> None:
+        """The job's dict is being replaced (or dropped): its counters start again from zero"""
+        self._synced_cache_hits.pop(job_id, None)
+
+
+_memory_broker: Optional[MemoryBroker] = None
+
+
+def create_broker(url: Optional[str] = None):
+    """The broker selected by SCREENING_BROKER, or None to screen inside the API process"""
+    global _memory_broker
+    url = url if url is not None else os.getenv("SCREENING_BROKER", "")
+    if not url:
+        return None
+    if url == "memory":
+        # One per process, so an in-process worker sees the API's jobs
+        _memory_broker = _memory_broker or MemoryBroker()
+        return _memory_broker
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBroker(url)
+    raise ValueError(f"Unsupported SCREENING_BROKER: {url}")
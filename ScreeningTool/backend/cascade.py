@@ -0,0 +1,219 @@
+"""
+Confidence-gated screening cascade
+----------------------------------
+
+In cascade mode (SCREENING_CASCADE=true) a study is not screened by one
+agent picked round-robin, but by a chain of tiers (CASCADE_MODELS, one
+model per tier, e.g. "gpt-4o-mini,gpt-4o"):
+
+1. The first tier screens every study
+2. The next tier is consulted only for the answers that are "maybe" or
+   less confident than CASCADE_CONFIDENCE_THRESHOLD, and so on down the chain
+3. Disagreements are resolved by this rule:
+   - the first confident, definite answer (include or exclude, at or above
+     the threshold) is final, even when it overrules an earlier tier
+   - when no tier gets there, the decision stands only if every consulted
+     tier agreed on the same include or exclude; otherwise the study is
+     marked "maybe", for a human to look at
+
+Every tier must run a different model, and there must be at least two:
+the requests are deterministic (temperature 0, the same prompt), so a
+tier on the same model would only repeat the answer it escalates, and a
+single tier could only turn its doubtful answers into "maybe". The API
+and the workers refuse to start on such a configuration.
+
+A tier holds one agent per API key and spreads its requests over them.
+A study the first tier cannot screen fails as usual (it is dead-lettered).
+If a later tier fails, the study is settled on the answers it already has.
+
+ScreeningCascade has the agent interface (screen, screen_batch, model),
+so JobQueue uses it in place of an agent. Its stats say how many studies
+each tier resolved, and how the first tier's confidence was spread, to
+help tune the threshold against cost.
+"""
+
+from typing import Dict, List, Optional, Union
+import itertools
+import os
+from models import DecisionType, ScreeningCriteria, ScreeningResult
+from agents import DEFAULT_MODEL, CriteriaPrompt, ScreeningAgent, StudyScreeningError, get_agent_api_keys
+from utils.metrics import CASCADE_RESOLUTIONS
+
+SCREENING_CASCADE = os.getenv("SCREENING_CASCADE", "false").lower() == "true"
+CASCADE_CONFIDENCE_THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE_THRESHOLD", 0.8))
+# e.g. "gpt-4o-mini,gpt-4o" to send the doubtful studies to a larger model
+CASCADE_MODELS = [model.strip() for model in os.getenv("CASCADE_MODELS", "").split(",") if model.strip()]
+
+
+def check_cascade_models(models: List[str]) -> List[str]:
+    """The tiers' models, if escalating a study can get it a different answer (else ValueError)"""
+    if len(models) < 2:
+        raise ValueError(
+            f"SCREENING_CASCADE needs at least two models in CASCADE_MODELS (e.g. {DEFAULT_MODEL},gpt-4o), "
+            f"got {models or 'none'}"
+        )
+    if len(set(models)) < len(models):
+        raise ValueError(f"CASCADE_MODELS lists a model twice: its second tier would repeat the first's answers ({models})")
+    return models
+
+
+class ScreeningCascade:
+    def __init__(self, tiers: List[List[ScreeningAgent]], threshold: float = CASCADE_CONFIDENCE_THRESHOLD):
+        if len(tiers) < 2:
+            raise ValueError("A screening cascade needs at least two tiers")
+        self.tiers = tiers
+        self.threshold = threshold
+        self.name = "cascade"
+        self.model = "cascade:" + ">".join(tier[0].model for tier in tiers) + f"@{threshold}"
+        self._next_agent = [itertools.cycle(tier) for tier in tiers]
+        self.stats = {
+            "threshold": threshold,
+            "tiers": [{"model": tier[0].model, "screened": 0, "resolved": 0} for tier in tiers],
+            "escalated": 0,  # Studies the first tier did not settle
+            "overruled": 0,  # Final decision differs from the first tier's answer
+            "unresolved": 0,  # No confident answer and no agreement: marked maybe
+            # First-tier answers per confidence decile (0.0-0.1, ..., 0.9-1.0): how many studies
+            # each threshold would send down the cascade
+            "first_tier_confidence": [0] * 10
+        }
+
+    def resume_stats(self, stats: Optional[Dict]):
+        """Carry on from the counters of an earlier attempt with the same tiers (a retry, or a restart)"""
+        if not stats or stats.get("threshold") != self.threshold:
+            return
+        if [tier["model"] for tier in stats["tiers"]] != [tier["model"] for tier in self.stats["tiers"]]:
+            return
+        for tier, previous in zip(self.stats["tiers"], stats["tiers"]):
+            tier["screened"] += previous["screened"]
+            tier["resolved"] += previous["resolved"]
+        for key in ("escalated", "overruled", "unresolved"):
+            self.stats[key] += stats[key]
+        self.stats["first_tier_confidence"] = [
+            count + previous for count, previous in zip(self.stats["first_tier_confidence"], stats["first_tier_confidence"])
+        ]
+
+    @property
+    def agents(self) -> List[ScreeningAgent]:
+        return [agent for tier in self.tiers for agent in tier]
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        usage: Dict[str, int] = {}
+        for agent in self.agents:
+            for key, value in agent.usage.items():
+                usage[key] = usage.get(key, 0) + value
+        return usage
+
+    def _confident(self, result: ScreeningResult) -> bool:
+        return result.decision != DecisionType.MAYBE and result.confidence >= self.threshold
+
+    async def _ask(self, tier: int, studies: List[Dict], batch: bool) -> Dict[str, Union[ScreeningResult, StudyScreeningError]]:
+        agent = next(self._next_agent[tier])
+        if batch:
+            return await agent.screen_batch(studies)
+        replies = {}
+        for study in studies:
+            try:
+                replies[study["id"]] = await agent.screen(study)
+            except StudyScreeningError as error:
+                replies[study["id"]] = error
+        return replies
+
+    async def _screen(self, studies: List[Dict], batch: bool) -> Dict[str, Union[ScreeningResult, StudyScreeningError]]:
+        answers: Dict[str, List[ScreeningResult]] = {study["id"]: [] for study in studies}
+        final: Dict[str, Union[ScreeningResult, StudyScreeningError]] = {}
+        pending = studies
+        for tier in range(len(self.tiers)):
+            if not pending:
+                break
+            if tier == 1:
+                self.stats["escalated"] += len(pending)
+            replies = await self._ask(tier, pending, batch)
+            still_pending = []
+            for study in pending:
+                reply = replies[study["id"]]
+                if isinstance(reply, StudyScreeningError):
+                    final[study["id"]] = reply if tier == 0 else self._settle(answers[study["id"]])
+                    continue
+                self.stats["tiers"][tier]["screened"] += 1
+                if tier == 0:
+                    self.stats["first_tier_confidence"][min(int(reply.confidence * 10), 9)] += 1
+                answers[study["id"]].append(reply)
+                if self._confident(reply):
+                    final[study["id"]] = self._accept(tier, answers[study["id"]])
+                else:
+                    still_pending.append(study)
+            pending = still_pending
+        for study in pending:
+            final[study["id"]] = self._settle(answers[study["id"]])
+        return final
+
+    def _accept(self, tier: int, answers: List[ScreeningResult]) -> ScreeningResult:
+        """A confident answer from `tier` (the last of `answers`) is final"""
+        result = answers[-1]
+        self.stats["tiers"][tier]["resolved"] += 1
+        CASCADE_RESOLUTIONS.labels(str(tier + 1)).inc()
+        if tier == 0:
+            return result
+        if result.decision != answers[0].decision:
+            self.stats["overruled"] += 1
+        return ScreeningResult(
+            decision=result.decision,
+            confidence=result.confidence,
+            rationale=f"{result.rationale} (tier {tier + 1} of the cascade; earlier: {self._trail(answers[:-1])})"
+        )
+
+    def _settle(self, answers: List[ScreeningResult]) -> ScreeningResult:
+        """No confident answer: keep a decision every tier agreed on, else leave it to a human"""
+        decisions = {answer.decision for answer in answers}
+        if len(answers) > 1 and len(decisions) == 1 and DecisionType.MAYBE not in decisions:
+            self.stats["tiers"][len(answers) - 1]["resolved"] += 1
+            CASCADE_RESOLUTIONS.labels(str(len(answers))).inc()
+            return ScreeningResult(
+                decision=answers[-1].decision,
+                confidence=max(answer.confidence for answer in answers),
+                rationale=f"{answers[-1].rationale} (agreed by {len(answers)} tiers of the cascade, none confident)"
+            )
+        self.stats["unresolved"] += 1
+        CASCADE_RESOLUTIONS.labels("unresolved").inc()
+        if answers and answers[0].decision != DecisionType.MAYBE:
+            self.stats["overruled"] += 1
+        return ScreeningResult(
+            decision=DecisionType.MAYBE,
+            confidence=min((answer.confidence for answer in answers), default=0.0),
+            rationale=f"The screening agents were unsure or disagreed: {self._trail(answers)}"
+        )
+
+    @staticmethod
+    def _trail(answers: List[ScreeningResult]) -> str:
+        return "; ".join(
+            f"tier {tier + 1}: {answer.decision.value} ({answer.confidence:.2f})" for tier, answer in enumerate(answers)
+        )
+
+    async def screen(self, study: Dict) -> ScreeningResult:
+        result = (await self._screen([study], batch=False))[study["id"]]
+        if isinstance(result, StudyScreeningError):
+            raise result
+        return result
+
+    async def screen_batch(self, studies: List[Dict]) -> Dict[str, Union[ScreeningResult, StudyScreeningError]]:
+        return await self._screen(studies, batch=True)
+
+
+def build_screening_cascade(
+    criteria: ScreeningCriteria,
+    models: Optional[List[str]] = None,
+    threshold: float = CASCADE_CONFIDENCE_THRESHOLD
+) -> ScreeningCascade:
+    """One tier per model, each with one agent per configured API key"""
+    models = check_cascade_models(models or CASCADE_MODELS)
+    keys = get_agent_api_keys()
+    prompt = CriteriaPrompt(criteria)
+    return ScreeningCascade(
+        [
+            [ScreeningAgent(f"cascade-{tier + 1}-agent-{i + 1}", criteria, api_key=key, model=model, prompt=prompt)
+             for i, key in enumerate(keys)]
+            for tier, model in enumerate(models)
+        ],
+        threshold
+    )
@@ -1,63 +1,617 @@
 """
 Database connection and operations using Supabase
 """
-from typing import List, Dict, Optional
+from typing import Any, AsyncIterable, AsyncIterator, Iterable, List, Dict, Optional, Tuple, Union
 import os
-from supabase import create_client, Client
+import time
+import uuid
+import asyncio
+import importlib.util
+import httpx
 from dotenv import load_dotenv
+from models import FailedRow, ScreeningCriteria, ScreeningResult, StoreResult
+from utils.metrics import (
+    CLAIM_BATCH_SIZE, CLAIMS, DB_REQUEST_ERRORS, DB_REQUEST_SECONDS, INSERT_RETRIES, LEASES, ROWS_STORED, STAGE_SECONDS
+)
+from utils.claims import CLAIM_LEASE_SECONDS
 
 load_dotenv()
 
+class DatabaseError(Exception):
+    """Raised when PostgREST rejects a request"""
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+class AsyncPostgrestClient:
+    """
+    Non-blocking client for Supabase's PostgREST API:
+    - One pooled httpx.AsyncClient (HTTP/2 when `h2` is installed) with keep-alive,
+      shared by every API request and screening worker
+    - Pool size and timeouts are configurable
+    """
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        timeout: float = 30.0,
+        http2: bool = True
+    ):
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None
+        self.max_connections = max_connections
+        self._http = httpx.AsyncClient(
+            base_url=f"{url.rstrip('/')}/rest/v1",
+            headers={"apikey": key, "Authorization": f"Bearer {key}"},
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict] = None,
+        json: Any = None,
+        prefer: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> httpx.Response:
+        """Send a request and raise DatabaseError for any non-2xx response"""
+        headers = {"Prefer": prefer} if prefer else None
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        table = path.strip("/")
+        started = time.perf_counter()
+        try:
+            response = await self._http.request(method, path, params=params, json=json, headers=headers, **kwargs)
+        except httpx.HTTPError as e:
+            DB_REQUEST_ERRORS.labels(method, table, type(e).__name__).inc()
+            raise DatabaseError(f"{type(e).__name__}: {e}") from e
+        finally:
+            DB_REQUEST_SECONDS.labels(method, table).observe(time.perf_counter() - started)
+
+        if response.is_error:
+            DB_REQUEST_ERRORS.labels(method, table, str(response.status_code)).inc()
+            try:
+                message = response.json().get("message") or response.text
+            except ValueError:
+                message = response.text
+            raise DatabaseError(f"{response.status_code}: {message}", response.status_code)
+        return response
+
+    async def insert(self, table: str, rows: List[Dict], returning: str = "id", upsert: bool = False) -> List[Dict]:
+        """Multi-row insert (or upsert on the primary key); only the `returning` columns are sent back"""
+        prefer = "resolution=merge-duplicates,return=representation" if upsert else "return=representation"
+        response = await self.request("POST", f"/{table}", params={"select": returning}, json=rows, prefer=prefer)
+        return response.json()
+
+    async def select(self, table: str, params: Dict, timeout: Optional[float] = None) -> List[Dict]:
+        """Read rows using PostgREST query parameters (select, filters, order, limit)"""
+        response = await self.request("GET", f"/{table}", params=params, timeout=timeout)
+        return response.json()
+
+    async def count(self, table: str, params: Dict) -> int:
+        """Count the rows matched by `params` without transferring them"""
+        response = await self.request("HEAD", f"/{table}", params=params, prefer="count=exact")
+        # Content-Range looks like "0-24/3573" or "*/0"
+        return int(response.headers.get("content-range", "*/0").rsplit("/", 1)[-1])
+
+    async def update(self, table: str, values: Dict, params: Dict) -> List[Dict]:
+        """Update the rows matched by the PostgREST filters in `params`"""
+        response = await self.request(
+            "PATCH", f"/{table}", params=params, json=values, prefer="return=representation"
+        )
+        return response.json()
+
+    async def rpc(self, function: str, params: Dict) -> Any:
+        """Call a Postgres function exposed through PostgREST"""
+        response = await self.request("POST", f"/rpc/{function}", json=params)
+        return response.json() if response.content else None
+
+    async def aclose(self):
+        await self._http.aclose()
+
 class Database:
     def __init__(self):
         self.supabase_url = os.getenv("SUPABASE_URL")
         self.supabase_key = os.getenv("SUPABASE_KEY")
-        self.client: Optional[Client] = None
-        
+        self.client: Optional[AsyncPostgrestClient] = None
+
+        # Connection pool settings
+        self.pool_size = int(os.getenv("DB_POOL_SIZE", 20))
+        self.keepalive_connections = int(os.getenv("DB_KEEPALIVE_CONNECTIONS", 10))
+        self.keepalive_expiry = float(os.getenv("DB_KEEPALIVE_EXPIRY", 30))  # seconds
+        self.connect_timeout = float(os.getenv("DB_CONNECT_TIMEOUT", 5))  # seconds
+        self.request_timeout = float(os.getenv("DB_REQUEST_TIMEOUT", 30))  # seconds
+        self.health_timeout = float(os.getenv("DB_HEALTH_TIMEOUT", 2))  # seconds
+        self.http2 = os.getenv("DB_HTTP2", "true").lower() == "true"
+
+        # Bulk ingestion settings
+        self.insert_chunk_size = int(os.getenv("DB_INSERT_CHUNK_SIZE", 500))
+        self.max_concurrent_chunks = int(os.getenv("DB_MAX_CONCURRENT_CHUNKS", 4))
+        self.insert_retries = int(os.getenv("DB_INSERT_RETRIES", 3))
+        self.insert_retry_delay = float(os.getenv("DB_INSERT_RETRY_DELAY", 0.5))  # seconds
+
+        # Claims are leases that expire unless the worker extends them (schema.sql)
+        self.lease_seconds = CLAIM_LEASE_SECONDS
+
     async def connect(self):
-        """Initialize Supabase connection"""
+        """Initialize the pooled Supabase connection"""
         if not self.client:
-            self.client = create_client(self.supabase_url, self.supabase_key)
-            
+            if not self.supabase_url or not self.supabase_key:
+                raise DatabaseError("SUPABASE_URL and SUPABASE_KEY must be set")
+            self.client = AsyncPostgrestClient(
+                self.supabase_url,
+                self.supabase_key,
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+                connect_timeout=self.connect_timeout,
+                timeout=self.request_timeout,
+                http2=self.http2
+            )
+
+    async def close(self):
+        """Close pooled connections"""
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def health_check(self) -> Dict:
+        """Probe the database with a one-row read and report its latency"""
+        started = time.perf_counter()
+        try:
+            await self.connect()
+            await self.client.select("studies", {"select": "id", "limit": 1}, timeout=self.health_timeout)
+            status, error = "healthy", None
+        except Exception as e:
+            status, error = "unhealthy", str(e)
+
+        return {
+            "status": status,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "http2": bool(self.client and self.client.http2),
+            "pool_size": self.pool_size,
+            "error": error
+        }
+
+    @staticmethod
+    def _study_row(job_id: str, entry: Dict) -> Dict:
+        """Map a parsed RIS entry onto a row of the studies table"""
+        return {
+            # Ids are assigned client-side so duplicates can reference their representative
+            "id": entry.get("id") or str(uuid.uuid4()),
+            "job_id": job_id,
+            "duplicate_of": entry.get("duplicate_of"),
+            "metadata": entry["metadata"],
+            "title": entry["title"],
+            "abstract": entry["abstract"],
+            "keywords": entry["keywords"],
+            "source_file": entry.get("source_file"),
+            "terms": entry.get("terms"),
+            "screening_text": entry.get("screening_text"),
+            "screening_tokens": entry.get("screening_tokens"),
+            "decision": None,
+            "decision_rationale": None,
+            "claimed_by": None,
+            "claimed_at": None
+        }
+
     async def store_ris_entries(self, job_id: str, entries: List[Dict]) -> int:
         """Store parsed RIS entries in Supabase"""
+        result = await self.bulk_store_ris_entries(job_id, entries)
+        return result.stored_count
+
+    async def bulk_store_ris_entries(
+        self,
+        job_id: str,
+        entries: Union[Iterable[Dict], AsyncIterable[Dict]],
+        chunk_size: Optional[int] = None,
+        max_concurrent_chunks: Optional[int] = None,
+        result: Optional[StoreResult] = None
+    ) -> StoreResult:
+        """
+        Store parsed RIS entries with multi-row inserts:
+        - Entries are grouped into chunks of `chunk_size` rows, one request per chunk
+        - At most `max_concurrent_chunks` requests are in flight; the input is only
+          consumed as fast as chunks complete, so a streamed upload applies backpressure
+        - Failed chunks are retried on transient errors; a chunk the database rejects
+          (a 4xx) is split to isolate the rows at fault
+        - Pass in `result` to watch the counts grow while the entries are stored
+        """
         await self.connect()
-        
-        stored_count = 0
-        for entry in entries:
+
+        chunk_size = chunk_size or self.insert_chunk_size
+        max_concurrent_chunks = max_concurrent_chunks or self.max_concurrent_chunks
+        result = result if result is not None else StoreResult()
+        in_flight = set()
+
+        def _collect(done):
+            for task in done:
+                stored, failed, retries = task.result()
+                result.stored_count += stored
+                result.failed_rows.extend(failed)
+                result.retry_count += retries
+
+        async for chunk in self._iter_chunks(job_id, entries, chunk_size):
+            if len(in_flight) >= max_concurrent_chunks:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                _collect(done)
+            in_flight.add(asyncio.create_task(self._insert_chunk(chunk, self.insert_retries)))
+            result.chunk_count += 1
+
+        if in_flight:
+            done, _ = await asyncio.wait(in_flight)
+            _collect(done)
+
+        result.failed_rows.sort(key=lambda row: row.index)
+        return result
+
+    async def _iter_chunks(
+        self,
+        job_id: str,
+        entries: Union[Iterable[Dict], AsyncIterable[Dict]],
+        chunk_size: int
+    ) -> AsyncIterator[List[Tuple[int, Dict]]]:
+        """Group entries into (index, row) chunks, whether they arrive as a list or a stream"""
+        chunk = []
+        index = 0
+
+        if hasattr(entries, "__aiter__"):
+            async for entry in entries:
+                chunk.append((index, self._study_row(job_id, entry)))
+                index += 1
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        else:
+            for entry in entries:
+                chunk.append((index, self._study_row(job_id, entry)))
+                index += 1
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+
+        if chunk:
+            yield chunk
+
+    async def _insert_chunk(self, chunk: List[Tuple[int, Dict]], attempts: int) -> Tuple[int, List[FailedRow], int]:
+        """Insert one chunk, returning (stored count, failed rows, retries used)"""
+        retries = 0
+        last_error = None
+
+        for attempt in range(max(attempts, 1)):
             try:
-                data = {
-                    "job_id": job_id,
-                    "metadata": entry["metadata"],
-                    "title": entry["title"],
-                    "abstract": entry["abstract"],
-                    "keywords": entry["keywords"],
-                    "decision": None,
-                    "decision_rationale": None,
-                    "claimed_by": None,
-                    "claimed_at": None
-                }
-                
-                result = self.client.table("studies").insert(data).execute()
-                if result.data:
-                    stored_count += 1
-                
+                with STAGE_SECONDS.labels("store").time():
+                    inserted = await self.client.insert("studies", [row for _, row in chunk])
+                ROWS_STORED.labels("stored").inc(len(inserted))
+                return len(inserted), [], retries
+
             except Exception as e:
-                print(f"Error storing entry: {str(e)}")
-                continue
-                
-        return stored_count
-        
-    async def get_unclaimed_studies(self, batch_size: int = 10) -> List[Dict]:
-        """Get unclaimed studies for processing"""
-        await self.connect()
-        
-        result = await self.client.rpc(
-            'claim_studies_batch',
-            {'batch_size': batch_size}
-        ).execute()
-        
-        return result.data
+                last_error = e
+                if not self._is_transient(e):
+                    break
+                if attempt + 1 < attempts:
+                    retries += 1
+                    INSERT_RETRIES.inc()
+                    await asyncio.sleep(self.insert_retry_delay * (2 ** attempt))
+
+        if len(chunk) == 1 or self._is_transient(last_error):
+            # Still failing after every retry (the database is down, say): splitting would only
+            # multiply the requests, so the whole chunk is reported failed
+            ROWS_STORED.labels("failed").inc(len(chunk))
+            return 0, [FailedRow(index=index, error=str(last_error)) for index, _ in chunk], retries
+
+        # One bad row rejects the whole multi-row insert: split the chunk to find it,
+        # trying each half once since the retries above already covered transient errors
+        middle = len(chunk) // 2
+        left, right = await asyncio.gather(
+            self._insert_chunk(chunk[:middle], 1),
+            self._insert_chunk(chunk[middle:], 1)
+        )
+        return left[0] + right[0], left[1] + right[1], retries + left[2] + right[2]
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        """Network failures, timeouts, rate limits and 5xx responses are worth retrying"""
+        status_code = getattr(error, "status_code", None)
+        return status_code is None or status_code in (408, 429) or status_code >= 500
+
+    async def get_unclaimed_studies(
+        self,
+        batch_size: int = 10,
+        job_id: Optional[str] = None,
+        worker_id: Optional[str] = None,
+        study_ids: Optional[List[str]] = None
+    ) -> List[Dict]:
+        """
+        Atomically lease a batch of undecided studies (optionally for one job) to a worker:
+        - Unclaimed studies and studies whose lease has expired can be claimed
+        - Studies taken over from an expired lease come back with `reclaimed` set
+        - With `study_ids` (e.g. in ranked order), only those studies are claimed, in that order
+        """
+        await self.connect()
+
+        params = {'batch_size': batch_size, 'job_id': job_id, 'worker_id': worker_id, 'lease_seconds': self.lease_seconds}
+        if study_ids is not None:
+            params['study_ids'] = study_ids
+        with STAGE_SECONDS.labels("claim").time():
+            result = await self.client.rpc('claim_studies_batch', params)
+
+        result = result or []
+        CLAIM_BATCH_SIZE.observe(len(result))
+        if not result:
+            CLAIMS.labels("empty").inc()
+        else:
+            CLAIMS.labels("claimed" if len(result) == batch_size else "partial").inc()
+        reclaimed = sum(1 for study in result if study.get("reclaimed"))
+        if reclaimed:
+            LEASES.labels("reclaimed").inc(reclaimed)
+        return result
+
+    async def extend_leases(self, worker_id: str, study_ids: List[str]) -> List[str]:
+        """Heartbeat: extend the worker's leases and return the ids it still holds"""
+        await self.connect()
+
+        held = await self.client.rpc(
+            'extend_study_leases',
+            {'worker_id': worker_id, 'study_ids': study_ids, 'lease_seconds': self.lease_seconds}
+        )
+        LEASES.labels("extended").inc(len(held or []))
+        return [row["id"] for row in held or []]
+
+    async def count_studies(self, job_id: str, undecided_only: bool = False) -> int:
+        """Count a job's screenable studies (duplicates excluded), or only those still undecided"""
+        await self.connect()
+
+        params = {"job_id": f"eq.{job_id}", "duplicate_of": "is.null"}
+        if undecided_only:
+            # Dead letters stay undecided, but nothing will screen them until they are requeued
+            params["decision"] = "is.null"
+            params["screening_error"] = "is.null"
+        return await self.client.count("studies", params)
+
+    async def save_decision(
+        self,
+        study_id: str,
+        result: ScreeningResult,
+        worker_id: Optional[str] = None,
+        criteria_version: Optional[int] = None
+    ) -> bool:
+        """
+        Write a screening decision back (with the criteria version that made it), release the claim
+        and copy it onto the study's duplicates.
+        Returns False when the worker no longer held the lease (the study was reclaimed); the
+        duplicates are then left to whoever holds it now.
+        """
+        await self.connect()
+
+        values = {"decision": result.decision.value, "decision_rationale": result.rationale}
+        if criteria_version is not None:
+            values["criteria_version"] = criteria_version
+
+        # Only the worker holding the claim may decide the study itself
+        params = {"id": f"eq.{study_id}", "select": "id"}
+        if worker_id:
+            params["claimed_by"] = f"eq.{worker_id}"
+        rows = await self.client.update(
+            "studies", {**values, "claimed_by": None, "claimed_at": None, "lease_expires_at": None}, params
+        )
+        if not rows:
+            LEASES.labels("lost").inc()
+            return False
+
+        await self.client.update("studies", values, {"duplicate_of": f"eq.{study_id}"})
+        return True
+
+    async def dead_letter_study(self, study_id: str, error: str, worker_id: str) -> bool:
+        """
+        Give up on a claimed study: record why and release it without a decision, so it is never
+        claimed again. Returns False when the worker no longer held the lease.
+        """
+        await self.connect()
+
+        rows = await self.client.update(
+            "studies",
+            {"screening_error": error[:1000], "claimed_by": None, "claimed_at": None, "lease_expires_at": None},
+            {"id": f"eq.{study_id}", "claimed_by": f"eq.{worker_id}", "decision": "is.null", "select": "id"}
+        )
+        return bool(rows)
+
+    async def get_dead_letters(self, job_id: str) -> List[Dict]:
+        """The job's studies screening gave up on, with the reason"""
+        await self.connect()
+
+        return await self.client.select("studies", {
+            "select": "id,title,screening_error",
+            "job_id": f"eq.{job_id}",
+            "screening_error": "not.is.null",
+            "decision": "is.null",
+            "order": "id.asc"
+        })
+
+    async def requeue_dead_letters(self, job_id: str) -> int:
+        """Make the job's dead letters claimable again; returns how many there were"""
+        await self.connect()
+
+        rows = await self.client.update(
+            "studies",
+            {"screening_error": None},
+            {"job_id": f"eq.{job_id}", "screening_error": "not.is.null", "select": "id"}
+        )
+        return len(rows or [])
+
+    def iter_undecided_studies(self, job_id: str, columns: str = "id,title,abstract") -> AsyncIterator[Dict]:
+        """Page through a job's undecided, screenable studies (dead letters excluded, like in claims)"""
+        return self._iter_studies(job_id, columns, {"decision": "is.null", "screening_error": "is.null"})
+
+    def iter_decided_studies(
+        self,
+        job_id: str,
+        columns: str = "id,decision",
+        decision: Optional[str] = None,
+        include_duplicates: bool = False
+    ) -> AsyncIterator[Dict]:
+        """
+        Page through a job's screened studies, optionally for one decision. Duplicates (which carry
+        their representative's decision) are left out unless `include_duplicates` is set
+        """
+        return self._iter_studies(
+            job_id, columns, {"decision": f"eq.{decision}" if decision else "not.is.null"},
+            representatives_only=not include_duplicates
+        )
+
+    async def _iter_studies(
+        self, job_id: str, columns: str, filters: Dict, page_size: int = 1000, representatives_only: bool = True
+    ) -> AsyncIterator[Dict]:
+        """Keyset pagination over a job's studies (only the representatives, by default) in id order"""
+        await self.connect()
+
+        last_id = None
+        while True:
+            params = {
+                "select": columns,
+                "job_id": f"eq.{job_id}",
+                "order": "id",
+                "limit": page_size,
+                **filters
+            }
+            if representatives_only:
+                params["duplicate_of"] = "is.null"
+            if last_id is not None:
+                params["id"] = f"gt.{last_id}"
+            rows = await self.client.select("studies", params)
+            for row in rows:
+                yield row
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]["id"]
+
+    async def save_decisions(
+        self,
+        study_ids: List[str],
+        result: ScreeningResult,
+        chunk_size: int = 200,
+        criteria_version: Optional[int] = None
+    ) -> None:
+        """Apply one decision to many undecided, unclaimed studies (and their duplicates) in a few requests"""
+        await self.connect()
+
+        values = {"decision": result.decision.value, "decision_rationale": result.rationale}
+        if criteria_version is not None:
+            values["criteria_version"] = criteria_version
+        for start in range(0, len(study_ids), chunk_size):
+            ids = ",".join(str(study_id) for study_id in study_ids[start:start + chunk_size])
+            await self.client.update(
+                "studies",
+                values,
+                {"or": f"(id.in.({ids}),duplicate_of.in.({ids}))", "decision": "is.null", "claimed_by": "is.null"}
+            )
+
+    async def get_criteria_versions(self, job_id: str) -> List[Dict]:
+        """Every criteria version recorded for the job, oldest first"""
+        await self.connect()
+
+        rows = await self.client.select("criteria_versions", {
+            "select": "version,criteria,created_at",
+            "job_id": f"eq.{job_id}",
+            "order": "version.asc"
+        })
+        return [{**row, "criteria": ScreeningCriteria(**row["criteria"])} for row in rows]
+
+    async def add_criteria_version(self, job_id: str, version: int, criteria: ScreeningCriteria) -> Dict:
+        await self.connect()
+
+        row = {
+            "job_id": job_id,
+            "version": version,
+            "criteria": {"inclusion": criteria.inclusion, "exclusion": criteria.exclusion}
+        }
+        await self.client.insert("criteria_versions", [row], returning="version")
+        return {**row, "criteria": criteria}
+
+    async def reset_decisions(self, job_id: str, criteria_version: int, decisions: List[str]) -> int:
+        """
+        Clear the decisions (of the given kinds) made under one criteria version, duplicates included,
+        so the studies are screened again; returns how many screenable studies were reset
+        """
+        await self.connect()
+
+        rows = await self.client.update(
+            "studies",
+            {"decision": None, "decision_rationale": None, "criteria_version": None},
+            {
+                "job_id": f"eq.{job_id}",
+                "criteria_version": f"eq.{criteria_version}",
+                "decision": f"in.({','.join(decisions)})",
+                "select": "id,duplicate_of"
+            }
+        )
+        return sum(1 for row in rows or [] if row.get("duplicate_of") is None)
+
+    async def get_studies_page(self, job_id: str, limit: int = 50, after: Optional[str] = None) -> List[Dict]:
+        """One page of a job's studies in id order, with authors and year lifted out of metadata"""
+        await self.connect()
+
+        params = {
+            "select": "id,title,abstract,keywords,decision,decision_rationale,criteria_version,duplicate_of,source_file,"
+                      "authors:metadata->authors,year:metadata->year",
+            "job_id": f"eq.{job_id}",
+            "order": "id",
+            "limit": limit
+        }
+        if after:
+            params["id"] = f"gt.{after}"
+        return await self.client.select("studies", params)
+
+    async def release_studies(self, study_ids: List[str]) -> None:
+        """Hand claimed but unscreened studies back to the pool"""
+        if not study_ids:
+            return
+        await self.connect()
+
+        await self.client.update(
+            "studies",
+            {"claimed_by": None, "claimed_at": None, "lease_expires_at": None},
+            {"id": f"in.({','.join(str(study_id) for study_id in study_ids)})", "decision": "is.null"}
+        )
+
+    async def release_job_claims(self, job_id: str) -> None:
+        """Hand back every claim a job holds, e.g. those left by workers that died in a restart"""
+        await self.connect()
+
+        await self.client.update(
+            "studies",
+            {"claimed_by": None, "claimed_at": None, "lease_expires_at": None},
+            {"job_id": f"eq.{job_id}", "decision": "is.null", "claimed_by": "not.is.null"}
+        )
+
+    async def upsert_job(self, row: Dict) -> None:
+        await self.connect()
+        await self.client.insert("screening_jobs", [row], upsert=True)
+
+    async def update_job(self, job_id: str, values: Dict) -> None:
+        await self.connect()
+        await self.client.update("screening_jobs", values, {"id": f"eq.{job_id}"})
+
+    async def get_jobs(self) -> List[Dict]:
+        await self.connect()
+        return await self.client.select("screening_jobs", {"select": "*", "order": "created_at"})
+
+    async def upsert_ingest(self, row: Dict) -> None:
+        await self.connect()
+        await self.client.insert("screening_ingests", [row], upsert=True)
+
+    async def get_ingests(self) -> List[Dict]:
+        await self.connect()
+        return await self.client.select("screening_ingests", {"select": "*"})
 
 _db_instance = None
 
@@ -73,4 +627,11 @@ async def get_db() -> Database:
     """Get database instance"""
     if not _db_instance:
         await init_db()
-    return _db_instance 
\ No newline at end of file
+    return _db_instance
+
+async def close_db():
+    """Release pooled connections on shutdown"""
+    global _db_instance
+    if _db_instance:
+        await _db_instance.close()
+        _db_instance = None
@@ -0,0 +1,200 @@
+"""
+Background ingestion pipeline
+-----------------------------
+
+/api/upload (one file) and /api/upload/batch (several files, e.g. the
+exports of several databases, merged into one job) only spool the request
+body to temporary files (kept in memory up to INGEST_SPOOL_MEMORY bytes,
+then on disk) and answer 202 with the job id. The files are then ingested
+in the background by three stages joined by bounded queues, so a slow
+stage holds back the ones before it instead of letting entries pile up in
+memory:
+
+    parse + validate  ->  deduplicate  ->  bulk store
+
+Parsing runs in a process pool (utils/parallelparsing.py), a piece of
+whole records at a time, so neither the files nor the pieces of one large
+file wait for each other, and the event loop keeps serving requests.
+Studies come out in upload order, each tagged with its source file, and
+duplicates are found across all of the job's files.
+
+Each upload's progress (parsed, duplicates, stored, failed rows, record
+errors) can be read while it runs. The stored studies are read back page
+by page through GET /api/studies/{job_id}. Uploads are saved to the job
+store when they start and end, so after a restart a job can still only be
+screened once its upload is known to have completed.
+"""
+
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from models import IngestStatus, StoreResult
+from database import get_db
+from job_store import MemoryJobStore
+from validation import validate_ris_files
+from utils.deduplication import StudyDeduplicator
+from utils.metrics import STAGE_SECONDS, TRACER
+from utils.risfileparsing import CHUNK_SIZE, aread_chunks
+
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 1000))  # entries buffered between two stages
+INGEST_SPOOL_MEMORY = int(os.getenv("INGEST_SPOOL_MEMORY", 8 * 1024 * 1024))  # bytes before spilling to disk
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.8))  # estimated Jaccard similarity
+
+_DONE = object()
+
+
+class _SpoolReader:
+    """Async read() over the spooled file, so the parser can use aread_chunks"""
+
+    def __init__(self, spool):
+        self.spool = spool
+
+    async def read(self, size: int) -> bytes:
+        return await asyncio.to_thread(self.spool.read, size)
+
+
+async def spool_upload(upload) -> tempfile.SpooledTemporaryFile:
+    """Copy the request body into a temporary file that outlives the request"""
+    spool = tempfile.SpooledTemporaryFile(max_size=INGEST_SPOOL_MEMORY)
+    try:
+        async for chunk in aread_chunks(upload, CHUNK_SIZE):
+            await asyncio.to_thread(spool.write, chunk)
+        spool.seek(0)
+    except BaseException:
+        spool.close()
+        raise
+    return spool
+
+
+class IngestionPipeline:
+    def __init__(self, queue_size: int = INGEST_QUEUE_SIZE, job_store: Optional[MemoryJobStore] = None):
+        self.queue_size = queue_size
+        self.job_store = job_store if job_store is not None else MemoryJobStore()
+        self.ingests: Dict[str, Dict] = {}
+        self._tasks = set()
+
+    async def load_ingests(self) -> int:
+        """Reload the uploads saved before a restart; returns how many there were"""
+        ingests = await self.job_store.load_ingests()
+        for ingest in ingests:
+            self.ingests.setdefault(ingest["job_id"], ingest)
+        return len(ingests)
+
+    def start(self, job_id: str, files: List[Tuple[str, tempfile.SpooledTemporaryFile]]) -> Dict:
+        """Register the upload of one or more (filename, spool) files and ingest them in the background"""
+        self.ingests[job_id] = {
+            "job_id": job_id,
+            "filename": ", ".join(filename for filename, _ in files),
+            "files": [{"filename": filename, "parsed": 0} for filename, _ in files],
+            "status": IngestStatus.QUEUED,
+            "parsed": 0,
+            "stored": 0,
+            "failed_rows": 0,
+            "errors": [],
+            "duplicates": None,
+            "started_at": datetime.utcnow(),
+            "completed_at": None,
+            "error": None
+        }
+        task = asyncio.create_task(self._run(job_id, [spool for _, spool in files]))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return self.ingests[job_id]
+
+    def get_status(self, job_id: str) -> Dict:
+        if job_id not in self.ingests:
+            raise KeyError(f"Upload {job_id} not found")
+        return self.ingests[job_id]
+
+    def is_running(self, job_id: str) -> bool:
+        ingest = self.ingests.get(job_id)
+        return ingest is not None and ingest["status"] in (IngestStatus.QUEUED, IngestStatus.RUNNING)
+
+    def is_completed(self, job_id: str) -> bool:
+        ingest = self.ingests.get(job_id)
+        return ingest is not None and ingest["status"] == IngestStatus.COMPLETED
+
+    async def _run(self, job_id: str, spools: List):
+        ingest = self.ingests[job_id]
+        ingest["status"] = IngestStatus.RUNNING
+        parsed: asyncio.Queue = asyncio.Queue(self.queue_size)
+        deduplicated: asyncio.Queue = asyncio.Queue(self.queue_size)
+        deduplicator = StudyDeduplicator(threshold=DEDUP_THRESHOLD) if DEDUP_ENABLED else None
+        store_result = StoreResult()
+
+        stages = [
+            asyncio.create_task(self._traced(job_id, "ingest_parse", self._parse(ingest, spools, parsed))),
+            asyncio.create_task(self._traced(job_id, "ingest_dedup", self._deduplicate(deduplicator, parsed, deduplicated))),
+            asyncio.create_task(self._traced(job_id, "ingest_store", self._store(job_id, deduplicated, store_result, ingest)))
+        ]
+        try:
+            await self.job_store.save_ingest(ingest)
+            await asyncio.gather(*stages)
+            ingest["status"] = IngestStatus.COMPLETED
+        except Exception as e:
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            ingest["status"] = IngestStatus.FAILED
+            ingest["error"] = str(e)
+        finally:
+            for spool in spools:
+                spool.close()
+            ingest["stored"] = store_result.stored_count
+            ingest["failed_rows"] = len(store_result.failed_rows)
+            ingest["duplicates"] = deduplicator.summary() if deduplicator else None
+            ingest["completed_at"] = datetime.utcnow()
+            await self.job_store.save_ingest(ingest)
+
+    @staticmethod
+    async def _traced(job_id: str, name: str, stage):
+        with TRACER.span(job_id, name):
+            await stage
+
+    async def _parse(self, ingest: Dict, spools: List, output: asyncio.Queue):
+        """Stage 1: parse and validate the spooled files, in parallel, handing entries on in upload order"""
+        files = [(file["filename"], _SpoolReader(spool)) for file, spool in zip(ingest["files"], spools)]
+        counts = iter(ingest["files"])
+        current = next(counts)
+        async for entry in validate_ris_files(files, ingest["errors"]):
+            while entry["source_file"] != current["filename"]:
+                current = next(counts)
+            await output.put(entry)
+            current["parsed"] += 1
+            ingest["parsed"] += 1
+        await output.put(_DONE)
+
+    async def _deduplicate(self, deduplicator: Optional[StudyDeduplicator], source: asyncio.Queue, output: asyncio.Queue):
+        """Stage 2: mark duplicates a block at a time"""
+        block_size = deduplicator.block_size if deduplicator else 1
+        block: List[Dict] = []
+        while True:
+            entry = await source.get()
+            if entry is not _DONE:
+                block.append(entry)
+            if block and (entry is _DONE or len(block) >= block_size):
+                if deduplicator:
+                    with STAGE_SECONDS.labels("dedup").time():
+                        block = deduplicator.process_block(block)
+                for deduplicated in block:
+                    await output.put(deduplicated)
+                block = []
+            if entry is _DONE:
+                await output.put(_DONE)
+                return
+
+    async def _store(self, job_id: str, source: asyncio.Queue, result: StoreResult, ingest: Dict):
+        """Stage 3: multi-row inserts, with the stored count visible while they run"""
+        async def _entries():
+            while True:
+                entry = await source.get()
+                if entry is _DONE:
+                    return
+                yield entry
+                ingest["stored"] = result.stored_count
+
+        db = await get_db()
+        await db.bulk_store_ris_entries(job_id, _entries(), result=result)
@@ -0,0 +1,970 @@
+"""
+This queue system manages the distributed processing of academic papers for systematic review screening.
+It's a critical component that orchestrates the AI-powered screening process where multiple AI agents
+work concurrently to evaluate research papers based on inclusion/exclusion criteria.
+
+Key Responsibilities:
+1. Job Management
+   - Tracks screening jobs from RIS file upload to completion
+   - Manages concurrent processing of multiple screening jobs
+   - Admits at most max_concurrent_jobs at a time; the rest wait by priority, with
+     their queue position and estimated start time in the job status
+   - Implements retry logic with exponential backoff for resilience
+   - LLM failures are retried per study through each API key's rate limiter
+     (utils/ratelimit.py); a study that still fails is dead-lettered and the job carries on
+   - Versions each job's criteria: screening again with edited criteria only re-screens
+     the decisions the edit could change (utils/criteriaversions.py)
+   - Estimates a job's LLM requests, tokens, cost and duration before it runs, from the
+     token counts stored with each study at upload (utils/screeningtext.py)
+
+2. Progress Tracking
+   - Monitors real-time progress of paper screening
+   - Tracks individual paper decisions (include/exclude/maybe)
+   - Maintains detailed processing history and error states
+
+3. AI Agent Coordination
+   - Coordinates between 3 screening agents and 1 reporting agent
+   - Optionally screens through a confidence-gated cascade (cascade.py): one agent
+     decides, and the next is consulted only when it is unsure
+   - Hands out the likely includes first (utils/relevance.py), and optionally stops
+     once the estimated recall reaches a target, excluding the low-ranked rest
+   - Prevents duplicate processing of papers
+   - Manages agent workload and concurrent operations
+   - Shares the global worker slots fairly between running jobs (utils/scheduler.py),
+     so a small review finishes quickly while a huge one is running
+
+Workflow Context:
+1. User uploads RIS file with research papers
+2. System creates a screening job with inclusion/exclusion criteria
+3. Multiple AI agents process papers concurrently
+4. Results are tracked and aggregated for final report generation
+
+This implementation follows a robust distributed processing pattern with:
+- Atomic operations to prevent race conditions
+- Exponential backoff for error handling
+- Detailed progress tracking for frontend updates
+- Job history for audit and debugging
+- A durable job store (job_store.py) so jobs resume after a restart
+- Optionally a broker (broker.py): the API then only publishes jobs and follows
+  their progress, while worker processes (worker.py) do the screening
+
+Related Components:
+- FastAPI endpoints in main.py trigger job creation
+- Supabase database stores paper metadata and decisions
+- Screening agents in agents.py make the include/exclude/maybe decisions
+- Frontend displays real-time progress in the right panel
+"""
+
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import time
+from datetime import datetime, timedelta
+from models import JobStatus, ScreeningCriteria, ScreeningResult
+from database import Database, get_db
+from agents import (
+    ANSWER_TOKENS_PER_STUDY, BATCH_MAX_STUDIES, CriteriaPrompt, StudyScreeningError, build_screening_agents,
+    get_agent_api_keys, pack_batches, pack_token_counts, study_tokens
+)
+from cascade import (
+    CASCADE_CONFIDENCE_THRESHOLD, CASCADE_MODELS, SCREENING_CASCADE, build_screening_cascade, check_cascade_models
+)
+from utils.claims import AdaptiveClaimSize, heartbeat, remaining_share
+from utils.criteriaversions import criteria_changes, decisions_to_rescreen
+from utils.decisioncache import DecisionCache, criteria_fingerprint
+from utils.metrics import (
+    DEAD_LETTERS, DECISIONS, JOBS, LLM_CONCURRENCY_LIMIT, QUEUE_DEPTH, STAGE_SECONDS, TRACER, WORKERS_IN_FLIGHT,
+    llm_cost_usd
+)
+from utils.prefilter import LexicalPrefilter
+from utils.progressstream import ProgressHub
+from utils.ratelimit import LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, rate_limiter_stats
+from utils.relevance import RELEVANCE_RANKING, RelevanceRanker
+from utils.resultexport import export_results
+from utils.scheduler import SCREENING_MAX_WORKERS, WorkerSlots, estimate_start_times
+from job_store import MemoryJobStore, create_job_store, new_claim_stats
+
+class JobQueue:
+    def __init__(
+        self,
+        db: Optional[Database] = None,
+        agent_factory: Optional[Callable] = None,
+        cascade_factory: Optional[Callable] = None,
+        decision_cache: Optional[DecisionCache] = None,
+        job_store: Optional[MemoryJobStore] = None,
+        broker=None
+    ):
+        self.jobs: Dict = {}
+        self.active_jobs: Dict = {}
+        self.max_concurrent_jobs = int(os.getenv("SCREENING_MAX_CONCURRENT_JOBS", 3))
+        self.max_retries = 3
+        self.retry_delay = 5  # seconds
+        
+        # Worker pool settings
+        self.workers_per_job = int(os.getenv("SCREENING_WORKERS_PER_JOB", 3))
+        # Batch mode packs a worker's claimed studies into multi-study prompts
+        self.batch_mode = os.getenv("SCREENING_BATCH_MODE", "false").lower() == "true"
+        # Starting claim size; each worker then adapts it to its own seconds per study (utils/claims.py)
+        self.claim_batch_size = int(os.getenv("CLAIM_BATCH_SIZE", BATCH_MAX_STUDIES if self.batch_mode else 2))
+        self.active_workers = 0
+        self.db = db
+        self.agent_factory = agent_factory or build_screening_agents
+        # Cascade mode screens each study with one agent, escalating only its doubtful answers
+        self.cascade_mode = SCREENING_CASCADE
+        self.cascade_factory = cascade_factory or build_screening_cascade
+        if self.cascade_mode and cascade_factory is None:
+            check_cascade_models(CASCADE_MODELS)  # fail at startup, not on the first job
+        # Relevance ranking: claim the studies most like the includes so far first
+        self.relevance_ranking = RELEVANCE_RANKING
+        self._rankers: Dict[str, RelevanceRanker] = {}  # kept across retries and worker re-entries of a run
+        self._stopping: Dict[str, asyncio.Future] = {}
+        # LLM speed assumed by estimate_job: per-request overhead plus time to write the answer
+        self.estimate_request_seconds = float(os.getenv("ESTIMATE_REQUEST_SECONDS", 0.5))
+        self.estimate_output_tokens_per_second = float(os.getenv("ESTIMATE_OUTPUT_TOKENS_PER_SECOND", 60))
+        self.decision_cache = decision_cache if decision_cache is not None else DecisionCache.from_env()
+        self.job_store = job_store if job_store is not None else create_job_store(db)
+        
+        # Admission: jobs beyond max_concurrent_jobs wait in a list kept sorted by (-priority, arrival),
+        # so status polls read a queue position with a bisect; admitted jobs share the global worker
+        # slots in proportion to their priority. By default there are as many slots as LLM calls the
+        # API keys are screened with at once (one set of job workers per key)
+        self._admitted: Dict[str, asyncio.Task] = {}
+        self._waiting: List[Tuple[int, int, str]] = []
+        self._waiting_entries: Dict[str, Tuple[int, int, str]] = {}
+        self._arrivals = itertools.count()
+        self.worker_slots = WorkerSlots(
+            SCREENING_MAX_WORKERS if SCREENING_MAX_WORKERS is not None
+            else len(get_agent_api_keys()) * self.workers_per_job
+        )
+        
+        # With a broker, jobs are screened by worker processes and only followed here
+        self.broker = broker
+        self._remote_jobs = set()
+        self._follower: Optional[asyncio.Task] = None
+        
+        # Progress is pushed to subscribers, and per-status job counts are kept incrementally
+        self.progress_hub = ProgressHub(min_interval=float(os.getenv("PROGRESS_MIN_INTERVAL", 0.5)))
+        self.status_counts = {status: 0 for status in JobStatus}
+        
+        # Queue gauges are read at scrape time rather than kept up to date
+        JOBS.set_function(lambda: {(status.value,): count for status, count in self.status_counts.items()})
+        QUEUE_DEPTH.set_function(
+            lambda: {(): self.status_counts[JobStatus.PENDING] + self.status_counts[JobStatus.PROCESSING]}
+        )
+        WORKERS_IN_FLIGHT.set_function(lambda: {(): self.active_workers})
+        LLM_CONCURRENCY_LIMIT.set_function(
+            lambda: {(key,): stats["concurrency_limit"] for key, stats in rate_limiter_stats().items()}
+        )
+        
+    def __len__(self) -> int:
+        return len(self.jobs)
+    
+    async def add_job(self, job_id: str, criteria: ScreeningCriteria, total_studies: int, criteria_version: int = 1) -> Dict:
+        """Add a new job to the queue with study count"""
+        if job_id in self.jobs:
+            self.status_counts[self.jobs[job_id]["status"]] -= 1
+        self.status_counts[JobStatus.PENDING] += 1
+        self.jobs[job_id] = {
+            "id": job_id,
+            "status": JobStatus.PENDING,
+            "criteria": criteria,
+            "criteria_version": criteria_version,  # Stored with every decision the job makes
+            "rescreen": None,  # Decisions kept and reset when the job was screened again (prepare_job)
+            "created_at": datetime.utcnow(),
+            "progress": 0,
+            "total_studies": total_studies,
+            "processed_studies": 0,
+            "cache_hits": 0,
+            "dead_letters": 0,  # Studies screening gave up on (listed at /api/dead-letters/{job_id})
+            "prefilter": None,  # Lexical pre-screening summary, once it has run
+            "priority": 0,  # Admission order and share of the worker slots (prepare_job, submit)
+            "agents": [],  # Every agent used by the job, for token usage
+            "cascade": None,  # Studies resolved per tier, in cascade mode
+            "ranking": None,  # Relevance ranking and stopping rule summary, while ranked
+            "claims": new_claim_stats(),
+            "remote_counts": None,  # Per-decision counts from the broker, for dispatched jobs
+            "shared_progress": None,  # On a worker process: the job's progress across all workers
+            "retry_count": 0,
+            "last_error": None,
+            "results": {
+                "include": [],
+                "exclude": [],
+                "maybe": []
+            },
+            "processing_history": [],  # Track processing attempts
+            "run_started": None  # (monotonic time, processed count) when the current attempt began, for the ETA
+        }
+        await self.job_store.save_job(self.jobs[job_id])
+        return self.jobs[job_id]
+    
+    async def prepare_job(self, job_id: str, criteria: ScreeningCriteria, priority: int = 0) -> Dict:
+        """
+        Add a job for screening under `criteria`, recorded as a new criteria version when they changed.
+        Decisions the change could affect are reset to be screened again; the others are kept.
+        """
+        db = await self._get_db()
+        versions = await db.get_criteria_versions(job_id)
+        if not versions and job_id in self.jobs:
+            # Screened before criteria were versioned: its last criteria made every decision so far
+            versions = [await db.add_criteria_version(job_id, 1, self.jobs[job_id]["criteria"])]
+        
+        current = versions[-1] if versions else None
+        rescreened = 0
+        if current is not None and not criteria_changes(current["criteria"], criteria):
+            version = current["version"]
+        else:
+            # Each decision is judged against the version that made it. Resets come first:
+            # should one fail, the next attempt still sees the criteria as changed
+            for previous in versions:
+                decisions = decisions_to_rescreen(previous["criteria"], criteria)
+                if decisions:
+                    rescreened += await db.reset_decisions(job_id, previous["version"], decisions)
+            version = current["version"] + 1 if current else 1
+            await db.add_criteria_version(job_id, version, criteria)
+        
+        job = await self.add_job(job_id, criteria, await db.count_studies(job_id), version)
+        job["priority"] = priority  # saved with the job, so it is queued the same way after a restart
+        async for study in db.iter_decided_studies(job_id):
+            job["results"][study["decision"]].append(study["id"])
+        reused = sum(len(study_ids) for study_ids in job["results"].values())
+        job["rescreen"] = {
+            "criteria_version": version,
+            "previous_version": current["version"] if current else None,
+            "changes": criteria_changes(current["criteria"], criteria) if current else {},
+            "reused": reused,
+            "rescreened": rescreened
+        }
+        await self.update_progress(job_id, reused)
+        await self.job_store.save_job(job)
+        await self.job_store.replace_results(job)
+        return job
+    
+    async def estimate_job(self, job_id: str, criteria: ScreeningCriteria) -> Dict:
+        """
+        What screening the job under `criteria` would take, before it runs: the undecided studies plus
+        the decisions the criteria edit would reset (as prepare_job would), from their stored token counts.
+        The prefilter, decision cache and stopping rule can only make it cheaper.
+        """
+        db = await self._get_db()
+        versions = await db.get_criteria_versions(job_id)
+        if not versions and job_id in self.jobs:
+            versions = [{"version": 1, "criteria": self.jobs[job_id]["criteria"]}]
+        resets = {}
+        if versions and criteria_changes(versions[-1]["criteria"], criteria):
+            resets = {version["version"]: set(decisions_to_rescreen(version["criteria"], criteria)) for version in versions}
+        
+        async def _token_counts(text_columns: str = "") -> Tuple[List[Optional[int]], int]:
+            """Per study to screen, its token count (None when not stored, unless counted from its text)"""
+            counts = []
+            async for study in db.iter_undecided_studies(job_id, columns="id,screening_tokens" + text_columns):
+                counts.append(study_tokens(study) if text_columns else study.get("screening_tokens"))
+            undecided = len(counts)
+            if resets:
+                columns = "id,decision,criteria_version,screening_tokens" + text_columns
+                async for study in db.iter_decided_studies(job_id, columns=columns):
+                    if study["decision"] in resets.get(study.get("criteria_version") or 1, ()):
+                        counts.append(study_tokens(study) if text_columns else study.get("screening_tokens"))
+            return counts, len(counts) - undecided
+        
+        counts, rescreened = await _token_counts()
+        if None in counts:
+            # Uploaded before screening texts were compiled: count those studies from their text
+            counts, rescreened = await _token_counts(",title,abstract,keywords")
+        
+        prompt = CriteriaPrompt(criteria)
+        if self.batch_mode:
+            requests, system_tokens = len(pack_token_counts(counts)), prompt.batch_tokens
+        else:
+            requests, system_tokens = len(counts), prompt.single_tokens
+        prompt_tokens = sum(counts) + requests * system_tokens
+        completion_tokens = len(counts) * ANSWER_TOKENS_PER_STUDY
+        estimate = {
+            "studies": len(counts),
+            "rescreened": rescreened,  # of the studies, decided ones the criteria edit would reset
+            "mode": "batch" if self.batch_mode else "single",
+            "max_study_tokens": max(counts, default=0),
+            **self._estimate_run(requests, prompt_tokens, completion_tokens)
+        }
+        if self.cascade_mode:
+            # Every study goes through the first tier; at most, every one of them through every tier
+            tiers = len(CASCADE_MODELS)
+            estimate["cascade_max"] = self._estimate_run(requests * tiers, prompt_tokens * tiers, completion_tokens * tiers)
+        return estimate
+    
+    def _estimate_run(self, requests: int, prompt_tokens: int, completion_tokens: int) -> Dict:
+        """Cost, and the duration allowed by the job's workers and the API keys' rate limits"""
+        keys = len(get_agent_api_keys())
+        concurrency = min(self.workers_per_job, self.worker_slots.slots or self.workers_per_job)
+        answer_seconds = completion_tokens / max(requests, 1) / self.estimate_output_tokens_per_second
+        seconds = requests * (self.estimate_request_seconds + answer_seconds) / concurrency
+        if LLM_REQUESTS_PER_MINUTE:
+            seconds = max(seconds, requests / (LLM_REQUESTS_PER_MINUTE * keys) * 60)
+        if LLM_TOKENS_PER_MINUTE:
+            seconds = max(seconds, (prompt_tokens + completion_tokens) / (LLM_TOKENS_PER_MINUTE * keys) * 60)
+        return {
+            "requests": requests,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost_usd": round(llm_cost_usd(prompt_tokens, completion_tokens), 4),
+            "eta_seconds": round(seconds, 1)
+        }
+    
+    async def resume_jobs(self) -> int:
+        """Reload persisted jobs and restart the unfinished ones from their last checkpoint"""
+        resumed = 0
+        for job in await self.job_store.load_jobs():
+            self.jobs[job["id"]] = job
+            self.status_counts[job["status"]] += 1
+            if job["status"] not in (JobStatus.PENDING, JobStatus.PROCESSING):
+                continue
+            if self.broker is not None:
+                # The workers still have the job (and hold its claims); keep following it
+                self._follow(job["id"])
+                resumed += 1
+                continue
+            
+            # Claims held by workers of the previous process will never be written back
+            db = await self._get_db()
+            await db.release_job_claims(job["id"])
+            self.submit(job, job["priority"])
+            resumed += 1
+        return resumed
+    
+    def forget_job(self, job_id: str):
+        """Drop a job that is not running from memory (on a worker, once the broker has retired it)"""
+        job = self.jobs.pop(job_id, None)
+        if job is not None:
+            self.status_counts[job["status"]] -= 1
+        self._rankers.pop(job_id, None)
+    
+    def is_scheduled(self, job_id: str) -> bool:
+        """Whether the job is running or waiting for admission, here or (dispatched) on the broker's workers"""
+        return (
+            job_id in self._admitted
+            or job_id in self._remote_jobs
+            or job_id in self._waiting_entries
+        )
+    
+    def submit(self, job: Dict, priority: int = 0) -> Optional[int]:
+        """Start the job if fewer than max_concurrent_jobs are running, else queue it; returns its queue position"""
+        job["priority"] = priority
+        if len(self._admitted) < self.max_concurrent_jobs:
+            self._admit(job)
+            return None
+        entry = self._waiting_entries[job["id"]] = (-priority, next(self._arrivals), job["id"])
+        bisect.insort(self._waiting, entry)
+        if job["status"] != JobStatus.PENDING:
+            # A job resumed after a restart waits like any other
+            self._set_status(job["id"], JobStatus.PENDING)
+        self.progress_hub.notify(job["id"])
+        return self.queue_position(job["id"])
+    
+    def _admit(self, job: Dict):
+        task = asyncio.create_task(self.process_job(job))
+        self._admitted[job["id"]] = task
+        task.add_done_callback(lambda _: self._on_job_done(job["id"]))
+    
+    def _on_job_done(self, job_id: str):
+        self._admitted.pop(job_id, None)
+        self._rankers.pop(job_id, None)
+        while self._waiting and len(self._admitted) < self.max_concurrent_jobs:
+            _, _, next_id = self._waiting.pop(0)
+            del self._waiting_entries[next_id]
+            self._admit(self.jobs[next_id])
+        # Everyone still waiting has moved up
+        for _, _, waiting_id in self._waiting:
+            self.progress_hub.notify(waiting_id)
+    
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """1 for the next job to be admitted, None unless the job is waiting"""
+        entry = self._waiting_entries.get(job_id)
+        return bisect.bisect_left(self._waiting, entry) + 1 if entry is not None else None
+    
+    def _start_estimates(self) -> Dict[str, Optional[float]]:
+        """Rough seconds until each waiting job is admitted, from the running jobs' ETAs"""
+        running = [self.jobs[job_id] for job_id in self._admitted]
+        rates = [rate for rate in (self._seconds_per_study(job) for job in running) if rate is not None]
+        waiting = [waiting_id for _, _, waiting_id in self._waiting]
+        starts = estimate_start_times(
+            [self._eta_seconds(job) for job in running],
+            [self.jobs[job_id]["total_studies"] for job_id in waiting],
+            sum(rates) / len(rates) if rates else None,
+            self.max_concurrent_jobs
+        )
+        return dict(zip(waiting, starts))
+    
+    @staticmethod
+    def _seconds_per_study(job: Dict) -> Optional[float]:
+        """The job's screening pace in its current attempt"""
+        if not job["run_started"] or job["status"] != JobStatus.PROCESSING:
+            return None
+        started_at, started_count = job["run_started"]
+        done = job["processed_studies"] - started_count
+        elapsed = time.monotonic() - started_at
+        return elapsed / done if done > 0 and elapsed > 0 else None
+    
+    def _eta_seconds(self, job: Dict) -> Optional[float]:
+        seconds_per_study = self._seconds_per_study(job)
+        if seconds_per_study is None:
+            return None
+        return round(max(job["total_studies"] - job["processed_studies"], 0) * seconds_per_study, 1)
+        
+    async def process_job(self, job: Dict):
+        """Process a job using AI agents with retry logic"""
+        job_id = job["id"]
+        self.active_jobs[job_id] = job
+        self.worker_slots.register(job_id, weight=1 + job["priority"])
+        try:
+            await self._attempt_job(job_id)
+        finally:
+            # Remove from active jobs when done
+            self.active_jobs.pop(job_id, None)
+            self.worker_slots.unregister(job_id)
+            self._stopping.pop(job_id, None)
+    
+    async def _attempt_job(self, job_id: str):
+        while self.jobs[job_id]["retry_count"] < self.max_retries:
+            try:
+                self._set_status(job_id, JobStatus.PROCESSING)
+                self.jobs[job_id]["run_started"] = (time.monotonic(), self.jobs[job_id]["processed_studies"])
+                self.jobs[job_id]["processing_history"].append({
+                    "attempt": self.jobs[job_id]["retry_count"] + 1,
+                    "started_at": datetime.utcnow(),
+                    "status": JobStatus.PROCESSING
+                })
+                await self.job_store.save_job(self.jobs[job_id])
+                
+                # Resolve the obvious exclusions lexically, rank the rest, then screen every
+                # remaining undecided study with a pool of concurrent workers
+                await self._prefilter(job_id)
+                await self._rank(job_id)
+                await self._run_workers(job_id)
+                
+                # If we get here, processing was successful
+                self._set_status(job_id, JobStatus.COMPLETED)
+                self._update_processing_history(job_id, JobStatus.COMPLETED)
+                await self.job_store.save_job(self.jobs[job_id])
+                break
+                
+            except Exception as e:
+                await self._handle_processing_error(job_id, e)
+    
+    async def dispatch(self, job: Dict):
+        """Publish a job to the broker for the worker processes"""
+        criteria = job["criteria"]
+        await self.broker.enqueue({
+            "job_id": job["id"],
+            "criteria": {"inclusion": criteria.inclusion, "exclusion": criteria.exclusion},
+            "criteria_version": job["criteria_version"],
+            "total_studies": job["total_studies"],
+            "enqueued_at": time.time()
+        })
+        # The workers count from the decisions kept since the last run
+        kept = {decision: len(study_ids) for decision, study_ids in job["results"].items() if study_ids}
+        if kept:
+            await self.broker.increment(job["id"], {"processed_studies": sum(kept.values()), **kept})
+        self._follow(job["id"])
+    
+    def _follow(self, job_id: str):
+        self._remote_jobs.add(job_id)
+        if self._follower is None or self._follower.done():
+            self._follower = asyncio.create_task(self._follow_remote_jobs())
+    
+    async def _follow_remote_jobs(self):
+        """Mirror the broker's progress of dispatched jobs into the local job dicts (and SSE subscribers)"""
+        while self._remote_jobs:
+            for job_id in list(self._remote_jobs):
+                try:
+                    remote = await self.broker.get_status(job_id)
+                    if remote is None:
+                        # The broker lost the job (e.g. an in-memory broker restarted): publish it again
+                        await self.dispatch(self.jobs[job_id])
+                        continue
+                    await self._apply_remote_status(job_id, remote)
+                except Exception as e:
+                    self.jobs[job_id]["last_error"] = str(e)
+            await asyncio.sleep(self.progress_hub.min_interval)
+    
+    async def _apply_remote_status(self, job_id: str, remote: Dict):
+        job = self.jobs[job_id]
+        job["cache_hits"] = remote["cache_hits"]
+        job["dead_letters"] = remote["dead_letters"]
+        job["remote_counts"] = {decision: remote[decision] for decision in job["results"]}
+        job["prefilter"] = remote.get("prefilter") or job["prefilter"]
+        job["last_error"] = remote.get("last_error") or job["last_error"]
+        if remote["processed_studies"] != job["processed_studies"]:
+            await self.update_progress(job_id, remote["processed_studies"])
+        
+        status = JobStatus(remote["status"])
+        if status == JobStatus.PENDING and remote.get("started_at"):
+            status = JobStatus.PROCESSING
+        if status == job["status"]:
+            return
+        self._set_status(job_id, status)
+        if status == JobStatus.PROCESSING:
+            job["run_started"] = (time.monotonic(), job["processed_studies"])
+            job["processing_history"].append({"attempt": 1, "started_at": datetime.utcnow(), "status": status})
+        elif status in (JobStatus.COMPLETED, JobStatus.FAILED):
+            self._update_processing_history(job_id, status, job["last_error"] if status == JobStatus.FAILED else None)
+            self._remote_jobs.discard(job_id)
+        await self.job_store.save_job(job)
+    
+    async def _get_db(self) -> Database:
+        return self.db or await get_db()
+    
+    async def _prefilter(self, job_id: str):
+        """Exclude studies that clearly match an exclusion criterion before any LLM call"""
+        job = self.jobs[job_id]
+        prefilter = LexicalPrefilter.from_env(job["criteria"])
+        if prefilter is None or not prefilter.can_exclude or job["prefilter"] is not None:
+            return
+        
+        started = time.perf_counter()
+        db = await self._get_db()
+        with TRACER.span(job_id, "prefilter_score"):
+            async for study in db.iter_undecided_studies(job_id):
+                prefilter.add(study["id"], study.get("title"), study.get("abstract"))
+        scored_at = time.perf_counter()
+        
+        excluded = 0
+        for phrase, study_ids in prefilter.exclusions().items():
+            with TRACER.span(job_id, "prefilter_save", studies=len(study_ids)):
+                await db.save_decisions(study_ids, prefilter.result_for(phrase), criteria_version=job["criteria_version"])
+            job["results"]["exclude"].extend(study_ids)
+            excluded += len(study_ids)
+            DECISIONS.labels("exclude", "prefilter").inc(len(study_ids))
+            await self.update_progress(job_id, job["processed_studies"] + len(study_ids))
+            await self.job_store.record_results(job, study_ids, "exclude")
+        
+        STAGE_SECONDS.labels("prefilter").observe(time.perf_counter() - started)
+        job["prefilter"] = {
+            "scored": len(prefilter),
+            "auto_excluded": excluded,
+            # One call per study in single mode, one per claimed batch in batch mode
+            "llm_calls_saved": math.ceil(excluded / self.claim_batch_size) if self.batch_mode else excluded,
+            "score_seconds": round(scored_at - started, 3),
+            "total_seconds": round(time.perf_counter() - started, 3)
+        }
+        await self.job_store.save_job(job)
+    
+    async def _rank(self, job_id: str):
+        """Load the job's term features and rank its undecided studies, learning from any decisions already made"""
+        if not self.relevance_ranking:
+            return
+        job = self.jobs[job_id]
+        ranker = self._rankers.get(job_id)
+        if ranker is not None and job["ranking"] is ranker.stats:
+            # Ranked already in this run: a retry, or a worker back for the studies other workers had leased
+            return
+        db = await self._get_db()
+        ranker = RelevanceRanker(job["criteria"])
+        undecided = 0
+        with TRACER.span(job_id, "rank_load"):
+            async for study in db.iter_decided_studies(job_id, columns="id,decision,terms"):
+                ranker.add(study["id"], study.get("terms"), study["decision"])
+            async for study in db.iter_undecided_studies(job_id, columns="id,terms"):
+                ranker.add(study["id"], study.get("terms"))
+                undecided += 1
+        if not undecided:
+            return
+        with STAGE_SECONDS.labels("rank").time(), TRACER.span(job_id, "rank", studies=len(ranker)):
+            await asyncio.to_thread(ranker.build)
+        self._rankers[job_id] = ranker
+        job["ranking"] = ranker.stats
+    
+    async def _ranked_candidates(self, job_id: str, size: int) -> Optional[List[str]]:
+        """The next studies in rank order for one claim, or None to claim in id order (unranked, or ranking used up)"""
+        ranker = self._rankers.get(job_id)
+        if ranker is None:
+            return None
+        if ranker.start_rerank():
+            with STAGE_SECONDS.labels("rank").time(), TRACER.span(job_id, "rerank"):
+                await asyncio.to_thread(ranker.rerank)
+        if ranker.should_stop():
+            self._stopping[job_id] = asyncio.ensure_future(self._apply_stopping_rule(job_id, ranker.stop()))
+        if job_id in self._stopping:
+            # Nothing else is claimed while the rest of the ranking is being excluded
+            await asyncio.shield(self._stopping[job_id])
+        return ranker.take(size) or None
+    
+    async def _apply_stopping_rule(self, job_id: str, study_ids: List[str]):
+        """Exclude the studies ranked below the stopping point without screening them"""
+        job = self.jobs[job_id]
+        ranker = self._rankers[job_id]
+        db = await self._get_db()
+        try:
+            with TRACER.span(job_id, "stopping_rule", studies=len(study_ids)):
+                await db.save_decisions(study_ids, ranker.stop_result(), criteria_version=job["criteria_version"])
+        except Exception:
+            # Give the studies back to the ranking, so the retry ranks them and can stop again
+            ranker.resume(study_ids)
+            self._stopping.pop(job_id, None)
+            raise
+        job["results"]["exclude"].extend(study_ids)
+        DECISIONS.labels("exclude", "stopping_rule").inc(len(study_ids))
+        await self.update_progress(job_id, job["processed_studies"] + len(study_ids))
+        await self.job_store.record_results(job, study_ids, "exclude")
+    
+    async def _run_workers(self, job_id: str):
+        """Run the job's screening workers until no undecided studies can be claimed"""
+        db = await self._get_db()
+        if self.cascade_mode:
+            # Every worker screens through the one cascade, which spreads each tier over its agents
+            cascade = self.cascade_factory(self.jobs[job_id]["criteria"])
+            cascade.resume_stats(self.jobs[job_id]["cascade"])
+            self.jobs[job_id]["agents"].extend(cascade.agents)
+            self.jobs[job_id]["cascade"] = cascade.stats
+            agents = [cascade]
+        else:
+            agents = self.agent_factory(self.jobs[job_id]["criteria"])
+            self.jobs[job_id]["agents"].extend(agents)
+        # The cascade's model names its tiers and threshold, so its decisions are cached apart
+        criteria_key = criteria_fingerprint(self.jobs[job_id]["criteria"], getattr(agents[0], "model", ""))
+        
+        # Workers share the agents (one per API key) round-robin
+        workers = [
+            asyncio.create_task(
+                self._screening_worker(job_id, f"{job_id}:worker-{i + 1}", agents[i % len(agents)], db, criteria_key)
+            )
+            for i in range(self.workers_per_job)
+        ]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            # One failing worker stops the attempt; the others hand back their claims
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+    
+    async def _screening_worker(self, job_id: str, worker_id: str, agent, db: Database, criteria_key: str):
+        """Loop claim → screen → write back until the job has nothing left to claim"""
+        self.active_workers += 1
+        job = self.jobs[job_id]
+        claim_size = AdaptiveClaimSize(self.claim_batch_size, lease_seconds=db.lease_seconds)
+        try:
+            while True:
+                # A worker only claims again once its previous batch is written back,
+                # so claimed studies never sit idle behind a busy LLM call
+                size = claim_size.next_size(self._remaining_share(job))
+                candidates = await self._ranked_candidates(job_id, size)
+                with TRACER.span(job_id, "claim", worker=worker_id, size=size):
+                    studies = await db.get_unclaimed_studies(size, job_id=job_id, worker_id=worker_id, study_ids=candidates)
+                self._count_claim(job, size, studies)
+                if not studies:
+                    if candidates:
+                        continue  # Decided or claimed elsewhere in the meantime: on to the next ranked studies
+                    return
+                
+                # Leases are extended while the studies are screened; a study whose lease was
+                # lost in the meantime belongs to another worker and is not written back
+                started = time.perf_counter()
+                pending = {study["id"] for study in studies}
+                beat = asyncio.create_task(heartbeat(
+                    lambda study_ids: db.extend_leases(worker_id, study_ids),
+                    pending,
+                    db.lease_seconds / 3,
+                    lambda lost: self._count_lost_leases(job, len(lost))
+                ))
+                try:
+                    async for study, result in self._screen_studies(job_id, agent, studies, criteria_key):
+                        if study["id"] not in pending:
+                            continue
+                        if isinstance(result, StudyScreeningError):
+                            # Given up on: set aside without a decision, the rest of the job goes on
+                            saved = await db.dead_letter_study(study["id"], str(result), worker_id)
+                            pending.discard(study["id"])
+                            if saved:
+                                await self._record_dead_letter(job, result)
+                            else:
+                                self._count_lost_leases(job, 1)
+                            continue
+                        with STAGE_SECONDS.labels("save").time(), TRACER.span(job_id, "save", worker=worker_id):
+                            saved = await db.save_decision(study["id"], result, worker_id, job["criteria_version"])
+                        pending.discard(study["id"])
+                        if saved:
+                            await self._record_result(job_id, study["id"], result)
+                        else:
+                            self._count_lost_leases(job, 1)
+                except BaseException:
+                    await db.release_studies(list(pending))
+                    raise
+                finally:
+                    beat.cancel()
+                claim_size.observe(len(studies), time.perf_counter() - started)
+        finally:
+            self.active_workers -= 1
+    
+    def _remaining_share(self, job: Dict) -> int:
+        """This claim loop's share of the job's undecided studies, across every worker process when known"""
+        shared = job["shared_progress"]
+        if shared:
+            return remaining_share(job["total_studies"], shared["processed_studies"], shared["claim_loops"])
+        return remaining_share(job["total_studies"], job["processed_studies"], self.workers_per_job)
+    
+    @staticmethod
+    def _count_claim(job: Dict, size: int, studies: List[Dict]):
+        claims = job["claims"]
+        claims["requests"] += 1
+        claims["last_size"] = size
+        if not studies:
+            claims["empty"] += 1
+        elif len(studies) < size:
+            claims["partial"] += 1
+        claims["reclaimed"] += sum(1 for study in studies if study.get("reclaimed"))
+    
+    @staticmethod
+    def _count_lost_leases(job: Dict, count: int):
+        job["claims"]["lost_leases"] += count
+    
+    async def _screen_studies(
+        self, job_id: str, agent, studies: List[Dict], criteria_key: str
+    ) -> AsyncIterator[Tuple[Dict, Union[ScreeningResult, StudyScreeningError]]]:
+        """
+        Yield a decision per claimed study: cached ones first, then from the LLM one by one or in packed batches.
+        A study the agent gave up on comes with its StudyScreeningError instead.
+        """
+        uncached = []
+        for study in studies:
+            result = await self._cached_decision(job_id, study, criteria_key)
+            if result is not None:
+                DECISIONS.labels(result.decision.value, "cache").inc()
+                yield study, result
+            else:
+                uncached.append(study)
+        
+        if not self.batch_mode:
+            for study in uncached:
+                # Every LLM call holds one of the global worker slots, shared fairly between running jobs
+                try:
+                    async with self.worker_slots.slot(job_id):
+                        with STAGE_SECONDS.labels("screen").time(), TRACER.span(job_id, "screen", agent=agent.name, studies=1):
+                            result = await agent.screen(study)
+                except StudyScreeningError as error:
+                    yield study, error
+                    continue
+                DECISIONS.labels(result.decision.value, "llm").inc()
+                await self._cache_decision(study, result, criteria_key)
+                yield study, result
+            return
+        
+        for batch in pack_batches(uncached):
+            async with self.worker_slots.slot(job_id):
+                with STAGE_SECONDS.labels("screen").time(), TRACER.span(job_id, "screen", agent=agent.name, studies=len(batch)):
+                    results = await agent.screen_batch(batch)
+            for study in batch:
+                if isinstance(results[study["id"]], StudyScreeningError):
+                    yield study, results[study["id"]]
+                    continue
+                DECISIONS.labels(results[study["id"]].decision.value, "llm").inc()
+                await self._cache_decision(study, results[study["id"]], criteria_key)
+                yield study, results[study["id"]]
+    
+    async def _cached_decision(self, job_id: str, study: Dict, criteria_key: str) -> Optional[ScreeningResult]:
+        """Answer from the decision cache when these criteria have seen the study before"""
+        if self.decision_cache is None:
+            return None
+        result = await self.decision_cache.get(self.decision_cache.make_key(criteria_key, study))
+        if result is not None:
+            self.jobs[job_id]["cache_hits"] += 1
+        return result
+    
+    async def _cache_decision(self, study: Dict, result: ScreeningResult, criteria_key: str):
+        if self.decision_cache is not None:
+            await self.decision_cache.set(self.decision_cache.make_key(criteria_key, study), result)
+    
+    async def _record_result(self, job_id: str, study_id: str, result: ScreeningResult):
+        """Stream a finished decision into the job's results and progress"""
+        job = self.jobs[job_id]
+        job["results"][result.decision.value].append(study_id)
+        if job_id in self._rankers:
+            self._rankers[job_id].observe(study_id, result.decision.value)
+        await self.update_progress(job_id, job["processed_studies"] + 1)
+        await self.job_store.record_results(job, [study_id], result.decision.value)
+    
+    async def _record_dead_letter(self, job: Dict, error: StudyScreeningError):
+        job["dead_letters"] += 1
+        DEAD_LETTERS.labels("retries_exhausted" if error.transient else "unusable").inc()
+        self.progress_hub.notify(job["id"])
+        await self.job_store.record_dead_letters(job, 1)
+    
+    async def _handle_processing_error(self, job_id: str, error: Exception):
+        """
+        Handle errors that stop a whole attempt (database outages, a rejected API key) with exponential
+        backoff. LLM errors on single studies are retried by the agents and never get here.
+        """
+        self.jobs[job_id]["retry_count"] += 1
+        self.jobs[job_id]["last_error"] = str(error)
+        self._update_processing_history(job_id, JobStatus.FAILED, error)
+        
+        if self.jobs[job_id]["retry_count"] >= self.max_retries:
+            self._set_status(job_id, JobStatus.FAILED)
+        await self.job_store.save_job(self.jobs[job_id])
+        
+        if self.jobs[job_id]["status"] != JobStatus.FAILED:
+            # Exponential backoff for retries
+            retry_delay = self.retry_delay * (2 ** (self.jobs[job_id]["retry_count"] - 1))
+            await asyncio.sleep(retry_delay)
+    
+    def _set_status(self, job_id: str, status: JobStatus):
+        job = self.jobs[job_id]
+        self.status_counts[job["status"]] -= 1
+        self.status_counts[status] += 1
+        job["status"] = status
+        self.progress_hub.notify(job_id)
+    
+    def _update_processing_history(self, job_id: str, status: JobStatus, error: Exception = None):
+        """Update the processing history for a job"""
+        if self.jobs[job_id]["processing_history"]:
+            current_attempt = self.jobs[job_id]["processing_history"][-1]
+            current_attempt.update({
+                "completed_at": datetime.utcnow(),
+                "status": status,
+                "error": str(error) if error else None
+            })
+    
+    async def update_progress(self, job_id: str, processed_count: int):
+        """Update job progress"""
+        if job_id not in self.jobs:
+            raise KeyError(f"Job {job_id} not found")
+            
+        job = self.jobs[job_id]
+        job["processed_studies"] = processed_count
+        if job["total_studies"]:
+            job["progress"] = round((processed_count / job["total_studies"]) * 100, 2)
+        self.progress_hub.notify(job_id)
+    
+    def progress_snapshot(self, job_id: str) -> Dict:
+        """O(1) progress view for streaming: counters, per-decision counts and ETA, no history"""
+        job = self.jobs[job_id]
+        # Only a waiting job has a queue position (found in the short admission queue)
+        position = self.queue_position(job_id) if job["status"] == JobStatus.PENDING else None
+        return {
+            "status": job["status"],
+            "progress": job["progress"],
+            "processed_studies": job["processed_studies"],
+            "total_studies": job["total_studies"],
+            "decision_counts": self._decision_counts(job),
+            "cache_hits": job["cache_hits"],
+            "dead_letters": job["dead_letters"],
+            "eta_seconds": self._eta_seconds(job),
+            "queue_position": position,
+            "start_eta_seconds": self._start_estimates().get(job_id) if position else None,
+            "last_error": job["last_error"]
+        }
+    
+    @staticmethod
+    def _decision_counts(job: Dict) -> Dict[str, int]:
+        """Per-decision counts: the broker's for dispatched jobs, else the recorded study ids"""
+        return job["remote_counts"] or {decision: len(ids) for decision, ids in job["results"].items()}
+    
+    def stream_progress(self, job_id: str) -> AsyncIterator[Dict]:
+        """Coalesced, rate-limited progress deltas for one job until it finishes"""
+        if job_id not in self.jobs:
+            raise KeyError(f"Job {job_id} not found")
+        return self.progress_hub.subscribe(job_id, lambda: self.progress_snapshot(job_id))
+            
+    async def get_job_status(self, job_id: str) -> Dict:
+        """Get detailed status of a job"""
+        if job_id not in self.jobs:
+            raise KeyError(f"Job {job_id} not found")
+            
+        job = self.jobs[job_id]
+        return {
+            "status": job["status"],
+            "progress": job["progress"],
+            "processed_studies": job["processed_studies"],
+            "total_studies": job["total_studies"],
+            "scheduling": self._get_scheduling(job),
+            "cache_hits": job["cache_hits"],
+            "dead_letters": job["dead_letters"],
+            "rescreen": job["rescreen"],
+            "prefilter": job["prefilter"],
+            "cascade": job["cascade"],
+            "ranking": self._ranking_status(job),
+            "claims": job["claims"],
+            "created_at": job["created_at"],
+            "retry_count": job["retry_count"],
+            "last_error": job["last_error"],
+            "decision_counts": self._decision_counts(job),
+            "throughput": self._get_throughput(job),
+            "processing_history": job["processing_history"]
+        }
+        
+    def _ranking_status(self, job: Dict) -> Optional[Dict]:
+        ranker = self._rankers.get(job["id"])
+        if ranker is not None:
+            ranker.estimated_recall()  # Kept up to date in the stats even when the stopping rule is off
+        return job["ranking"]
+    
+    def _get_scheduling(self, job: Dict) -> Dict:
+        """Priority, place in the admission queue and estimated start (waiting jobs), worker slots held (running jobs)"""
+        position = self.queue_position(job["id"]) if job["status"] == JobStatus.PENDING else None
+        start_in = self._start_estimates().get(job["id"]) if position else None
+        return {
+            "priority": job["priority"],
+            "queue_position": position,
+            "estimated_start_at": datetime.utcnow() + timedelta(seconds=start_in) if start_in is not None else None,
+            "worker_slots": self.worker_slots.in_use_by(job["id"])
+        }
+    
+    def _get_throughput(self, job: Dict) -> Dict:
+        """Studies/minute over the job's screening time and LLM tokens per screened study"""
+        usage = {"requests": 0, "studies": 0, "prompt_tokens": 0, "completion_tokens": 0, "retries": 0}
+        for agent in job["agents"]:
+            for key, value in getattr(agent, "usage", {}).items():
+                usage[key] = usage.get(key, 0) + value
+        
+        minutes = 0.0
+        if job["processing_history"]:
+            started = job["processing_history"][0]["started_at"]
+            finished = job["processing_history"][-1].get("completed_at") or datetime.utcnow()
+            minutes = (finished - started).total_seconds() / 60
+        tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+        return {
+            "mode": "batch" if self.batch_mode else "single",
+            "studies_per_minute": round(job["processed_studies"] / minutes, 2) if minutes else 0.0,
+            "tokens_per_study": round(tokens / usage["studies"], 1) if usage["studies"] else 0.0,
+            "studies_per_request": round(usage["studies"] / usage["requests"], 2) if usage["requests"] else 0.0,
+            **usage
+        }
+    
+    async def get_job_results(
+        self, job_id: str, format: str, decision: Optional[str] = None, include_duplicates: bool = False
+    ) -> AsyncIterator[bytes]:
+        """Stream the job's screened studies as RIS, JSON Lines or Excel"""
+        if job_id not in self.jobs:
+            raise KeyError(f"Job {job_id} not found")
+        return export_results(await self._get_db(), job_id, format, decision, include_duplicates)
+    
+    async def get_agent_status(self) -> Dict:
+        """Get status of all AI agents"""
+        return {
+            "total_agents": self._total_agents(),
+            "cascade": {
+                "tiers": CASCADE_MODELS,
+                "confidence_threshold": CASCADE_CONFIDENCE_THRESHOLD
+            } if self.cascade_mode else None,
+            "active_agents": len(self.active_jobs),
+            "active_workers": self.active_workers,
+            "queue_length": len(self.jobs),
+            "running_jobs": len(self._admitted),
+            "waiting_jobs": len(self._waiting),
+            "worker_slots": self.worker_slots.stats(),
+            "rate_limits": rate_limiter_stats(),
+            "progress_subscribers": self.progress_hub.subscriber_count(),
+            "jobs_by_status": self._get_jobs_by_status()
+        }
+    
+    def _total_agents(self) -> int:
+        """Screening agents per job as configured (one per API key, per cascade tier), plus the reporting agent"""
+        keys = len(get_agent_api_keys())
+        return keys * (len(CASCADE_MODELS) if self.cascade_mode else 1) + 1
+    
+    def _get_jobs_by_status(self) -> Dict:
+        """Get count of jobs in each status (kept incrementally by _set_status)"""
+        return dict(self.status_counts) 
\ No newline at end of file
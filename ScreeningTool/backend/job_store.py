@@ -0,0 +1,360 @@
+"""
+Durable job store behind JobQueue
+---------------------------------
+
+JobQueue keeps every job in memory so status reads are O(1). The job store
+is the write-through copy that survives a restart:
+
+- MemoryJobStore: keeps nothing (the previous behaviour)
+- SQLiteJobStore: a local SQLite file in WAL mode. Each decided study is
+  checkpointed as it is recorded (its id and decision, plus the job's
+  counters) in one small transaction
+- SupabaseJobStore: a `screening_jobs` table. Decisions are already durable
+  in `studies`, so only the job row is written, with the counters throttled
+  to one PATCH per JOB_CHECKPOINT_INTERVAL seconds
+
+On startup JobQueue reloads the jobs and resumes the unfinished ones. The
+claim RPC only hands out undecided studies, so only unscreened studies are
+processed again.
+
+Uploads are recorded too (save_ingest), when they start and when they end,
+so /api/screen can tell a finished upload from a lost one after a restart.
+An upload still running when the process stopped is reloaded as failed.
+
+Configured with JOB_STORE (sqlite | supabase | memory) and JOB_STORE_PATH.
+"""
+
+from typing import Dict, List, Optional
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from models import IngestStatus, JobStatus, ScreeningCriteria
+from database import get_db
+
+MAX_SAVED_INGEST_ERRORS = 100  # record errors kept with a saved upload
+
+
+def _encode(value) -> str:
+    """JSON, with datetimes as ISO 8601"""
+    return json.dumps(value, default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value))
+
+
+def _decode_history(payload: Optional[str]) -> List[Dict]:
+    history = json.loads(payload or "[]")
+    for attempt in history:
+        for key in ("started_at", "completed_at"):
+            if attempt.get(key):
+                attempt[key] = datetime.fromisoformat(attempt[key])
+        if attempt.get("status"):
+            attempt["status"] = JobStatus(attempt["status"])
+    return history
+
+
+def job_row(job: Dict) -> Dict:
+    """The persisted columns of a job (agents and other runtime state are left out)"""
+    return {
+        "id": job["id"],
+        "status": job["status"].value,
+        "criteria": json.dumps({"inclusion": job["criteria"].inclusion, "exclusion": job["criteria"].exclusion}),
+        "created_at": job["created_at"].isoformat(),
+        "total_studies": job["total_studies"],
+        "processed_studies": job["processed_studies"],
+        "progress": job["progress"],
+        "cache_hits": job["cache_hits"],
+        "retry_count": job["retry_count"],
+        "last_error": job["last_error"],
+        "prefilter": json.dumps(job["prefilter"]),
+        "processing_history": _encode(job["processing_history"]),
+        "criteria_version": job["criteria_version"],
+        "rescreen": json.dumps(job["rescreen"]),
+        "priority": job["priority"],
+        "dead_letters": job["dead_letters"],
+        "cascade": json.dumps(job["cascade"]),
+        "ranking": json.dumps(job["ranking"])
+    }
+
+
+def job_from_row(row: Dict, results: Dict[str, List[str]]) -> Dict:
+    """Rebuild the in-memory job dict from its persisted row and decided studies"""
+    criteria = row["criteria"] if isinstance(row["criteria"], dict) else json.loads(row["criteria"])
+    prefilter = row.get("prefilter")
+    rescreen = row.get("rescreen")
+    cascade = row.get("cascade")
+    ranking = row.get("ranking")
+    return {
+        "id": row["id"],
+        "status": JobStatus(row["status"]),
+        "criteria": ScreeningCriteria(**criteria),
+        "criteria_version": row.get("criteria_version") or 1,
+        "rescreen": json.loads(rescreen) if isinstance(rescreen, str) else rescreen,
+        "created_at": datetime.fromisoformat(row["created_at"]),
+        "progress": row["progress"] or 0,
+        "total_studies": row["total_studies"] or 0,
+        "processed_studies": row["processed_studies"] or 0,
+        "cache_hits": row["cache_hits"] or 0,
+        "dead_letters": row.get("dead_letters") or 0,
+        "prefilter": json.loads(prefilter) if isinstance(prefilter, str) else prefilter,
+        "priority": row.get("priority") or 0,
+        "agents": [],
+        # Counters of the runs so far: the cascade carries on from them, the ranking is rebuilt
+        # from the decided studies when the job resumes
+        "cascade": json.loads(cascade) if isinstance(cascade, str) else cascade,
+        "ranking": json.loads(ranking) if isinstance(ranking, str) else ranking,
+        "claims": new_claim_stats(),
+        "remote_counts": None,
+        "shared_progress": None,
+        "retry_count": row["retry_count"] or 0,
+        "last_error": row["last_error"],
+        "results": results,
+        "processing_history": _decode_history(row["processing_history"]),
+        "run_started": None
+    }
+
+
+def ingest_row(ingest: Dict) -> Dict:
+    """The persisted columns of an upload: its status, and the rest of its progress as JSON"""
+    return {
+        "job_id": ingest["job_id"],
+        "status": ingest["status"].value,
+        "ingest": _encode({**ingest, "status": None, "errors": ingest["errors"][:MAX_SAVED_INGEST_ERRORS]})
+    }
+
+
+def ingest_from_row(row: Dict) -> Dict:
+    """Rebuild an upload's progress; one that was still running when the process stopped has failed"""
+    ingest = json.loads(row["ingest"])
+    ingest["status"] = IngestStatus(row["status"])
+    for key in ("started_at", "completed_at"):
+        if ingest.get(key):
+            ingest[key] = datetime.fromisoformat(ingest[key])
+    if ingest["status"] in (IngestStatus.QUEUED, IngestStatus.RUNNING):
+        ingest["status"] = IngestStatus.FAILED
+        ingest["error"] = "Interrupted by a restart; upload the files again"
+    return ingest
+
+
+def new_claim_stats() -> Dict:
+    """Per-job claim counters (runtime only, they start again after a restart)"""
+    return {"requests": 0, "empty": 0, "partial": 0, "reclaimed": 0, "lost_leases": 0, "last_size": None}
+
+
+def _empty_results() -> Dict[str, List[str]]:
+    return {"include": [], "exclude": [], "maybe": []}
+
+
+class MemoryJobStore:
+    """Nothing is persisted; jobs are lost on restart"""
+
+    async def save_job(self, job: Dict) -> None:
+        pass
+
+    async def record_results(self, job: Dict, study_ids: List[str], decision: str) -> None:
+        pass
+
+    async def record_dead_letters(self, job: Dict, count: int) -> None:
+        pass
+
+    async def replace_results(self, job: Dict) -> None:
+        """Checkpoint the job's recorded results from scratch, e.g. after decisions were reset"""
+        pass
+
+    async def load_jobs(self) -> List[Dict]:
+        return []
+
+    async def save_ingest(self, ingest: Dict) -> None:
+        pass
+
+    async def load_ingests(self) -> List[Dict]:
+        return []
+
+    def close(self):
+        pass
+
+
+class SQLiteJobStore(MemoryJobStore):
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, criteria TEXT NOT NULL, created_at TEXT NOT NULL,"
+            " total_studies INTEGER, processed_studies INTEGER, progress REAL, cache_hits INTEGER,"
+            " retry_count INTEGER, last_error TEXT, prefilter TEXT, processing_history TEXT, updated_at REAL,"
+            " criteria_version INTEGER, rescreen TEXT, priority INTEGER, dead_letters INTEGER, cascade TEXT,"
+            " ranking TEXT)"
+        )
+        # Files created by earlier versions, with fewer columns
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (
+            ("criteria_version", "INTEGER"), ("rescreen", "TEXT"), ("priority", "INTEGER"),
+            ("dead_letters", "INTEGER"), ("cascade", "TEXT"), ("ranking", "TEXT")
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingests (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, ingest TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_results ("
+            " job_id TEXT NOT NULL, study_id TEXT NOT NULL, decision TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, study_id))"
+        )
+        self._conn.commit()
+
+    async def save_job(self, job: Dict) -> None:
+        await asyncio.to_thread(self._save_job, job_row(job))
+
+    async def record_results(self, job: Dict, study_ids: List[str], decision: str) -> None:
+        """Checkpoint decided studies together with the job's counters"""
+        await asyncio.to_thread(
+            self._record_results, job["id"], study_ids, decision,
+            job["processed_studies"], job["progress"], job["cache_hits"], json.dumps(job["cascade"])
+        )
+
+    async def record_dead_letters(self, job: Dict, count: int) -> None:
+        await asyncio.to_thread(self._update_job, job["id"], {"dead_letters": job["dead_letters"]})
+
+    async def replace_results(self, job: Dict) -> None:
+        results = [(decision, list(study_ids)) for decision, study_ids in job["results"].items()]
+        await asyncio.to_thread(self._replace_results, job["id"], results)
+
+    async def load_jobs(self) -> List[Dict]:
+        return await asyncio.to_thread(self._load_jobs)
+
+    async def save_ingest(self, ingest: Dict) -> None:
+        await asyncio.to_thread(self._save_ingest, ingest_row(ingest))
+
+    async def load_ingests(self) -> List[Dict]:
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute("SELECT * FROM ingests")]
+        return [ingest_from_row(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _save_job(self, row: Dict):
+        columns = list(row) + ["updated_at"]
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                list(row.values()) + [time.time()]
+            )
+            self._conn.commit()
+
+    def _save_ingest(self, row: Dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingests (job_id, status, ingest) VALUES (?, ?, ?)",
+                (row["job_id"], row["status"], row["ingest"])
+            )
+            self._conn.commit()
+
+    def _record_results(self, job_id, study_ids, decision, processed, progress, cache_hits, cascade):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO job_results (job_id, study_id, decision) VALUES (?, ?, ?)",
+                [(job_id, study_id, decision) for study_id in study_ids]
+            )
+            self._conn.execute(
+                "UPDATE jobs SET processed_studies = ?, progress = ?, cache_hits = ?, cascade = ?, updated_at = ?"
+                " WHERE id = ?",
+                (processed, progress, cache_hits, cascade, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def _update_job(self, job_id: str, values: Dict):
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET {', '.join(f'{column} = ?' for column in values)}, updated_at = ? WHERE id = ?",
+                [*values.values(), time.time(), job_id]
+            )
+            self._conn.commit()
+
+    def _replace_results(self, job_id, results):
+        with self._lock:
+            self._conn.execute("DELETE FROM job_results WHERE job_id = ?", (job_id,))
+            for decision, study_ids in results:
+                self._conn.executemany(
+                    "INSERT INTO job_results (job_id, study_id, decision) VALUES (?, ?, ?)",
+                    [(job_id, study_id, decision) for study_id in study_ids]
+                )
+            self._conn.commit()
+
+    def _load_jobs(self) -> List[Dict]:
+        with self._lock:
+            rows = [dict(row) for row in self._conn.execute("SELECT * FROM jobs")]
+            results = {row["id"]: _empty_results() for row in rows}
+            for job_id, study_id, decision in self._conn.execute("SELECT job_id, study_id, decision FROM job_results"):
+                if job_id in results:
+                    results[job_id][decision].append(study_id)
+        return [job_from_row(row, results[row["id"]]) for row in rows]
+
+
+class SupabaseJobStore(MemoryJobStore):
+    def __init__(self, db, checkpoint_interval: float = 2.0):
+        self.db = db
+        self.checkpoint_interval = checkpoint_interval  # seconds between counter updates per job
+        self._last_checkpoint: Dict[str, float] = {}
+
+    async def _get_db(self):
+        return self.db or await get_db()
+
+    async def save_job(self, job: Dict) -> None:
+        await (await self._get_db()).upsert_job(job_row(job))
+        self._last_checkpoint[job["id"]] = time.monotonic()
+
+    async def record_results(self, job: Dict, study_ids: List[str], decision: str) -> None:
+        # The decisions themselves are already saved on the studies rows
+        now = time.monotonic()
+        if now - self._last_checkpoint.get(job["id"], 0.0) < self.checkpoint_interval:
+            return
+        self._last_checkpoint[job["id"]] = now
+        await (await self._get_db()).update_job(job["id"], {
+            "processed_studies": job["processed_studies"],
+            "progress": job["progress"],
+            "cache_hits": job["cache_hits"],
+            "cascade": json.dumps(job["cascade"])
+        })
+
+    async def record_dead_letters(self, job: Dict, count: int) -> None:
+        await (await self._get_db()).update_job(job["id"], {"dead_letters": job["dead_letters"]})
+
+    async def load_jobs(self) -> List[Dict]:
+        db = await self._get_db()
+        jobs = []
+        for row in await db.get_jobs():
+            results = _empty_results()
+            async for study in db.iter_decided_studies(row["id"]):
+                results[study["decision"]].append(study["id"])
+            job = job_from_row(row, results)
+            # The counters may lag the studies by one checkpoint interval
+            job["processed_studies"] = sum(len(ids) for ids in results.values())
+            if job["total_studies"]:
+                job["progress"] = round(job["processed_studies"] / job["total_studies"] * 100, 2)
+            jobs.append(job)
+        return jobs
+
+    async def save_ingest(self, ingest: Dict) -> None:
+        await (await self._get_db()).upsert_ingest(ingest_row(ingest))
+
+    async def load_ingests(self) -> List[Dict]:
+        return [ingest_from_row(row) for row in await (await self._get_db()).get_ingests()]
+
+
+def create_job_store(db=None) -> MemoryJobStore:
+    """Build the store selected by JOB_STORE (sqlite by default)"""
+    backend = os.getenv("JOB_STORE", "sqlite").lower()
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "supabase":
+        return SupabaseJobStore(db, checkpoint_interval=float(os.getenv("JOB_CHECKPOINT_INTERVAL", 2.0)))
+    return SQLiteJobStore(os.getenv("JOB_STORE_PATH", "jobs.sqlite3"))
@@ -45,23 +45,32 @@ This implementation aligns with the requirements in instructions-AI-Agents.txt,
 particularly the atomic claim system and concurrent processing capabilities.
 """
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 from enum import Enum
+import json
 import uuid
 import rispy
 from datetime import datetime
 
 # Import our custom modules
-from queue import JobQueue
-from models import ScreeningCriteria, JobStatus, StudyMetadata
-from validation import validate_ris_file, validate_criteria
-from database import init_db, get_db
+from job_queue import JobQueue
+from broker import create_broker
+from models import ScreeningCriteria, JobStatus, StudyMetadata, DecisionType
+from validation import validate_criteria
+from database import init_db, get_db, close_db
+from ingestion import IngestionPipeline, spool_upload
+from utils.parallelparsing import shutdown_parse_pool
+from utils.resultexport import EXPORT_FORMATS
+from utils.metrics import CONTENT_TYPE, REGISTRY, TRACER, MetricsMiddleware
 
 # Constants
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+STUDIES_PAGE_LIMIT = 500  # largest page /api/studies will return
+MAX_PRIORITY = 9  # screening priorities run from 0 (default) to MAX_PRIORITY
+MAX_UPLOAD_FILES = 20  # files /api/upload/batch merges into one job
 
 app = FastAPI(
     title="Systematic Review Screening API",
@@ -78,83 +87,182 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize job queue
-job_queue = JobQueue()
+# Time every API request for /metrics (skipped entirely when METRICS_ENABLED=false)
+if REGISTRY.enabled:
+    app.add_middleware(MetricsMiddleware)
+
+# Initialize job queue and the background upload pipeline
+# With SCREENING_BROKER set, screening runs in worker processes (worker.py) and the API only publishes jobs
+job_queue = JobQueue(broker=create_broker())
+ingestion = IngestionPipeline(job_store=job_queue.job_store)
 
 @app.on_event("startup")
 async def startup_event():
     await init_db()
+    # Uploads are needed before the jobs: only a completed one can be screened
+    await ingestion.load_ingests()
+    # Jobs interrupted by the last shutdown carry on where they stopped
+    await job_queue.resume_jobs()
 
-# Endpoint to upload the RIS file and validate it
-# This endpoint is used to upload the RIS file and validate it
-@app.post("/api/upload")
-async def upload_ris(
-    file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks()
-) -> Dict:
-    """Upload and validate RIS file"""
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_queue.job_store.close()
+    shutdown_parse_pool()
+    if job_queue.broker is not None:
+        await job_queue.broker.close()
+    await close_db()
+
+# Endpoint to upload the RIS file
+# The body is only spooled to a temporary file here; parsing, validation, deduplication
+# and storage run in the background, and their progress is at /api/upload/{job_id}
+@app.post("/api/upload", status_code=202)
+async def upload_ris(file: UploadFile = File(...)) -> Dict:
+    """Accept a RIS file for background ingestion"""
     if not file.filename.endswith('.ris'):
         raise HTTPException(400, detail="Invalid file type. Please upload a RIS file.")
     
-    # Check file size
-    file_size = 0
-    content = bytearray()
+    # Generate job ID
+    job_id = str(uuid.uuid4())
     
-    while chunk := await file.read(8192):
-        file_size += len(chunk)
-        if file_size > MAX_FILE_SIZE:
-            raise HTTPException(413, detail="File size exceeds 10MB limit")
-        content.extend(chunk)
+    try:
+        spool = await spool_upload(file)
+    except Exception as e:
+        raise HTTPException(500, detail=f"Error receiving file: {str(e)}")
     
+    ingestion.start(job_id, [(file.filename, spool)])
+    return {
+        "job_id": job_id,
+        "message": "File accepted for processing",
+        "status_url": f"/api/upload/{job_id}",
+        "studies_url": f"/api/studies/{job_id}"
+    }
+
+# Endpoint to upload several RIS files (e.g. one export per database) as one job
+# The files are parsed in parallel and merged in the order given; each study keeps its source file,
+# and duplicates are found across all of them
+@app.post("/api/upload/batch", status_code=202)
+async def upload_ris_files(files: List[UploadFile] = File(...)) -> Dict:
+    """Accept several RIS files for background ingestion into one job"""
+    if not 1 <= len(files) <= MAX_UPLOAD_FILES:
+        raise HTTPException(400, detail=f"Upload between 1 and {MAX_UPLOAD_FILES} files")
+    invalid = [file.filename for file in files if not file.filename.endswith('.ris')]
+    if invalid:
+        raise HTTPException(400, detail=f"Invalid file type: {', '.join(invalid)}. Please upload RIS files.")
+    
+    job_id = str(uuid.uuid4())
+    
+    # Files with the same name are told apart by their position, so every study's source stays unambiguous
+    names = [file.filename for file in files]
+    names = [
+        name if names.count(name) == 1 else f"{name} ({names[:i].count(name) + 1})"
+        for i, name in enumerate(names)
+    ]
+    spools = []
     try:
-        # Validate RIS file
-        validated_entries = await validate_ris_file(bytes(content))
-        
-        if not validated_entries:
-            raise HTTPException(400, detail="No valid entries found in RIS file")
-        
-        # Generate job ID
-        job_id = str(uuid.uuid4())
-        
-        # Store file data in database
-        db = get_db()
-        await db.store_ris_entries(job_id, validated_entries)
-        
-        return {
-            "job_id": job_id,
-            "message": "File uploaded successfully",
-            "study_count": len(validated_entries),
-            "validated_entries": validated_entries
-        }
-    except ValueError as e:
-        raise HTTPException(400, detail=str(e))
+        for file in files:
+            spools.append(await spool_upload(file))
     except Exception as e:
-        raise HTTPException(500, detail=f"Error processing file: {str(e)}")
+        for spool in spools:
+            spool.close()
+        raise HTTPException(500, detail=f"Error receiving files: {str(e)}")
+    
+    ingestion.start(job_id, list(zip(names, spools)))
+    return {
+        "job_id": job_id,
+        "message": f"{len(files)} files accepted for processing",
+        "files": names,
+        "status_url": f"/api/upload/{job_id}",
+        "studies_url": f"/api/studies/{job_id}"
+    }
+
+# Endpoint to follow a background upload
+@app.get("/api/upload/{job_id}")
+async def get_upload_status(job_id: str) -> Dict:
+    """Get ingestion progress (parsed, stored, duplicates, record errors)"""
+    try:
+        return ingestion.get_status(job_id)
+    except KeyError as e:
+        raise HTTPException(404, detail=f"Upload not found: {str(e)}")
+
+# Endpoint to page through a job's stored studies
+@app.get("/api/studies/{job_id}")
+async def get_studies(job_id: str, limit: int = 50, after: Optional[str] = None) -> Dict:
+    """List stored studies in id order; pass the returned next_cursor as `after` for the next page"""
+    if not 1 <= limit <= STUDIES_PAGE_LIMIT:
+        raise HTTPException(400, detail=f"limit must be between 1 and {STUDIES_PAGE_LIMIT}")
+    
+    db = await get_db()
+    studies = await db.get_studies_page(job_id, limit, after)
+    return {
+        "job_id": job_id,
+        "studies": studies,
+        "next_cursor": studies[-1]["id"] if len(studies) == limit else None
+    }
+
+def require_ingested(job_id: str):
+    """Screening needs every study of the job stored: its upload completed (or it was screened before)"""
+    if ingestion.is_running(job_id):
+        raise HTTPException(409, detail="The upload for this job is still being processed")
+    if ingestion.is_completed(job_id) or job_id in job_queue.jobs:
+        return
+    if job_id in ingestion.ingests:
+        raise HTTPException(409, detail=f"The upload for this job failed: {ingestion.ingests[job_id]['error']}")
+    raise HTTPException(404, detail=f"Upload {job_id} not found")
 
 # Endpoint to start the screening process
 @app.post("/api/screen/{job_id}")
 async def screen_studies(
     job_id: str,
     criteria: ScreeningCriteria,
-    background_tasks: BackgroundTasks
+    priority: int = 0
 ) -> Dict:
-    """Start the screening process"""
+    """Start the screening process, or queue it behind the running jobs (higher priority first)"""
+    require_ingested(job_id)
+    if job_queue.is_scheduled(job_id):
+        raise HTTPException(409, detail="Screening is already running or queued for this job")
+    if not 0 <= priority <= MAX_PRIORITY:
+        raise HTTPException(400, detail=f"priority must be between 0 and {MAX_PRIORITY}")
+    
     try:
         # Validate criteria
         await validate_criteria(criteria)
         
-        # Add job to queue
-        job = await job_queue.add_job(job_id, criteria)
-        background_tasks.add_task(job_queue.process_job, job)
+        # Add job to queue; screening a job again also retries the studies it gave up on last time,
+        # and with edited criteria re-screens only the decisions the edit could change
+        db = await get_db()
+        await db.requeue_dead_letters(job_id)
+        job = await job_queue.prepare_job(job_id, criteria, priority)
+        position = None
+        if job_queue.broker is not None:
+            await job_queue.dispatch(job)
+        else:
+            position = job_queue.submit(job, priority)
         
         return {
             "job_id": job_id,
-            "message": "Screening started",
-            "status": "processing"
+            "message": "Screening queued" if position else "Screening started",
+            "status": "pending" if position else "processing",
+            "queue_position": position,
+            "rescreen": job["rescreen"]
         }
     except Exception as e:
         raise HTTPException(500, detail=f"Error starting screening: {str(e)}")
 
+# Endpoint to estimate a screening run before starting it
+# Counts the studies /api/screen/{job_id} would send to the LLM under these criteria, from the
+# token counts stored at upload, and prices them; nothing is queued
+@app.post("/api/screen/{job_id}/estimate")
+async def estimate_screening(job_id: str, criteria: ScreeningCriteria) -> Dict:
+    """Estimate the LLM requests, tokens, cost and duration of screening the job"""
+    require_ingested(job_id)
+    
+    try:
+        await validate_criteria(criteria)
+        estimate = await job_queue.estimate_job(job_id, criteria)
+        return {"job_id": job_id, **estimate}
+    except Exception as e:
+        raise HTTPException(500, detail=f"Error estimating screening: {str(e)}")
+
 # Endpoint to get the job status
 @app.get("/api/status/{job_id}")
 async def get_status(job_id: str) -> Dict:
@@ -165,26 +273,95 @@ async def get_status(job_id: str) -> Dict:
     except Exception as e:
         raise HTTPException(404, detail=f"Job not found: {str(e)}")
 
+# Endpoint to stream job progress (Server-Sent Events) instead of polling /api/status
+@app.get("/api/status/{job_id}/stream")
+async def stream_status(job_id: str) -> StreamingResponse:
+    """Push coalesced progress deltas until the job completes or fails"""
+    try:
+        updates = job_queue.stream_progress(job_id)
+    except KeyError as e:
+        raise HTTPException(404, detail=f"Job not found: {str(e)}")
+    
+    async def _events():
+        async for delta in updates:
+            if not delta:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: progress\ndata: {json.dumps(delta)}\n\n"
+    
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Endpoint to list the studies screening gave up on
+@app.get("/api/dead-letters/{job_id}")
+async def get_dead_letters(job_id: str) -> Dict:
+    """Studies left undecided after their LLM requests kept failing, with the last error (screen again to retry)"""
+    db = await get_db()
+    studies = await db.get_dead_letters(job_id)
+    return {
+        "job_id": job_id,
+        "count": len(studies),
+        "studies": studies
+    }
+
 # Endpoint to download the screening results
 @app.get("/api/download/{job_id}")
-async def download_results(job_id: str, format: str = "ris") -> Dict:
-    """Download screening results"""
+async def download_results(
+    job_id: str,
+    format: str = "ris",
+    decision: Optional[str] = None,
+    include_duplicates: bool = False
+) -> StreamingResponse:
+    """Download screening results as a stream (optionally only one decision, optionally with the duplicates)"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(400, detail="Invalid format requested")
+    if decision and decision not in [d.value for d in DecisionType]:
+        raise HTTPException(400, detail="Invalid decision requested")
+    
     try:
-        if format not in ["ris", "excel", "json"]:
-            raise HTTPException(400, detail="Invalid format requested")
-            
-        result = await job_queue.get_job_results(job_id, format)
-        return result
+        result = await job_queue.get_job_results(job_id, format, decision, include_duplicates)
     except Exception as e:
         raise HTTPException(404, detail=f"Results not found: {str(e)}")
+    
+    media_type, extension = EXPORT_FORMATS[format]
+    filename = f"screening-{job_id}{'-' + decision if decision else ''}.{extension}"
+    return StreamingResponse(
+        result,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 # Endpoint: Health check endpoint
 @app.get("/api/health")
 async def health_check() -> Dict:
     """Health check endpoint"""
+    db = await get_db()
+    database_status = await db.health_check()
     return {
-        "status": "healthy",
+        "status": "healthy" if database_status["status"] == "healthy" else "degraded",
         "timestamp": datetime.utcnow(),
         "queue_size": len(job_queue),
+        "database": database_status,
+        "decision_cache": job_queue.decision_cache.stats() if job_queue.decision_cache else None,
         "agent_status": await job_queue.get_agent_status()
-    } 
\ No newline at end of file
+    }
+
+# Endpoint: Prometheus metrics (stage timings, DB and LLM latency, claims, queue depth)
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Metrics in the Prometheus text exposition format"""
+    if not REGISTRY.enabled:
+        raise HTTPException(404, detail="Metrics are disabled")
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# Endpoint: per-job trace spans (enabled with TRACE_ENABLED=true)
+@app.get("/api/trace/{job_id}")
+async def get_trace(job_id: str) -> Dict:
+    """Timed steps of a job's ingestion and screening, oldest first"""
+    spans = TRACER.get_spans(job_id)
+    if spans is None:
+        raise HTTPException(404, detail="No trace recorded for this job")
+    return {"job_id": job_id, "spans": spans}
@@ -13,6 +13,12 @@ class JobStatus(str, Enum):
     COMPLETED = "completed"
     FAILED = "failed"
 
+class IngestStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class ScreeningCriteria(BaseModel):
     inclusion: List[str] = Field(..., min_items=1)
     exclusion: List[str] = Field(..., min_items=1)
@@ -28,4 +34,14 @@ class StudyMetadata(BaseModel):
 class ScreeningResult(BaseModel):
     decision: DecisionType
     confidence: float
-    rationale: str 
\ No newline at end of file
+    rationale: str 
+
+class FailedRow(BaseModel):
+    index: int  # Position of the entry in the stored sequence
+    error: str
+
+class StoreResult(BaseModel):
+    stored_count: int = 0
+    failed_rows: List[FailedRow] = []
+    chunk_count: int = 0
+    retry_count: int = 0
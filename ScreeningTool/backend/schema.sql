@@ -0,0 +1,154 @@
+-- Supabase schema for the screening backend
+--
+-- Apply with psql (or paste into the Supabase SQL editor). Every statement is
+-- idempotent, so the file can be re-run to upgrade an existing database.
+--
+--   psql "$DATABASE_URL" -f schema.sql
+
+-- 1. Studies: one row per RIS record
+CREATE TABLE IF NOT EXISTS studies (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),  -- assigned client-side at upload
+  job_id TEXT NOT NULL,
+  duplicate_of UUID REFERENCES studies (id),       -- set on duplicates; they copy their representative's decision
+  metadata JSONB NOT NULL,                         -- the complete rispy entry
+  title TEXT,
+  abstract TEXT,
+  keywords TEXT[],
+  decision TEXT CHECK (decision IN ('include', 'exclude', 'maybe')),
+  decision_rationale TEXT,
+  claimed_by TEXT,                                 -- worker holding the lease
+  claimed_at TIMESTAMPTZ,
+  lease_expires_at TIMESTAMPTZ,                    -- the claim may be taken over once this has passed
+  screening_error TEXT,                            -- set when screening gave up on the study (dead letter)
+  criteria_version INTEGER,                        -- the job's criteria version that produced the decision
+  source_file TEXT,                                -- the uploaded file the record came from
+  terms INTEGER[],                                 -- hashed term features, for the screening order (utils/relevance.py)
+  screening_text TEXT,                             -- the text the agents send, compiled at upload (utils/screeningtext.py)
+  screening_tokens INTEGER                         -- its token count
+);
+
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS duplicate_of UUID REFERENCES studies (id);
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS screening_error TEXT;
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS criteria_version INTEGER;
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS source_file TEXT;
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS terms INTEGER[];
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS screening_text TEXT;
+ALTER TABLE studies ADD COLUMN IF NOT EXISTS screening_tokens INTEGER;
+
+-- Decisions made before criteria were versioned came from the job's first criteria
+UPDATE studies SET criteria_version = 1 WHERE decision IS NOT NULL AND criteria_version IS NULL;
+
+-- The claim scan, keyset pagination and per-job counts
+CREATE INDEX IF NOT EXISTS studies_job_undecided_idx
+  ON studies (job_id, id) WHERE decision IS NULL AND duplicate_of IS NULL;
+CREATE INDEX IF NOT EXISTS studies_job_id_idx ON studies (job_id, id);
+CREATE INDEX IF NOT EXISTS studies_duplicate_of_idx ON studies (duplicate_of) WHERE duplicate_of IS NOT NULL;
+CREATE INDEX IF NOT EXISTS studies_dead_letter_idx ON studies (job_id, id) WHERE screening_error IS NOT NULL;
+
+-- 2. Screening jobs (JOB_STORE=supabase); the JSON columns are stored as text by job_store.py
+CREATE TABLE IF NOT EXISTS screening_jobs (
+  id TEXT PRIMARY KEY,
+  status TEXT NOT NULL,
+  criteria TEXT NOT NULL,
+  created_at TEXT NOT NULL,                        -- ISO 8601, so it sorts as text
+  total_studies INTEGER DEFAULT 0,
+  processed_studies INTEGER DEFAULT 0,
+  progress DOUBLE PRECISION DEFAULT 0,
+  cache_hits INTEGER DEFAULT 0,
+  retry_count INTEGER DEFAULT 0,
+  last_error TEXT,
+  prefilter TEXT,
+  processing_history TEXT,
+  criteria_version INTEGER DEFAULT 1,
+  rescreen TEXT,
+  priority INTEGER DEFAULT 0,
+  dead_letters INTEGER DEFAULT 0,
+  cascade TEXT,
+  ranking TEXT
+);
+
+ALTER TABLE screening_jobs ADD COLUMN IF NOT EXISTS criteria_version INTEGER DEFAULT 1;
+ALTER TABLE screening_jobs ADD COLUMN IF NOT EXISTS rescreen TEXT;
+ALTER TABLE screening_jobs ADD COLUMN IF NOT EXISTS priority INTEGER DEFAULT 0;
+ALTER TABLE screening_jobs ADD COLUMN IF NOT EXISTS dead_letters INTEGER DEFAULT 0;
+ALTER TABLE screening_jobs ADD COLUMN IF NOT EXISTS cascade TEXT;
+ALTER TABLE screening_jobs ADD COLUMN IF NOT EXISTS ranking TEXT;
+
+-- Uploads (JOB_STORE=supabase), so screening only starts on a completed one after a restart
+CREATE TABLE IF NOT EXISTS screening_ingests (
+  job_id TEXT PRIMARY KEY,
+  status TEXT NOT NULL,                            -- queued | running | completed | failed
+  ingest TEXT NOT NULL                             -- progress, record errors and timings, as JSON
+);
+
+-- 3. Every version of a job's screening criteria (see utils/criteriaversions.py)
+CREATE TABLE IF NOT EXISTS criteria_versions (
+  job_id TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  criteria JSONB NOT NULL,                         -- {"inclusion": [...], "exclusion": [...]}
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (job_id, version)
+);
+
+-- 4. Lease-based claiming
+--
+-- A claim is a lease: it names the worker and expires after lease_seconds unless the worker
+-- extends it with extend_study_leases (its heartbeat). Undecided representative studies that
+-- are unclaimed, or whose lease has expired, can be claimed; `reclaimed` marks the latter, i.e.
+-- studies taken over from a worker that stopped heartbeating. Dead letters are never claimed. FOR UPDATE SKIP LOCKED lets
+-- concurrent claims pass each other instead of waiting or handing out the same rows. With study_ids (the
+-- relevance ranking's next candidates) only those studies are claimed, in the order given.
+-- Claimed studies come with their screening text and its token count, ready to be sent.
+DROP FUNCTION IF EXISTS claim_studies_batch(INTEGER, TEXT, TEXT, DOUBLE PRECISION);
+DROP FUNCTION IF EXISTS claim_studies_batch(INTEGER, TEXT, TEXT, DOUBLE PRECISION, UUID[]);
+CREATE OR REPLACE FUNCTION claim_studies_batch(
+  batch_size INTEGER DEFAULT 10,
+  job_id TEXT DEFAULT NULL,
+  worker_id TEXT DEFAULT NULL,
+  lease_seconds DOUBLE PRECISION DEFAULT 300,
+  study_ids UUID[] DEFAULT NULL
+)
+RETURNS TABLE (
+  id UUID, title TEXT, abstract TEXT, keywords TEXT[], screening_text TEXT, screening_tokens INTEGER, reclaimed BOOLEAN
+)
+LANGUAGE sql
+AS $$
+  WITH candidates AS (
+    SELECT s.id, s.claimed_by IS NOT NULL AS reclaimed
+    FROM studies s
+    WHERE s.decision IS NULL
+      AND s.duplicate_of IS NULL
+      AND s.screening_error IS NULL
+      AND (claim_studies_batch.job_id IS NULL OR s.job_id = claim_studies_batch.job_id)
+      AND (s.claimed_by IS NULL OR s.lease_expires_at IS NULL OR s.lease_expires_at < now())
+      AND (claim_studies_batch.study_ids IS NULL OR s.id = ANY (claim_studies_batch.study_ids))
+    ORDER BY array_position(claim_studies_batch.study_ids, s.id), s.id
+    LIMIT claim_studies_batch.batch_size
+    FOR UPDATE OF s SKIP LOCKED
+  )
+  UPDATE studies s
+  SET claimed_by = coalesce(claim_studies_batch.worker_id, 'anonymous'),
+      claimed_at = now(),
+      lease_expires_at = now() + make_interval(secs => claim_studies_batch.lease_seconds)
+  FROM candidates c
+  WHERE s.id = c.id
+  RETURNING s.id, s.title, s.abstract, s.keywords, s.screening_text, s.screening_tokens, c.reclaimed;
+$$;
+
+-- Heartbeat: extend the worker's leases; returns the studies it still holds
+CREATE OR REPLACE FUNCTION extend_study_leases(
+  worker_id TEXT,
+  study_ids UUID[],
+  lease_seconds DOUBLE PRECISION DEFAULT 300
+)
+RETURNS TABLE (id UUID)
+LANGUAGE sql
+AS $$
+  UPDATE studies s
+  SET lease_expires_at = now() + make_interval(secs => extend_study_leases.lease_seconds)
+  WHERE s.id = ANY (extend_study_leases.study_ids)
+    AND s.claimed_by = extend_study_leases.worker_id
+    AND s.decision IS NULL
+  RETURNING s.id;
+$$;
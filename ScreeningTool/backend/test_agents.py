@@ -0,0 +1,85 @@
+"""
+Batch screening (agents.py): token-budget packing, and the retries of a batch
+whose answer is unparseable or partial, with the chat request stubbed out:
+
+    python -m pytest -q test_agents.py
+"""
+import asyncio
+import json
+
+from agents import ScreeningAgent, StudyScreeningError, pack_batches, pack_token_counts
+from models import DecisionType, ScreeningCriteria
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+
+
+def _studies(count: int):
+    return [{"id": f"s{n}", "screening_text": f"Title: study-{n}", "screening_tokens": 10} for n in range(1, count + 1)]
+
+
+def _scripted_agent(answer):
+    """An agent whose chat request calls answer(ids in the prompt) and records those ids"""
+    agent = ScreeningAgent("agent", CRITERIA, client=object())
+    agent.requests = []
+
+    async def _complete(system_prompt, prompt):
+        ids = [line.split("-")[1] for line in prompt.splitlines() if line.startswith("Title: study-")]
+        agent.requests.append([f"s{n}" for n in ids])
+        return answer(agent.requests[-1])
+    agent._complete = _complete
+    return agent
+
+
+def _answer(numbers):
+    return json.dumps({"results": [
+        {"id": number, "decision": "include", "confidence": 0.9, "rationale": "Adults."} for number in numbers
+    ]})
+
+
+def test_studies_are_packed_up_to_the_token_budget():
+    # Each study costs its tokens plus the answer's 80
+    assert pack_token_counts([100] * 5, token_budget=400) == [2, 2, 1]
+    assert pack_token_counts([10] * 5, token_budget=6000, max_studies=2) == [2, 2, 1]
+    # A study over budget on its own still goes, alone
+    assert pack_token_counts([100, 5000, 100], token_budget=1000) == [1, 1, 1]
+    assert pack_token_counts([]) == []
+
+    studies = _studies(3)
+    studies[1]["screening_tokens"] = 500
+    assert [[study["id"] for study in batch] for batch in pack_batches(studies, token_budget=400)] == [
+        ["s1"], ["s2"], ["s3"]
+    ]
+
+
+def test_an_unparseable_answer_halves_the_batch():
+    def answer(ids):
+        if len(ids) == 4:
+            return "Sorry, I cannot answer in JSON."
+        return _answer(range(1, len(ids) + 1))
+
+    agent = _scripted_agent(answer)
+    results = asyncio.run(agent.screen_batch(_studies(4)))
+    assert agent.requests == [["s1", "s2", "s3", "s4"], ["s1", "s2"], ["s3", "s4"]]
+    assert sorted(results) == ["s1", "s2", "s3", "s4"]
+    assert all(result.decision == DecisionType.INCLUDE for result in results.values())
+
+
+def test_unparseable_answers_end_at_single_study_errors():
+    agent = _scripted_agent(lambda ids: "not json")
+    results = asyncio.run(agent.screen_batch(_studies(2)))
+    assert agent.requests == [["s1", "s2"], ["s1"], ["s2"]]
+    assert all(isinstance(error, StudyScreeningError) and not error.transient for error in results.values())
+
+
+def test_a_partial_answer_retries_only_the_missing_studies():
+    def answer(ids):
+        if len(ids) == 4:
+            return _answer([1, 3])
+        return _answer(range(1, len(ids) + 1))
+
+    agent = _scripted_agent(answer)
+    results = asyncio.run(agent.screen_batch(_studies(4)))
+    # The retry renumbers the missing studies from 1
+    assert agent.requests == [["s1", "s2", "s3", "s4"], ["s2", "s4"]]
+    assert sorted(results) == ["s1", "s2", "s3", "s4"]
+    assert agent.usage["studies"] == 4
@@ -0,0 +1,57 @@
+"""
+Bulk storage of parsed studies (Database.bulk_store_ris_entries), on the
+in-memory PostgREST stand-in (benchmarks/fakes.py):
+
+    python -m pytest -q test_bulk_store.py
+"""
+import asyncio
+
+from benchmarks.fakes import InMemoryDatabase
+from utils.risfileparsing import iter_ris_entries
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _entries(count: int):
+    text = "".join(f"TY  - JOUR\nTI  - Study {n}\nAB  - Abstract {n}.\nER  -\n\n" for n in range(count))
+    return list(iter_ris_entries([text.encode()]))
+
+
+def _store(fail):
+    """Store 40 studies in chunks of 10; `fail(rows)` returns the error for an insert request, or None"""
+    async def scenario():
+        db = InMemoryDatabase()
+        db.insert_retry_delay = 0
+        insert = db.client.insert
+        requests = []
+
+        async def flaky(table, rows, **kwargs):
+            requests.append(len(rows))
+            error = fail(rows)
+            if error is not None:
+                raise error
+            return await insert(table, rows, **kwargs)
+        db.client.insert = flaky
+        result = await db.bulk_store_ris_entries("job", _entries(40), chunk_size=10)
+        return result, requests
+    return asyncio.run(scenario())
+
+
+def test_rejected_row_is_isolated():
+    result, requests = _store(lambda rows: StatusError(400) if any(row["title"] == "Study 13" for row in rows) else None)
+    assert result.stored_count == 39
+    assert [row.index for row in result.failed_rows] == [13]
+    assert result.retry_count == 0
+    assert len(requests) > 4  # the chunk holding the bad row was split
+
+
+def test_chunks_failing_transiently_are_not_split():
+    result, requests = _store(lambda rows: StatusError(503))
+    assert result.stored_count == 0
+    assert [row.index for row in result.failed_rows] == list(range(40))
+    assert requests == [10] * 12  # 4 chunks, 3 attempts each
+    assert result.retry_count == 8
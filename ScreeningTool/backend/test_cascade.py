@@ -0,0 +1,76 @@
+"""
+Confidence-gated screening cascade (cascade.py), with fake LLM clients that
+answer by model (benchmarks/fakes.py):
+
+    python -m pytest -q test_cascade.py
+"""
+import asyncio
+
+import pytest
+
+from agents import ScreeningAgent
+from cascade import ScreeningCascade, build_screening_cascade, check_cascade_models
+from models import DecisionType, ScreeningCriteria
+from benchmarks.fakes import FakeChatClient
+
+CRITERIA = ScreeningCriteria(inclusion=["adults with septic shock"], exclusion=["animal model"])
+STUDY = {"id": "s1", "title": "Vasopressin in septic shock", "abstract": "A trial in adults.", "keywords": []}
+
+
+class ScriptedChatClient(FakeChatClient):
+    """Gives every study the same answer, and counts the requests"""
+
+    def __init__(self, decision: str, confidence: float):
+        super().__init__(latency=0.0)
+        self.answer = (decision, confidence)
+        self.requests = 0
+
+    def _decision(self, text: str):
+        self.requests += 1
+        return self.answer
+
+
+def _cascade(*answers):
+    clients = [ScriptedChatClient(*answer) for answer in answers]
+    tiers = [
+        [ScreeningAgent(f"tier-{tier + 1}", CRITERIA, client=client, model=f"model-{tier + 1}")]
+        for tier, client in enumerate(clients)
+    ]
+    return ScreeningCascade(tiers, threshold=0.8), clients
+
+
+def test_doubtful_study_is_settled_by_the_next_tier():
+    cascade, clients = _cascade(("maybe", 0.55), ("include", 0.93), ("exclude", 0.99))
+    result = asyncio.run(cascade.screen(STUDY))
+
+    assert result.decision == DecisionType.INCLUDE and result.confidence == 0.93
+    assert "tier 2 of the cascade" in result.rationale
+    assert [client.requests for client in clients] == [1, 1, 0]
+    assert cascade.stats["escalated"] == 1
+    assert [tier["resolved"] for tier in cascade.stats["tiers"]] == [0, 1, 0]
+
+
+def test_confident_first_tier_is_not_escalated():
+    cascade, clients = _cascade(("exclude", 0.95), ("include", 0.95))
+    result = asyncio.run(cascade.screen(STUDY))
+
+    assert result.decision == DecisionType.EXCLUDE
+    assert [client.requests for client in clients] == [1, 0]
+
+
+def test_disagreement_without_confidence_is_left_to_a_human():
+    cascade, _ = _cascade(("include", 0.6), ("exclude", 0.7))
+    assert asyncio.run(cascade.screen(STUDY)).decision == DecisionType.MAYBE
+
+
+@pytest.mark.parametrize("models", [[], ["gpt-4o-mini"], ["gpt-4o-mini", "gpt-4o-mini"], ["a", "b", "a"]])
+def test_cascade_needs_two_distinct_models(models):
+    with pytest.raises(ValueError):
+        check_cascade_models(models)
+    with pytest.raises(ValueError):
+        build_screening_cascade(CRITERIA, models=models or None)
+
+
+def test_single_tier_cascade_is_rejected():
+    with pytest.raises(ValueError):
+        _cascade(("include", 0.6))
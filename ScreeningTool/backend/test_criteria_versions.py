@@ -0,0 +1,110 @@
+"""
+Criteria versions and re-screening (utils/criteriaversions.py), and a broker
+worker screening a job again under edited criteria. Runs on the in-memory
+fakes (benchmarks/fakes.py), no database or LLM needed:
+
+    python -m pytest -q test_criteria_versions.py
+"""
+import os
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+import asyncio
+
+from agents import ScreeningAgent
+from broker import MemoryBroker
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from models import JobStatus, ScreeningCriteria
+from utils.criteriaversions import criteria_changes, decisions_to_rescreen
+from utils.risfileparsing import iter_ris_entries
+from worker import ScreeningWorker
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+
+CRITERIA = ScreeningCriteria(inclusion=["Adult patients", "randomized trial"], exclusion=["animal model"])
+
+
+def test_unchanged_criteria_ignore_case_whitespace_and_order():
+    edited = ScreeningCriteria(inclusion=["randomized   trial", " adult PATIENTS"], exclusion=["Animal model "])
+    assert criteria_changes(CRITERIA, edited) == {}
+    assert decisions_to_rescreen(CRITERIA, edited) == []
+
+
+def test_added_criterion_rescreens_includes_and_maybes():
+    edited = ScreeningCriteria(inclusion=CRITERIA.inclusion, exclusion=CRITERIA.exclusion + ["case report"])
+    assert criteria_changes(CRITERIA, edited) == {"added_exclusion": ["case report"]}
+    assert decisions_to_rescreen(CRITERIA, edited) == ["include", "maybe"]
+
+
+def test_removed_criterion_rescreens_excludes_and_maybes():
+    edited = ScreeningCriteria(inclusion=["adult patients"], exclusion=CRITERIA.exclusion)
+    assert criteria_changes(CRITERIA, edited) == {"removed_inclusion": ["randomized trial"]}
+    assert decisions_to_rescreen(CRITERIA, edited) == ["exclude", "maybe"]
+
+
+def test_reworded_criterion_rescreens_everything():
+    edited = ScreeningCriteria(inclusion=["adult patients", "randomised controlled trial"], exclusion=CRITERIA.exclusion)
+    assert criteria_changes(CRITERIA, edited) == {
+        "added_inclusion": ["randomised controlled trial"], "removed_inclusion": ["randomized trial"]
+    }
+    assert decisions_to_rescreen(CRITERIA, edited) == ["exclude", "include", "maybe"]
+
+
+def _ris(count: int) -> bytes:
+    return "".join(
+        f"TY  - JOUR\nTI  - Study {n} of drug {n % 7}\nAB  - Outcomes in cohort {n} after treatment {n % 11}.\nER  -\n\n"
+        for n in range(count)
+    ).encode()
+
+
+async def _until_done(job, timeout: float = 20.0):
+    async def wait():
+        while job["status"] not in (JobStatus.COMPLETED, JobStatus.FAILED):
+            await asyncio.sleep(0.02)
+    await asyncio.wait_for(wait(), timeout)
+    assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+
+
+async def _screen_twice_on_a_worker():
+    db = InMemoryDatabase()
+    await db.store_ris_entries("job", list(iter_ris_entries([_ris(60)])))
+    broker = MemoryBroker()
+    seen = []
+
+    def agent_factory(criteria):
+        seen.append(criteria)
+        return [ScreeningAgent(f"agent-{i}", criteria, client=FakeChatClient(0.001, seed=i)) for i in range(3)]
+
+    worker = ScreeningWorker(broker, db=db, agent_factory=agent_factory, poll_interval=0.02)
+    api = JobQueue(db=db, job_store=MemoryJobStore(), broker=broker)
+    api.progress_hub.min_interval = 0.02
+    stop = asyncio.Event()
+    task = asyncio.create_task(worker.run(stop))
+    try:
+        job = await api.prepare_job("job", CRITERIA)
+        await api.dispatch(job)
+        await _until_done(job)
+
+        edited = ScreeningCriteria(inclusion=CRITERIA.inclusion, exclusion=CRITERIA.exclusion + ["case report"])
+        job = await api.prepare_job("job", edited)
+        await api.dispatch(job)
+        await _until_done(job)
+        await asyncio.sleep(0.1)  # a poll of the active jobs after the broker retired it
+        rows = list(db.client.tables["studies"].values())
+        return job, seen, rows, worker
+    finally:
+        stop.set()
+        await task
+
+
+def test_worker_rescreens_under_the_published_criteria_version():
+    job, seen, rows, worker = asyncio.run(_screen_twice_on_a_worker())
+
+    assert job["criteria_version"] == 2
+    assert seen[-1].exclusion == ["animal model", "case report"]
+    rescreened = [row for row in rows if row["criteria_version"] == 2]
+    assert len(rescreened) == job["rescreen"]["rescreened"] > 0
+    assert all(row["decision"] for row in rows)
+    # Retired by the broker: the worker keeps nothing of the job
+    assert "job" not in worker.queue.jobs and "job" not in worker.queue._rankers
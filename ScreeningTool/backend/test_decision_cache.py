@@ -0,0 +1,53 @@
+"""
+Screening-decision cache (utils/decisioncache.py), on a SQLite file in a temporary directory:
+
+    python -m pytest -q test_decision_cache.py
+"""
+import asyncio
+
+from models import DecisionType, ScreeningResult
+from utils.decisioncache import DecisionCache, study_fingerprint
+from utils.screeningtext import compile_screening_text
+
+RESULT = ScreeningResult(decision=DecisionType.INCLUDE, confidence=0.9, rationale="Adults with septic shock.")
+
+
+def test_memory_hits_do_not_wait_for_the_disk(tmp_path):
+    async def scenario():
+        cache = DecisionCache(path=str(tmp_path / "cache.sqlite3"))
+        await cache.set("key", RESULT)
+        try:
+            with cache._disk_lock:  # e.g. a trim running in a thread
+                return await asyncio.wait_for(cache.get("key"), 1.0)
+        finally:
+            cache.close()
+
+    assert asyncio.run(scenario()) == RESULT
+
+
+def test_disk_tier_is_trimmed_to_max_rows(tmp_path):
+    async def scenario():
+        cache = DecisionCache(path=str(tmp_path / "cache.sqlite3"), memory_size=10, max_rows=100)
+        for n in range(1000):
+            await cache.set(f"key-{n}", RESULT)
+        try:
+            rows = cache._conn.execute("SELECT count(*) FROM decisions").fetchone()[0]
+            return rows, await cache.get("key-999"), await cache.get("key-0"), cache.stats()
+        finally:
+            cache.close()
+
+    rows, newest, oldest, stats = asyncio.run(scenario())
+    assert rows == 100
+    assert newest == RESULT and oldest is None
+    assert stats["memory_evictions"] == 990
+    assert stats["disk_evictions"] == 900
+
+
+def test_study_key_follows_the_screening_text():
+    study = {"title": "Vasopressin in septic shock", "abstract": "A trial in adults. " * 400, "keywords": ["sepsis"]}
+    stored = {**study, "screening_text": compile_screening_text(study["title"], study["abstract"], study["keywords"])[0]}
+    assert study_fingerprint(study) == study_fingerprint(stored)
+
+    # A different token budget sends a different text, so it must not reuse the decision
+    shorter = compile_screening_text(study["title"], study["abstract"], study["keywords"], token_budget=200)[0]
+    assert study_fingerprint({**study, "screening_text": shorter}) != study_fingerprint(stored)
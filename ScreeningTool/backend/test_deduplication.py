@@ -0,0 +1,57 @@
+"""
+Duplicate detection (utils/deduplication.py): DOI matches first, different
+DOIs never merged, and LSH candidates verified against the threshold:
+
+    python -m pytest -q test_deduplication.py
+"""
+import hashlib
+
+from utils.deduplication import StudyDeduplicator
+
+TITLE = "Vasopressin versus norepinephrine in septic shock"
+
+
+def _words(start: int, count: int):
+    return [hashlib.md5(str(n).encode()).hexdigest()[:7] for n in range(start, start + count)]
+
+
+def _duplicate_of(entries, threshold: float = 0.8):
+    entries = list(StudyDeduplicator(threshold=threshold).process(entries))
+    ids = {entry["id"]: n for n, entry in enumerate(entries)}
+    return [ids.get(entry["duplicate_of"]) for entry in entries]
+
+
+def test_doi_match_comes_before_text_match():
+    entries = [
+        {"title": TITLE, "abstract": " ".join(_words(0, 100)), "doi": "10.1000/first"},
+        {"title": "A different study", "abstract": " ".join(_words(500, 100)), "doi": "10.1000/second"},
+        # The text of the second study, but the DOI of the first (as a URL)
+        {"title": "A different study", "abstract": " ".join(_words(500, 100)), "doi": "https://doi.org/10.1000/FIRST"},
+        {"title": "Unrelated", "abstract": " ".join(_words(900, 100)), "metadata": {"doi": ["doi: 10.1000/second"]}}
+    ]
+    assert _duplicate_of(entries) == [None, None, 0, 1]
+
+
+def test_different_dois_never_merge():
+    abstract = " ".join(_words(0, 100))
+    entries = [
+        {"title": TITLE, "abstract": abstract, "doi": "10.1000/first"},
+        {"title": TITLE, "abstract": abstract, "doi": "10.1000/second"},  # identical text
+        {"title": TITLE, "abstract": abstract + " Erratum.", "doi": "10.1000/third"},  # near-identical text
+        {"title": TITLE, "abstract": abstract}  # no DOI: the text decides
+    ]
+    assert _duplicate_of(entries) == [None, None, None, 0]
+
+
+def test_lsh_candidates_must_reach_the_threshold():
+    base = _words(0, 250)
+    entries = [
+        {"title": TITLE, "abstract": " ".join(base)},
+        {"title": TITLE, "abstract": " ".join(base[:-50] + _words(1000, 50))}  # about 0.7 similar
+    ]
+    deduplicator = StudyDeduplicator()
+    (_, first), (_, second) = deduplicator._signatures_for(deduplicator._normalize_block(entries), 2)
+    assert any(a == b for a, b in zip(first, second))  # they share an LSH bucket
+
+    assert _duplicate_of([dict(entry) for entry in entries], threshold=0.8) == [None, None]
+    assert _duplicate_of([dict(entry) for entry in entries], threshold=0.6) == [None, 0]
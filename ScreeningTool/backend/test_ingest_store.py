@@ -0,0 +1,44 @@
+"""
+Uploads saved to the job store (IngestionPipeline with SQLiteJobStore), so a
+restart does not lose track of which jobs can be screened:
+
+    python -m pytest -q test_ingest_store.py
+"""
+import asyncio
+from datetime import datetime
+
+from ingestion import IngestionPipeline
+from job_store import SQLiteJobStore
+from models import IngestStatus
+
+
+def _ingest(job_id: str, status: IngestStatus) -> dict:
+    return {
+        "job_id": job_id, "filename": "export.ris", "files": [{"filename": "export.ris", "parsed": 3}],
+        "status": status, "parsed": 3, "stored": 3, "failed_rows": 0,
+        "errors": [{"record": 2, "error": "missing TY"}], "duplicates": None,
+        "started_at": datetime(2026, 1, 1, 12), "completed_at": None, "error": None
+    }
+
+
+def test_uploads_are_reloaded_after_a_restart(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "jobs.sqlite3")
+        store = SQLiteJobStore(path)
+        await store.save_ingest(_ingest("done", IngestStatus.COMPLETED))
+        await store.save_ingest(_ingest("cut-off", IngestStatus.RUNNING))
+        store.close()
+
+        pipeline = IngestionPipeline(job_store=SQLiteJobStore(path))
+        await pipeline.load_ingests()
+        pipeline.job_store.close()
+        return pipeline
+    pipeline = asyncio.run(scenario())
+
+    assert pipeline.is_completed("done") and not pipeline.is_running("done")
+    assert pipeline.get_status("done")["started_at"] == datetime(2026, 1, 1, 12)
+    assert pipeline.get_status("done")["errors"] == [{"record": 2, "error": "missing TY"}]
+    # Its background task died with the old process
+    assert pipeline.get_status("cut-off")["status"] == IngestStatus.FAILED
+    assert not pipeline.is_completed("cut-off") and not pipeline.is_running("cut-off")
+    assert not pipeline.is_completed("unknown")
@@ -0,0 +1,77 @@
+"""
+Restarting on a SQLite job store (job_store.py): a job interrupted half-way is
+reloaded with its counters and settings and screened to the end, on the
+in-memory fakes (benchmarks/fakes.py):
+
+    python -m pytest -q test_job_store.py
+"""
+import os
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+import asyncio
+
+from agents import ScreeningAgent
+from cascade import ScreeningCascade
+from job_queue import JobQueue
+from job_store import SQLiteJobStore
+from models import DecisionType, JobStatus, ScreeningCriteria, ScreeningResult
+from utils.risfileparsing import iter_ris_entries
+from benchmarks.fakes import FakeChatClient, InMemoryDatabase
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+RIS = "".join(f"TY  - JOUR\nTI  - Study {n}\nAB  - Abstract {n}.\nER  -\n\n" for n in range(30)).encode()
+RESULT = ScreeningResult(decision=DecisionType.EXCLUDE, confidence=0.95, rationale="Animal model")
+
+
+def _cascade(criteria: ScreeningCriteria) -> ScreeningCascade:
+    return ScreeningCascade([
+        [ScreeningAgent(f"tier-{tier}", criteria, client=FakeChatClient(latency=0.0, salt=model), model=model)]
+        for tier, model in enumerate(["model-a", "model-b"])
+    ])
+
+
+def _queue(db, path: str) -> JobQueue:
+    queue = JobQueue(db=db, cascade_factory=_cascade, job_store=SQLiteJobStore(path))
+    queue.cascade_mode = True
+    queue.retry_delay = 0
+    return queue
+
+
+def test_interrupted_job_resumes_where_it_stopped(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "jobs.sqlite3")
+        db = InMemoryDatabase()
+        await db.store_ris_entries("job", list(iter_ris_entries([RIS])))
+
+        # First process: a third of the studies screened before it stopped
+        before = _queue(db, path)
+        job = await before.prepare_job("job", CRITERIA, priority=2)
+        decided = sorted(db.client.tables["studies"])[:10]
+        await db.save_decisions(decided, RESULT)
+        for study_id in decided:
+            await before._record_result("job", study_id, RESULT)
+        job["cascade"] = _cascade(CRITERIA).stats
+        job["cascade"]["tiers"][0]["screened"] = job["cascade"]["tiers"][0]["resolved"] = 10
+        job["dead_letters"] = 1
+        await before.job_store.record_dead_letters(job, 1)
+        before._set_status("job", JobStatus.PROCESSING)
+        await before.job_store.save_job(job)
+        before.job_store.close()
+
+        after = _queue(db, path)
+        resumed = await after.resume_jobs()
+        job = after.jobs["job"]
+        reloaded = (job["priority"], job["dead_letters"], job["processed_studies"], job["cascade"]["tiers"][0]["screened"])
+        await after._admitted["job"]
+        after.job_store.close()
+        return resumed, reloaded, job
+
+    resumed, reloaded, job = asyncio.run(scenario())
+    assert resumed == 1
+    assert reloaded == (2, 1, 10, 10)
+    assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+    assert job["processed_studies"] == 30
+    # The cascade's counters carry on from the first process
+    assert job["cascade"]["tiers"][0]["screened"] == 30
@@ -0,0 +1,44 @@
+"""
+Lexical pre-screening (utils/prefilter.py):
+
+    python -m pytest -q test_prefilter.py
+"""
+from models import ScreeningCriteria
+from utils.prefilter import LexicalPrefilter
+
+FILLER = [
+    ("f1", "Fluid balance in the intensive care unit", "An observational cohort of adults in intensive care."),
+    ("f2", "Sepsis bundles and mortality", "A registry analysis of sepsis care in adults."),
+    ("f3", "Early mobilisation after surgery", "A randomized trial of early mobilisation in adults."),
+]
+
+
+def _excluded(criteria: ScreeningCriteria, *studies) -> set:
+    prefilter = LexicalPrefilter(criteria)
+    for study in [*studies, *FILLER]:
+        prefilter.add(*study)
+    return {study_id for ids in prefilter.exclusions().values() for study_id in ids}
+
+
+def test_two_term_phrase_excludes_from_the_abstract():
+    criteria = ScreeningCriteria(inclusion=["adults with septic shock"], exclusion=["animal model"])
+    study = ("s1", "Vasopressin dosing", "We used a porcine animal model of endotoxaemia.")
+    assert _excluded(criteria, study) == {"s1"}
+
+
+def test_single_term_phrase_needs_a_title_match():
+    criteria = ScreeningCriteria(inclusion=["adults with septic shock"], exclusion=["Animal studies"])
+    in_abstract = ("s1", "Vasopressin dosing in shock", "Earlier animal work motivated this trial in patients.")
+    in_title = ("s2", "Vasopressin in an animal model", "Pigs received vasopressin.")
+    assert _excluded(criteria, in_abstract, in_title) == {"s2"}
+
+
+def test_negated_mention_does_not_exclude():
+    criteria = ScreeningCriteria(inclusion=["adults with septic shock"], exclusion=["animal model"])
+    study = ("s1", "Vasopressin dosing", "Unlike animal models, we enrolled critically ill patients.")
+    assert _excluded(criteria, study) == set()
+
+
+def test_negated_phrase_is_never_used():
+    criteria = ScreeningCriteria(inclusion=["adults with septic shock"], exclusion=["not randomized"])
+    assert not LexicalPrefilter(criteria).can_exclude
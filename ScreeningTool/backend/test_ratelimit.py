@@ -0,0 +1,94 @@
+"""
+Per-key rate limiter (utils/ratelimit.py) on a hand-driven clock: bucket
+refill, the halving on a 429 and the additive recovery:
+
+    python -m pytest -q test_ratelimit.py
+"""
+import asyncio
+
+from utils.ratelimit import KeyRateLimiter, TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_refills_continuously_up_to_capacity():
+    clock = Clock()
+    bucket = TokenBucket(60, clock)  # one per second
+    bucket.take(60)
+    assert bucket.wait_time(1, clock.now) == 1.0
+    clock.now = 30.0
+    assert bucket.wait_time(30, clock.now) == 0.0 and bucket.tokens == 30.0
+    clock.now = 1000.0
+    bucket.wait_time(1, clock.now)
+    assert bucket.tokens == 60.0
+    # A request over capacity only waits for a full bucket
+    bucket.take(60)
+    assert bucket.wait_time(600, clock.now) == 60.0
+
+
+def test_token_bucket_is_settled_with_the_real_usage():
+    async def scenario():
+        clock = Clock()
+        limiter = KeyRateLimiter("key", requests_per_minute=60, tokens_per_minute=6000, clock=clock)
+        started_at = await limiter.acquire(1000)
+        limiter.release(tokens_used=1500, tokens_estimated=1000)
+        waits = [limiter._bucket_wait(6000, clock.now)]
+        clock.now = 15.0
+        waits.append(limiter._bucket_wait(6000, clock.now))
+        return started_at, waits
+
+    started_at, waits = asyncio.run(scenario())
+    assert started_at == 0.0
+    assert waits == [15.0, 0.0]  # 1500 tokens short at 100 a second
+
+
+def test_a_429_halves_the_limit_once_per_round_and_pauses_the_key():
+    clock = Clock()
+    limiter = KeyRateLimiter("key", max_concurrency=8, clock=clock)
+    clock.now = 1.0
+    limiter.on_rate_limited(started_at=0.0, retry_after=5.0)
+    assert limiter.limit == 4.0
+    # Requests of the same round that were already in flight don't cut again
+    limiter.on_rate_limited(started_at=0.5)
+    assert limiter.limit == 4.0
+    assert limiter.stats()["paused_for"] == 5.0 and limiter._bucket_wait(1, clock.now) == 5.0
+
+    clock.now = 2.0
+    limiter.on_rate_limited(started_at=1.5)
+    limiter.on_rate_limited(started_at=3.0)
+    limiter.on_rate_limited(started_at=4.0)
+    assert limiter.limit == 1.0  # never below one
+    assert limiter.rate_limited == 5
+
+
+def test_successes_recover_about_one_per_round():
+    limiter = KeyRateLimiter("key", max_concurrency=4, clock=Clock())
+    limiter.on_rate_limited(started_at=0.0)
+    assert limiter.limit == 2.0
+    limiter.on_success()
+    limiter.on_success()
+    assert limiter.limit == 2.9  # 2 + 1/2 + 1/2.5
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.limit == 4.0
+
+
+def test_requests_over_the_limit_wait_for_a_release():
+    async def scenario():
+        limiter = KeyRateLimiter("key", max_concurrency=2, clock=Clock())
+        limiter.on_rate_limited(started_at=0.0)  # limit 1
+        await limiter.acquire(10)
+        second = asyncio.create_task(limiter.acquire(10))
+        await asyncio.sleep(0)
+        waiting = not second.done()
+        limiter.release()
+        await asyncio.wait_for(second, 1.0)
+        return waiting, limiter.in_flight
+
+    assert asyncio.run(scenario()) == (True, 1)
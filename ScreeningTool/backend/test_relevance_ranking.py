@@ -0,0 +1,121 @@
+"""
+Relevance ranking and the stopping rule in the job queue (utils/relevance.py),
+on the in-memory fakes (benchmarks/fakes.py):
+
+    python -m pytest -q test_relevance_ranking.py
+"""
+import os
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+import asyncio
+import functools
+import pickle
+import random
+
+from agents import ScreeningAgent
+import job_queue
+from job_queue import JobQueue
+from job_store import MemoryJobStore
+from models import JobStatus
+from utils.relevance import RelevanceRanker, term_features, term_features_batch
+from utils.risfileparsing import iter_ris_entries
+from utils.studycolumns import BLOCK_ROWS
+from benchmarks.bench_ranking import CRITERIA, INCLUDE_AT, TOPIC, TopicChatClient
+from benchmarks.fakes import InMemoryDatabase
+
+FILLER = ["cohort", "outcome", "school", "diet", "survey", "bone", "sleep", "tumor", "vaccine", "asthma", "gene", "pain"]
+
+
+def _ris(count: int, prevalence: float = 0.05) -> bytes:
+    rng = random.Random(3)
+    records = []
+    for n in range(count):
+        words = rng.sample(FILLER, 6)
+        if rng.random() < prevalence:
+            words += rng.sample(TOPIC, INCLUDE_AT + 2)
+        records.append(f"TY  - JOUR\nTI  - Study {n}\nAB  - {' '.join(words)}.\nER  -\n\n")
+    return "".join(records).encode()
+
+
+def test_block_term_features_match_per_study():
+    texts = [
+        "", "a", "The effect of Vasopressin on septic shock: a trial", "Ünïcode café naïve — x x x",
+        "see https://example.org/a-very-long-token-of-more-than-24-bytes?id=1 and (the) of"
+    ]
+    packed, ends = term_features_batch(texts)
+    assert [packed[start:end].tolist() for start, end in zip([0, *ends[:-1]], ends)] == [
+        term_features(text) for text in texts
+    ]
+
+    raw = _ris(BLOCK_ROWS + 50)
+    plain = [entry["terms"] for entry in iter_ris_entries([raw], compact=False)]
+    assert [entry["terms"] for entry in iter_ris_entries([raw])] == plain
+    assert [entry["terms"] for entry in pickle.loads(pickle.dumps(list(iter_ris_entries([raw]))))] == plain
+
+
+async def _queue(monkeypatch, studies: int = 800):
+    db = InMemoryDatabase()
+    await db.store_ris_entries("job", list(iter_ris_entries([_ris(studies)])))
+    clients = [TopicChatClient(0.0, seed=i) for i in range(3)]
+    queue = JobQueue(
+        db=db,
+        agent_factory=lambda criteria: [
+            ScreeningAgent(f"agent-{i}", criteria, client=client) for i, client in enumerate(clients)
+        ],
+        job_store=MemoryJobStore()
+    )
+    queue.relevance_ranking = True
+    queue.retry_delay = 0
+    queue.workers_per_job = 1  # decisions in the same order on every run
+    monkeypatch.setattr(job_queue, "RelevanceRanker", functools.partial(
+        RelevanceRanker, rerank_every=20, stop_recall=0.9, stop_window=100, stop_confidence=0.9
+    ))
+    job = await queue.add_job("job", CRITERIA, studies)
+    return db, queue, job
+
+
+def test_ranking_is_kept_when_the_job_is_entered_again(monkeypatch):
+    async def scenario():
+        db, queue, job = await _queue(monkeypatch)
+        loads = []
+        iter_undecided = db.iter_undecided_studies
+
+        def counted(*args, **kwargs):
+            loads.append(kwargs.get("columns"))
+            return iter_undecided(*args, **kwargs)
+        db.iter_undecided_studies = counted
+
+        await queue._rank("job")
+        ranker = queue._rankers["job"]
+        await queue._rank("job")
+        return loads, ranker is queue._rankers["job"], job["ranking"] is ranker.stats
+
+    assert asyncio.run(scenario()) == (["id,terms"], True, True)
+
+
+def test_failed_stopping_rule_is_retried(monkeypatch):
+    async def scenario():
+        db, queue, job = await _queue(monkeypatch)
+        failures = []
+        save_decisions = db.save_decisions
+
+        async def flaky(study_ids, result, *args, **kwargs):
+            if result.rationale.startswith("Not screened") and not failures:
+                failures.append(len(study_ids))
+                raise RuntimeError("connection reset")
+            return await save_decisions(study_ids, result, *args, **kwargs)
+        db.save_decisions = flaky
+
+        await queue.process_job(job)
+        rows = list(db.client.tables["studies"].values())
+        return job, failures, rows
+
+    job, failures, rows = asyncio.run(scenario())
+    assert job["status"] == JobStatus.COMPLETED, job["last_error"]
+    assert failures and job["retry_count"] == 1
+    assert job["ranking"]["stopped_after"] is not None
+    not_screened = [row for row in rows if (row["decision_rationale"] or "").startswith("Not screened")]
+    assert len(not_screened) == job["ranking"]["not_screened"] > 0
+    assert all(row["decision"] for row in rows)
@@ -0,0 +1,79 @@
+"""
+Result export (utils/resultexport.py) in all three formats, on the in-memory
+PostgREST stand-in (benchmarks/fakes.py):
+
+    python -m pytest -q test_result_export.py
+"""
+import asyncio
+import io
+import json
+
+import openpyxl
+import rispy
+
+from benchmarks.fakes import InMemoryDatabase
+from utils.resultexport import EXCEL_HEADER, export_results
+from utils.risfileparsing import iter_ris_entries
+
+RIS = b"".join(
+    f"TY  - JOUR\nTI  - Study {n}\nAB  - Abstract {n}.\nN1  - Imported note {n}\nER  -\n\n".encode() for n in range(4)
+)
+DECISIONS = ["include", "exclude", "maybe", "include"]
+
+
+def _export(format: str, **kwargs) -> bytes:
+    async def scenario():
+        db = InMemoryDatabase()
+        await db.store_ris_entries("job", list(iter_ris_entries([RIS])))
+        rows = sorted(db.client.tables["studies"].values(), key=lambda row: row["title"])
+        for row, decision in zip(rows, DECISIONS):
+            row["decision"] = decision
+            row["decision_rationale"] = f"Reason for\n{row['title']}"
+        # Study 3 was found to duplicate Study 0 at upload
+        rows[3]["duplicate_of"] = rows[0]["id"]
+        chunks = [chunk async for chunk in export_results(db, "job", format, **kwargs)]
+        return b"".join(chunks)
+    return asyncio.run(scenario())
+
+
+def test_ris_records_carry_the_screening_decision():
+    records = rispy.loads(_export("ris").decode())
+
+    assert sorted(record["title"] for record in records) == ["Study 0", "Study 1", "Study 2"]
+    study_1 = next(record for record in records if record["title"] == "Study 1")
+    assert study_1["notes"] == [
+        "Imported note 1", "Screening decision: exclude", "Screening rationale: Reason for Study 1"
+    ]
+
+
+def test_ris_only_for_one_decision():
+    records = rispy.loads(_export("ris", decision="include").decode())
+    assert [record["title"] for record in records] == ["Study 0"]
+
+
+def test_duplicates_are_exported_when_asked_for():
+    records = rispy.loads(_export("ris", decision="include", include_duplicates=True).decode())
+
+    assert sorted(record["title"] for record in records) == ["Study 0", "Study 3"]
+    duplicate = next(record for record in records if record["title"] == "Study 3")
+    assert any(note.startswith("Screening: duplicate of ") for note in duplicate["notes"])
+
+
+def test_jsonl_rows():
+    rows = [json.loads(line) for line in _export("json").decode().splitlines()]
+
+    assert {row["title"]: row["decision"] for row in rows} == {
+        "Study 0": "include", "Study 1": "exclude", "Study 2": "maybe"
+    }
+    assert all(row["duplicate_of"] is None for row in rows)
+
+
+def test_excel_sheet():
+    sheet = openpyxl.load_workbook(io.BytesIO(_export("excel", include_duplicates=True))).active
+    header, *rows = [list(row) for row in sheet.iter_rows(values_only=True)]
+    assert header == EXCEL_HEADER
+
+    by_title = {row[header.index("title")]: row for row in rows}
+    assert sorted(by_title) == ["Study 0", "Study 1", "Study 2", "Study 3"]
+    assert by_title["Study 2"][header.index("decision")] == "maybe"
+    assert by_title["Study 3"][header.index("duplicate_of")] == by_title["Study 0"][header.index("id")]
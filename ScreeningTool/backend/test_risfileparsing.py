@@ -0,0 +1,53 @@
+"""
+RIS parsing (utils/risfileparsing.py):
+
+    python -m pytest -q test_risfileparsing.py
+"""
+import asyncio
+
+import pytest
+
+from utils.risfileparsing import CHUNK_SIZE, RISRecordSplitter, iter_bytes, parse_ris_file
+
+RIS = b"TY  - JOUR\nTI  - Vasopressin in septic shock\nAB  - A trial.\nKW  - sepsis\nER  -\n\n"
+
+
+def test_parse_ris_file_returns_plain_dicts():
+    entries = asyncio.run(parse_ris_file(RIS * 2))
+    assert [type(entry) for entry in entries] == [dict, dict]
+    assert entries[0]["title"] == "Vasopressin in septic shock" and entries[0]["keywords"] == ["sepsis"]
+
+
+def test_parse_ris_file_reports_broken_records():
+    with pytest.raises(ValueError, match=r"Entry 2 \(line 7\): missing required field"):
+        asyncio.run(parse_ris_file(RIS + b"TY  - JOUR\nPY  - 2020\nER  -\n\n"))
+
+
+def _split(content: bytes, chunk_size: int):
+    splitter = RISRecordSplitter()
+    records = []
+    for chunk in iter_bytes(content, chunk_size):
+        records.extend(splitter.feed(chunk))
+    records.extend(splitter.close())
+    return records
+
+
+RECORD = "TY  - JOUR\nTI  - Café naïve — ß\nAB  - Line one\n  continued.\nER  -\n"
+SPLITS = {
+    "lf": ((RECORD + "\n") * 3, [(1, 5), (7, 5), (13, 5)]),
+    "crlf": ((RECORD + "\n").replace("\n", "\r\n") * 2, [(1, 5), (7, 5)]),
+    "bom and export header": ("\ufeffProvider: Embase\n\n" + RECORD, [(3, 5)]),
+    "no newline at the end": (RECORD.rstrip("\n"), [(1, 5)]),
+    "unterminated last record": (RECORD + "TY  - JOUR\nTI  - Cut off", [(1, 5), (6, 2)]),
+    "record over a chunk boundary": ("\n" * (CHUNK_SIZE - 20) + RECORD, [(CHUNK_SIZE - 19, 5)])
+}
+
+
+@pytest.mark.parametrize("text, expected", SPLITS.values(), ids=SPLITS.keys())
+def test_records_do_not_depend_on_chunk_boundaries(text, expected):
+    content = text.encode("utf-8")
+    records = _split(content, CHUNK_SIZE)
+    assert _split(content, 1) == records
+    assert [(start, len(lines)) for start, lines in records] == expected
+    assert all(not line.endswith("\r") and not line.startswith("\ufeff") for _, lines in records for line in lines)
+    assert records[0][1][1] == "TI  - Café naïve — ß"
@@ -0,0 +1,57 @@
+"""
+Writing screening decisions and dead letters back (Database.save_decision,
+Database.dead_letter_study), on the in-memory PostgREST stand-in
+(benchmarks/fakes.py):
+
+    python -m pytest -q test_save_decision.py
+"""
+import asyncio
+
+from benchmarks.fakes import InMemoryDatabase
+from models import DecisionType, ScreeningResult
+from utils.risfileparsing import iter_ris_entries
+
+RIS = b"TY  - JOUR\nTI  - Study\nAB  - Abstract.\nER  -\n\nTY  - JOUR\nTI  - Study\nAB  - Abstract.\nER  -\n\n"
+RESULT = ScreeningResult(decision=DecisionType.INCLUDE, confidence=0.9, rationale="Relevant")
+
+
+def _save(holder: str):
+    """A representative with one duplicate, claimed by `holder`; worker-1 saves its decision"""
+    async def scenario():
+        db = InMemoryDatabase()
+        representative, duplicate = iter_ris_entries([RIS], compact=False)
+        representative["id"], duplicate["id"] = "s1", "s2"
+        duplicate["duplicate_of"] = "s1"
+        await db.store_ris_entries("job", [representative, duplicate])
+        db.client.tables["studies"]["s1"]["claimed_by"] = holder
+
+        saved = await db.save_decision("s1", RESULT, "worker-1")
+        studies = db.client.tables["studies"]
+        return saved, studies["s1"], studies["s2"]
+    return asyncio.run(scenario())
+
+
+def test_decision_is_copied_onto_duplicates():
+    saved, representative, duplicate = _save("worker-1")
+    assert saved
+    assert representative["decision"] == duplicate["decision"] == "include"
+    assert representative["claimed_by"] is None
+
+
+def test_lost_lease_writes_nothing():
+    saved, representative, duplicate = _save("worker-2")
+    assert not saved
+    assert representative["decision"] is None and duplicate["decision"] is None
+    assert representative["claimed_by"] == "worker-2"
+
+
+def test_dead_letters_are_not_listed_as_undecided():
+    async def scenario():
+        db = InMemoryDatabase()
+        await db.store_ris_entries("job", list(iter_ris_entries([RIS])))
+        first, second = sorted(db.client.tables["studies"])
+        db.client.tables["studies"][first]["claimed_by"] = "worker-1"
+        assert await db.dead_letter_study(first, "Unparseable answer", "worker-1")
+        return [study["id"] async for study in db.iter_undecided_studies("job", columns="id")], second
+    undecided, second = asyncio.run(scenario())
+    assert undecided == [second]
@@ -0,0 +1,119 @@
+"""
+Job admission (JobQueue.submit / is_scheduled / queue_position) and worker slots,
+on the in-memory fakes (benchmarks/fakes.py):
+
+    python -m pytest -q test_scheduling.py
+"""
+import os
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+os.environ.setdefault("PREFILTER_ENABLED", "false")
+
+import asyncio
+
+from broker import MemoryBroker
+import job_queue
+from job_queue import JobQueue
+from job_store import MemoryJobStore, SQLiteJobStore
+from models import JobStatus, ScreeningCriteria
+from benchmarks.fakes import InMemoryDatabase
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+
+
+async def _wait_for(condition, timeout: float = 5.0):
+    async def wait():
+        while not condition():
+            await asyncio.sleep(0.01)
+    await asyncio.wait_for(wait(), timeout)
+
+
+async def _queued_locally():
+    queue = JobQueue(db=InMemoryDatabase(), job_store=MemoryJobStore())
+    queue.max_concurrent_jobs = 1
+    running = asyncio.Event()
+
+    async def process_job(job):
+        await running.wait()
+    queue.process_job = process_job
+
+    first = await queue.add_job("first", CRITERIA, 10)
+    second = await queue.add_job("second", CRITERIA, 10)
+    queue.submit(first)
+    assert queue.submit(second) == 1
+    scheduled = queue.is_scheduled("first"), queue.is_scheduled("second"), queue.is_scheduled("other")
+    running.set()
+    await _wait_for(lambda: not queue.is_scheduled("first") and not queue.is_scheduled("second"))
+    return scheduled
+
+
+def test_running_and_waiting_jobs_are_scheduled():
+    assert asyncio.run(_queued_locally()) == (True, True, False)
+
+
+async def _dispatched():
+    broker = MemoryBroker()
+    queue = JobQueue(db=InMemoryDatabase(), job_store=MemoryJobStore(), broker=broker)
+    queue.progress_hub.min_interval = 0.01
+    job = await queue.add_job("job", CRITERIA, 10)
+    await queue.dispatch(job)
+    while_on_broker = queue.is_scheduled("job")
+    await broker.finish("job", "completed")
+    await _wait_for(lambda: job["status"] == JobStatus.COMPLETED)
+    return while_on_broker, queue.is_scheduled("job")
+
+
+def test_dispatched_jobs_are_scheduled_until_the_broker_finishes_them():
+    assert asyncio.run(_dispatched()) == (True, False)
+
+
+async def _admission_order():
+    queue = JobQueue(db=InMemoryDatabase(), job_store=MemoryJobStore())
+    queue.max_concurrent_jobs = 1
+    admitted = []
+    release = asyncio.Event()
+
+    async def process_job(job):
+        admitted.append(job["id"])
+        await release.wait()
+    queue.process_job = process_job
+
+    for job_id in ("running", "low", "high", "low-2"):
+        await queue.add_job(job_id, CRITERIA, 10)
+    queue.submit(queue.jobs["running"])
+    queue.submit(queue.jobs["low"])
+    queue.submit(queue.jobs["high"], priority=2)
+    queue.submit(queue.jobs["low-2"])
+    positions = [queue.queue_position(job_id) for job_id in ("running", "low", "high", "low-2")]
+    release.set()
+    await _wait_for(lambda: len(admitted) == 4)
+    return positions, admitted
+
+
+def test_waiting_jobs_are_admitted_by_priority_then_arrival():
+    positions, admitted = asyncio.run(_admission_order())
+    assert positions == [None, 2, 1, 3]
+    assert admitted == ["running", "high", "low", "low-2"]
+
+
+def test_priority_survives_a_restart(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "jobs.sqlite3")
+        queue = JobQueue(db=InMemoryDatabase(), job_store=SQLiteJobStore(path))
+        await queue.prepare_job("job", CRITERIA, priority=2)
+        queue.job_store.close()
+        store = SQLiteJobStore(path)
+        jobs = await store.load_jobs()
+        store.close()
+        return jobs
+    assert [job["priority"] for job in asyncio.run(scenario())] == [2]
+
+
+def test_worker_slots_default_to_the_llm_concurrency(monkeypatch):
+    monkeypatch.setattr(job_queue, "SCREENING_MAX_WORKERS", None)
+    monkeypatch.setattr(job_queue, "get_agent_api_keys", lambda: ["key-1", "key-2"])
+    queue = JobQueue(db=InMemoryDatabase(), job_store=MemoryJobStore())
+    assert queue.worker_slots.slots == 2 * queue.workers_per_job
+
+    monkeypatch.setattr(job_queue, "SCREENING_MAX_WORKERS", 0)
+    assert JobQueue(db=InMemoryDatabase(), job_store=MemoryJobStore()).worker_slots.slots is None
@@ -0,0 +1,40 @@
+"""
+Screening text compiled at ingest (utils/screeningtext.py):
+
+    python -m pytest -q test_screening_text.py
+"""
+from utils.screeningtext import TRUNCATED, compile_screening_text, strip_boilerplate
+
+ABSTRACT = "Background: sepsis is common. Methods: we ran a trial. Results: mortality fell."
+
+
+def test_trailing_copyright_sentences_are_cut():
+    assert strip_boilerplate(f"{ABSTRACT} © 2019 Elsevier Ltd. All rights reserved.") == ABSTRACT
+    assert strip_boilerplate(f"{ABSTRACT} Copyright © 2020 John Wiley & Sons, Ltd.") == ABSTRACT
+    assert strip_boilerplate(f"{ABSTRACT} This article is protected by copyright. All rights reserved.") == ABSTRACT
+    assert strip_boilerplate(f"{ABSTRACT} (PsycInfo Database Record (c) 2023 APA, all rights reserved)") == ABSTRACT
+
+
+def test_leading_copyright_keeps_the_abstract():
+    for abstract in (
+        "© 2019 The Authors. Background: sepsis is common. Results: mortality fell.",
+        "Copyright 2020 Wiley. Objective: to compare two vasopressors.",
+        "© 2021 Elsevier Ltd. All rights reserved."
+    ):
+        assert strip_boilerplate(abstract) == abstract
+
+
+def test_only_whole_boilerplate_sentences_are_cut():
+    published = "Published by the WHO guidance group, the protocol was followed in every site. Results: none."
+    assert strip_boilerplate(published) == published
+    mentions = f"{ABSTRACT} Copyright law was not a barrier to access. Conclusion: it works."
+    assert strip_boilerplate(mentions) == mentions
+    assert strip_boilerplate("") == ""
+
+
+def test_compiled_text_within_the_token_budget():
+    text, tokens = compile_screening_text("A title", " ".join(["word"] * 2000), ["Sepsis", " sepsis ", "ICU"], 200)
+    assert tokens <= 200
+    assert TRUNCATED in text and text.startswith("Title: A title\n")
+    assert text.endswith("Keywords: Sepsis, ICU")
+    assert compile_screening_text("A title", " ".join(["word"] * 2000), ["Sepsis", "ICU"], 200) == (text, tokens)
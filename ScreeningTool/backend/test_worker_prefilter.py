@@ -0,0 +1,54 @@
+"""
+The lexical prefilter with several screening workers on one broker
+(worker.py, broker.MemoryBroker), on the in-memory fakes (benchmarks/fakes.py):
+
+    python -m pytest -q test_worker_prefilter.py
+"""
+import os
+
+os.environ.setdefault("DECISION_CACHE_ENABLED", "false")
+
+import asyncio
+
+from broker import MemoryBroker
+from models import ScreeningCriteria
+from worker import ScreeningWorker
+from benchmarks.fakes import InMemoryDatabase
+
+CRITERIA = ScreeningCriteria(inclusion=["adult patients"], exclusion=["animal model"])
+
+
+def test_workers_without_the_lock_wait_for_the_prefilter(monkeypatch):
+    monkeypatch.setenv("PREFILTER_ENABLED", "true")
+
+    async def scenario():
+        broker = MemoryBroker()
+        db = InMemoryDatabase()
+        holder, other = (ScreeningWorker(broker, db=db, poll_interval=0.01, name=name) for name in ("a", "b"))
+        jobs = [await worker.queue.add_job("job", CRITERIA, 10) for worker in (holder, other)]
+
+        await holder._wait_for_prefilter(jobs[0])  # takes the lock
+        waiting = asyncio.create_task(other._wait_for_prefilter(jobs[1]))
+        await asyncio.sleep(0.05)
+        blocked = not waiting.done()
+
+        summary = {"scored": 10, "auto_excluded": 4}
+        await broker.set_fields("job", {"prefilter": summary})
+        await asyncio.wait_for(waiting, 1.0)
+        return blocked, jobs[1]["prefilter"] == summary
+
+    assert asyncio.run(scenario()) == (True, True)
+
+
+def test_no_wait_when_the_prefilter_is_off(monkeypatch):
+    monkeypatch.setenv("PREFILTER_ENABLED", "false")
+
+    async def scenario():
+        broker = MemoryBroker()
+        await broker.acquire("prefilter:job:1", 600)  # held by a worker that went away
+        worker = ScreeningWorker(broker, db=InMemoryDatabase(), poll_interval=0.01)
+        job = await worker.queue.add_job("job", CRITERIA, 10)
+        await asyncio.wait_for(worker._wait_for_prefilter(job), 1.0)
+        return job["prefilter"]
+
+    assert asyncio.run(scenario()) is None
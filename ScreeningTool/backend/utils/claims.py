@@ -0,0 +1,94 @@
+# Claim sizing and lease heartbeats for screening workers
+#
+# Claims are leases (see schema.sql): a worker that stops heartbeating loses its studies once the lease
+# expires, and the next claim takes them over. Each worker:
+#       1. Sizes its next claim from its own observed seconds per study (an exponential moving average),
+#          so one claim keeps it busy for about CLAIM_TARGET_SECONDS:
+#               - slow LLM answers  -> small claims (no hoarding studies other workers could take)
+#               - fast LLM answers  -> larger claims (fewer claim round trips per study)
+#          The size is capped so a claim finishes well inside its lease, and by the worker's share of
+#          the studies still left, so the end of a job is not held by one worker
+#       2. Extends the leases of the studies it still holds every lease/3 seconds while it screens them
+
+from typing import Awaitable, Callable, Iterable, List, Optional, Set
+import asyncio
+import math
+import os
+
+CLAIM_LEASE_SECONDS = float(os.getenv("CLAIM_LEASE_SECONDS", 300))
+CLAIM_ADAPTIVE = os.getenv("CLAIM_ADAPTIVE", "true").lower() == "true"
+CLAIM_TARGET_SECONDS = float(os.getenv("CLAIM_TARGET_SECONDS", 10))  # work per claim
+CLAIM_MIN_BATCH = int(os.getenv("CLAIM_MIN_BATCH", 1))
+CLAIM_MAX_BATCH = int(os.getenv("CLAIM_MAX_BATCH", 100))
+
+
+class AdaptiveClaimSize:
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = CLAIM_MIN_BATCH,
+        maximum: int = CLAIM_MAX_BATCH,
+        target_seconds: float = CLAIM_TARGET_SECONDS,
+        lease_seconds: float = CLAIM_LEASE_SECONDS,
+        adaptive: bool = CLAIM_ADAPTIVE,
+        smoothing: float = 0.3
+    ):
+        self.initial = max(initial, 1)
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.target_seconds = target_seconds
+        self.lease_seconds = lease_seconds
+        self.adaptive = adaptive
+        self.smoothing = smoothing
+        self.seconds_per_study: Optional[float] = None  # moving average, None until the first claim finishes
+        self.last_size = self.initial
+
+    def observe(self, studies: int, seconds: float):
+        """Record how long the last claim took to screen and write back"""
+        if studies <= 0:
+            return
+        sample = seconds / studies
+        if self.seconds_per_study is None:
+            self.seconds_per_study = sample
+        else:
+            self.seconds_per_study += self.smoothing * (sample - self.seconds_per_study)
+
+    def next_size(self, remaining_share: Optional[int] = None) -> int:
+        """Studies to ask for in the next claim"""
+        size = self.initial
+        if self.adaptive and self.seconds_per_study:
+            size = self.target_seconds / self.seconds_per_study
+            # Half the lease at most, so a claim never needs its heartbeat to survive
+            size = min(size, self.lease_seconds / 2 / self.seconds_per_study)
+            size = min(max(int(size), self.minimum), self.maximum)
+        if remaining_share is not None:
+            size = min(size, max(remaining_share, 1))
+        self.last_size = size
+        return size
+
+
+async def heartbeat(
+    extend: Callable[[List[str]], Awaitable[Iterable[str]]],
+    pending: Set[str],
+    interval: float,
+    on_lost: Callable[[Set[str]], None]
+):
+    """Extend the leases on `pending` every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        if not pending:
+            continue
+        try:
+            held = set(await extend(list(pending)))
+        except Exception:
+            # A missed heartbeat is not fatal: the lease is long enough to try again
+            continue
+        lost = {study_id for study_id in pending if study_id not in held}
+        if lost:
+            pending.difference_update(lost)
+            on_lost(lost)
+
+
+def remaining_share(total: int, processed: int, workers: int) -> int:
+    """A worker's fair share of the studies a job has left"""
+    return math.ceil(max(total - processed, 0) / max(workers, 1))
@@ -0,0 +1,47 @@
+# Criteria versions and incremental re-screening
+#
+# Each POST /api/screen/{job_id} with new criteria records them as the job's next criteria version
+# (the criteria_versions table), and every decision is stored with the version that produced it
+# (studies.criteria_version). When the criteria are edited, a decision is kept unless the edit could
+# change it. Inclusion criteria are read as all required, so:
+#       1. An added inclusion or exclusion criterion can only take studies out of the review:
+#          include and maybe decisions are screened again, exclusions stand
+#       2. A removed inclusion or exclusion criterion can only let studies in: exclude and maybe
+#          decisions are screened again, inclusions stand
+#       3. Both at once (e.g. a reworded criterion): every decision is screened again
+# Criteria are compared ignoring case, surrounding whitespace and order. Each decision is compared
+# with the version that made it, not just the previous one, so a decision kept through several edits
+# is still judged against the criteria it was made under.
+
+from typing import Dict, List
+from models import DecisionType, ScreeningCriteria
+
+
+def _key(item: str) -> str:
+    return " ".join(item.split()).casefold()
+
+
+def criteria_changes(old: ScreeningCriteria, new: ScreeningCriteria) -> Dict[str, List[str]]:
+    """The criteria added and removed between two versions (empty lists are left out)"""
+    changes = {}
+    for kind in ("inclusion", "exclusion"):
+        old_items, new_items = getattr(old, kind), getattr(new, kind)
+        old_keys, new_keys = {_key(item) for item in old_items}, {_key(item) for item in new_items}
+        added = [item for item in new_items if _key(item) not in old_keys]
+        removed = [item for item in old_items if _key(item) not in new_keys]
+        if added:
+            changes[f"added_{kind}"] = added
+        if removed:
+            changes[f"removed_{kind}"] = removed
+    return changes
+
+
+def decisions_to_rescreen(old: ScreeningCriteria, new: ScreeningCriteria) -> List[str]:
+    """The decisions made under `old` that `new` could change"""
+    changes = criteria_changes(old, new)
+    decisions = set()
+    if "added_inclusion" in changes or "added_exclusion" in changes:
+        decisions |= {DecisionType.INCLUDE.value, DecisionType.MAYBE.value}
+    if "removed_inclusion" in changes or "removed_exclusion" in changes:
+        decisions |= {DecisionType.EXCLUDE.value, DecisionType.MAYBE.value}
+    return sorted(decisions)
@@ -0,0 +1,214 @@
+# Screening-decision cache
+#
+# A decision only depends on the criteria and on the study text the agent sees, so both are
+# normalized and hashed into a cache key:
+#       criteria key = sha256 of the sorted, normalized inclusion + exclusion criteria (and the model)
+#       study key    = sha256 of the study's screening text (utils/screeningtext.py): the exact text
+#                      sent to the model, so a new token budget or encoding gives new keys
+#
+# Two tiers sit in front of the LLM:
+#       1. An in-process LRU (OrderedDict) for the hot set of the running jobs
+#       2. A SQLite table on disk that survives restarts and is shared by reruns
+# Entries expire after a TTL and the disk tier is trimmed to a maximum number of rows.
+# Each tier has its own lock: the LRU's is only held for dict operations on the event loop,
+# while SQLite reads, writes and trims run in threads under the connection's lock.
+
+from typing import Dict, Iterable, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from models import DecisionType, ScreeningCriteria, ScreeningResult
+from utils.screeningtext import compile_screening_text
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: Optional[str]) -> str:
+    return _WHITESPACE.sub(" ", (text or "")).strip().casefold()
+
+
+def _normalize_all(items: Optional[Iterable[str]]) -> list:
+    return sorted({_normalize(item) for item in items or [] if _normalize(item)})
+
+
+def criteria_fingerprint(criteria: ScreeningCriteria, model: str = "") -> str:
+    """Hash the criteria so that reordering or re-spacing them keeps the same key"""
+    payload = {
+        "inclusion": _normalize_all(criteria.inclusion),
+        "exclusion": _normalize_all(criteria.exclusion),
+        "model": model
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def study_fingerprint(study: Dict) -> str:
+    """Hash the screening text of a study: compiled at ingest, or now for studies stored before it was"""
+    text = study.get("screening_text")
+    if not text:
+        text = compile_screening_text(study.get("title"), study.get("abstract"), study.get("keywords"))[0]
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class DecisionCache:
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        memory_size: int = 10000,
+        max_rows: int = 1000000,
+        ttl: float = 30 * 24 * 3600
+    ):
+        self.path = path
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.ttl = ttl  # seconds
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writes_since_trim = 0
+        self.counters = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+            "memory_evictions": 0,  # LRU entries pushed out (still on disk)
+            "disk_evictions": 0  # rows trimmed from SQLite, expired or surplus (gone for good)
+        }
+
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS decisions ("
+                " key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS decisions_created_at ON decisions (created_at)")
+            self._conn.commit()
+
+    @classmethod
+    def from_env(cls) -> Optional["DecisionCache"]:
+        """Build the cache from DECISION_CACHE_* settings, or None when disabled"""
+        if os.getenv("DECISION_CACHE_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            path=os.getenv("DECISION_CACHE_PATH", "decision_cache.sqlite3") or None,
+            memory_size=int(os.getenv("DECISION_CACHE_MEMORY_SIZE", 10000)),
+            max_rows=int(os.getenv("DECISION_CACHE_MAX_ROWS", 1000000)),
+            ttl=float(os.getenv("DECISION_CACHE_TTL", 30 * 24 * 3600))
+        )
+
+    @staticmethod
+    def make_key(criteria_key: str, study: Dict) -> str:
+        return f"{criteria_key}:{study_fingerprint(study)}"
+
+    async def get(self, key: str) -> Optional[ScreeningResult]:
+        """Look a decision up in memory first, then on disk"""
+        now = time.time()
+        with self._memory_lock:
+            cached = self._memory.get(key)
+            if cached and now - cached[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return cached[0]
+            if cached:
+                del self._memory[key]
+
+        if self._conn is not None:
+            row = await asyncio.to_thread(self._disk_get, key, now - self.ttl)
+            if row:
+                result = self._decode(row[0])
+                self._remember(key, result, row[1])
+                self.counters["disk_hits"] += 1
+                return result
+
+        self.counters["misses"] += 1
+        return None
+
+    async def set(self, key: str, result: ScreeningResult) -> None:
+        """Store a fresh decision in both tiers"""
+        now = time.time()
+        self._remember(key, result, now)
+        self.counters["stores"] += 1
+        if self._conn is not None:
+            await asyncio.to_thread(self._disk_set, key, self._encode(result), now)
+
+    def stats(self) -> Dict:
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_enabled": self._conn is not None
+        }
+
+    def close(self):
+        with self._disk_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _remember(self, key: str, result: ScreeningResult, created_at: float):
+        with self._memory_lock:
+            self._memory[key] = (result, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+                self.counters["memory_evictions"] += 1
+
+    def _disk_get(self, key: str, not_before: float):
+        with self._disk_lock:
+            return self._conn.execute(
+                "SELECT result, created_at FROM decisions WHERE key = ? AND created_at >= ?",
+                (key, not_before)
+            ).fetchone()
+
+    def _disk_set(self, key: str, payload: str, created_at: float):
+        with self._disk_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO decisions (key, result, created_at) VALUES (?, ?, ?)",
+                (key, payload, created_at)
+            )
+            self._conn.commit()
+            self._writes_since_trim += 1
+            # Expired and surplus rows are trimmed periodically rather than on every write
+            trim = self._writes_since_trim >= 1000
+            if trim:
+                self._writes_since_trim = 0
+        if trim:
+            self._trim(created_at)
+
+    def _trim(self, now: float):
+        """Delete expired and surplus rows (in a thread: the event loop never waits on it)"""
+        with self._disk_lock:
+            if self._conn is None:
+                return
+            expired = self._conn.execute("DELETE FROM decisions WHERE created_at < ?", (now - self.ttl,)).rowcount
+            surplus = self._conn.execute(
+                "DELETE FROM decisions WHERE key IN ("
+                " SELECT key FROM decisions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,)
+            ).rowcount
+            self._conn.commit()
+        with self._memory_lock:
+            self.counters["disk_evictions"] += expired + surplus
+
+    @staticmethod
+    def _encode(result: ScreeningResult) -> str:
+        return json.dumps({
+            "decision": result.decision.value,
+            "confidence": result.confidence,
+            "rationale": result.rationale
+        })
+
+    @staticmethod
+    def _decode(payload: str) -> ScreeningResult:
+        data = json.loads(payload)
+        return ScreeningResult(
+            decision=DecisionType(data["decision"]),
+            confidence=data["confidence"],
+            rationale=data["rationale"]
+        )
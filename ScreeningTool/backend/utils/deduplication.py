@@ -0,0 +1,212 @@
+# Duplicate detection between parsing and storage
+#
+# Merged Embase/PubMed/Scopus exports contain the same study several times. Each parsed entry is
+# checked, in upload order, against the representatives seen so far:
+#       1. Exact DOI match (normalized: lower case, no doi.org / doi: prefix)
+#       2. Exact match on the normalized title + abstract, unless both entries have different DOIs
+#       3. Near-duplicate match: MinHash signatures of character shingles, indexed with LSH
+#          banding so each entry is only compared with the few entries sharing a band bucket
+#          (sub-quadratic), then verified by the estimated Jaccard similarity
+#
+# The first entry of a group is its representative and is the only one screened. Every entry gets a
+# client-side UUID, and duplicates carry `duplicate_of` = the representative's id, so the
+# representative's decision can be copied onto them when it is written back.
+#
+# Speed: entries are handled in blocks. A block's normalized text is laid out in one NumPy byte
+# buffer, every 8-byte window is read as a 64-bit shingle and hashed in one vectorized pass, a
+# fixed, content-defined sample of the shingles (1 in SHINGLE_SAMPLE) is kept, and all MinHash
+# permutations and LSH band keys are computed at once. Only the bucket lookups run per entry.
+
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+import re
+import uuid
+import numpy as np
+
+SHINGLE_SIZE = 8  # characters (one 64-bit word)
+SHINGLE_SAMPLE = 16  # keep 1 in 16 shingles (the same ones for every entry); a power of two
+
+_DOI_PREFIX = re.compile(r"^(https?://(dx\.)?doi\.org/|doi:\s*)")
+
+# Letters, digits and non-ASCII bytes are kept; whitespace and punctuation are dropped entirely, so
+# spacing and punctuation differences between exports do not matter. 0 separates entries.
+_DROPPED = bytes(c for c in range(1, 128) if not chr(c).isalnum())
+
+_SAMPLE_LIMIT = np.uint64(2 ** 64 // SHINGLE_SAMPLE)  # hashes below this are the sampled 1 in SHINGLE_SAMPLE
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+_LOW_BYTES = np.uint64(0x0101010101010101)  # (w - low) & ~w & high != 0  <=>  w has a zero byte
+_HIGH_BITS = np.uint64(0x8080808080808080)
+_BAND_MIX = np.array([0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0x27D4EB2F165667C5, 1], dtype=np.uint64)
+
+
+def normalize_doi(doi) -> Optional[str]:
+    if isinstance(doi, list):
+        doi = doi[0] if doi else None
+    if not doi:
+        return None
+    return _DOI_PREFIX.sub("", doi.strip().lower()) or None
+
+
+class StudyDeduplicator:
+    def __init__(
+        self,
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        block_size: int = 512,
+        seed: int = 1
+    ):
+        if num_perm != bands * len(_BAND_MIX):
+            raise ValueError(f"num_perm must be bands * {len(_BAND_MIX)}")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.block_size = block_size
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, 2 ** 64 - 1, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 64 - 1, size=(num_perm, 1), dtype=np.uint64)
+
+        self._by_doi: Dict[str, str] = {}
+        self._by_text: Dict[bytes, Tuple[str, Optional[str]]] = {}  # text -> (representative id, DOI)
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._signatures: List[np.ndarray] = []  # Representatives with a signature only
+        self._representative_ids: List[str] = []
+        self._representative_dois: List[Optional[str]] = []
+        self._groups = set()  # Representatives that have at least one duplicate
+
+        self.stats = {
+            "records": 0,
+            "duplicates": 0,
+            "doi_matches": 0,
+            "exact_matches": 0,
+            "near_matches": 0
+        }
+
+    def _normalize_block(self, entries: List[Dict]) -> bytes:
+        """Lay out the block's normalized title + abstract text as one byte string, 0-terminated"""
+        text = "\x00".join(
+            f"{entry.get('title') or ''}{entry.get('abstract') or ''}".replace("\x00", "")
+            for entry in entries
+        )
+        return text.lower().encode("utf-8").translate(None, _DROPPED) + b"\x00"
+
+    def _signatures_for(self, text: bytes, count: int) -> List[Optional[Tuple[np.ndarray, List[int]]]]:
+        """MinHash every entry of a block in one vectorized pass, returning (signature, band keys)"""
+        signatures: List[Optional[Tuple[np.ndarray, List[int]]]] = [None] * count
+        if len(text) < SHINGLE_SIZE:
+            return signatures
+        chars = np.frombuffer(text, dtype=np.uint8)
+
+        # An 8-character shingle is exactly one (unaligned) 64-bit word of the buffer
+        windows = len(chars) - SHINGLE_SIZE + 1
+        shingles = np.ndarray(shape=(windows,), dtype=np.uint64, buffer=chars, strides=(1,))
+
+        # Keep the content-defined sample, minus shingles that contain a 0 byte (span two entries)
+        mixed = shingles * _MIX
+        positions = np.flatnonzero(mixed < _SAMPLE_LIMIT)
+        sampled = shingles[positions]
+        positions = positions[((sampled - _LOW_BYTES) & ~sampled & _HIGH_BITS) == 0]
+        if not len(positions):
+            return signatures
+        hashes = mixed[positions]
+        entry_index = np.searchsorted(np.flatnonzero(chars == 0), positions)
+
+        counts = np.bincount(entry_index, minlength=count)
+        present = np.flatnonzero(counts)
+        offsets = (np.cumsum(counts) - counts)[present]
+
+        # Multiply-shift hashing: the high 32 bits of a*x + b (mod 2**64) for each permutation
+        permuted = self._a * hashes
+        np.add(permuted, self._b, out=permuted)
+        np.right_shift(permuted, np.uint64(32), out=permuted)
+        minima = np.minimum.reduceat(permuted, offsets, axis=1).T
+        band_keys = (minima.reshape(len(present), self.bands, len(_BAND_MIX)) * _BAND_MIX).sum(axis=2).tolist()
+        minima = minima.astype(np.uint32)
+        for row, index in enumerate(present.tolist()):
+            signatures[index] = (minima[row], band_keys[row])
+        return signatures
+
+    def _resolve(self, entry: Dict, doi: Optional[str], text_key: bytes, minhash: Optional[Tuple[np.ndarray, List[int]]]) -> Dict:
+        """Attach an id and, for duplicates, the representative it belongs to"""
+        entry["id"] = entry.get("id") or str(uuid.uuid4())
+        entry["duplicate_of"] = None
+        self.stats["records"] += 1
+
+        representative = None
+        same_text, same_text_doi = self._by_text.get(text_key, (None, None))
+        if doi and doi in self._by_doi:
+            representative = self._by_doi[doi]
+            self.stats["doi_matches"] += 1
+        elif same_text and not (doi and same_text_doi and doi != same_text_doi):
+            representative = same_text
+            self.stats["exact_matches"] += 1
+        elif minhash is not None:
+            signature, band_keys = minhash
+            candidates = {index for band, key in enumerate(band_keys) for index in self._buckets[band].get(key, ())}
+            for index in sorted(candidates):
+                other_doi = self._representative_dois[index]
+                # Two different DOIs are two different studies, however similar the text
+                if doi and other_doi and doi != other_doi:
+                    continue
+                if np.count_nonzero(self._signatures[index] == signature) >= self.threshold * self.num_perm:
+                    representative = self._representative_ids[index]
+                    self.stats["near_matches"] += 1
+                    break
+
+        if representative:
+            entry["duplicate_of"] = representative
+            self.stats["duplicates"] += 1
+            self._groups.add(representative)
+            return entry
+
+        if minhash is not None:
+            signature, band_keys = minhash
+            index = len(self._signatures)
+            self._signatures.append(signature)
+            self._representative_ids.append(entry["id"])
+            self._representative_dois.append(doi)
+            for band, key in enumerate(band_keys):
+                self._buckets[band].setdefault(key, []).append(index)
+        if doi:
+            self._by_doi[doi] = entry["id"]
+        self._by_text.setdefault(text_key, (entry["id"], doi))
+        return entry
+
+    def process_block(self, entries: List[Dict]) -> List[Dict]:
+        """Deduplicate a block of entries against everything seen so far"""
+        if not entries:
+            return entries
+        text = self._normalize_block(entries)
+        signatures = self._signatures_for(text, len(entries))
+        for entry, text_key, minhash in zip(entries, text.split(b"\x00"), signatures):
+            # Compact entries carry their DOI, so the metadata dict is not rebuilt just to read it
+            doi = normalize_doi(entry["doi"] if "doi" in entry else (entry.get("metadata") or {}).get("doi"))
+            self._resolve(entry, doi, text_key, minhash)
+        return entries
+
+    def process(self, entries: Iterable[Dict]) -> Iterator[Dict]:
+        block = []
+        for entry in entries:
+            block.append(entry)
+            if len(block) >= self.block_size:
+                yield from self.process_block(block)
+                block = []
+        yield from self.process_block(block)
+
+    async def aprocess(self, entries: AsyncIterable[Dict]) -> AsyncIterator[Dict]:
+        block = []
+        async for entry in entries:
+            block.append(entry)
+            if len(block) >= self.block_size:
+                for deduplicated in self.process_block(block):
+                    yield deduplicated
+                block = []
+        for deduplicated in self.process_block(block):
+            yield deduplicated
+
+    def summary(self) -> Dict:
+        return {
+            **self.stats,
+            "unique_studies": self.stats["records"] - self.stats["duplicates"],
+            "duplicate_groups": len(self._groups)
+        }
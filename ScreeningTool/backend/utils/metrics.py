@@ -0,0 +1,357 @@
+# Instrumentation: Prometheus metrics and per-job trace spans
+#
+# A small in-process registry (no client library needed) rendered in the Prometheus text format at /metrics:
+#       Counter:   monotonically increasing totals (requests, tokens, cost, rows)
+#       Gauge:     current values; may be backed by a function read at scrape time (queue depth, workers)
+#       Histogram: cumulative buckets + sum + count (stage timings, claim sizes)
+# Label values select a child series: METRIC.labels("claim").observe(0.02).
+#
+# Disabling (METRICS_ENABLED=false) makes labels() return one shared no-op child, so an instrumented
+# hot path costs a method call and nothing else.
+#
+# Trace spans (TRACE_ENABLED=true) record the timing of each step of a job (parse, store, claim,
+# LLM call, write back) in a bounded per-job buffer, served at /api/trace/{job_id}.
+
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import bisect
+import collections
+import contextlib
+import os
+import time
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "false").lower() == "true"
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 10000))  # kept per job, oldest dropped first
+TRACE_MAX_JOBS = int(os.getenv("TRACE_MAX_JOBS", 50))
+
+# USD per million tokens, for the LLM cost counter and job estimates (defaults: gpt-4o-mini list prices)
+LLM_PRICE_PROMPT = float(os.getenv("LLM_PRICE_PROMPT_PER_MTOK", 0.15))
+LLM_PRICE_COMPLETION = float(os.getenv("LLM_PRICE_COMPLETION_PER_MTOK", 0.60))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _NoopChild:
+    def inc(self, amount: float = 1):
+        pass
+
+    def dec(self, amount: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+    def observe(self, value: float):
+        pass
+
+    def time(self):
+        return _NULL_TIMER
+
+
+_NOOP = _NoopChild()
+
+
+class _Timer:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.child.observe(time.perf_counter() - self.started)
+
+
+class _ValueChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # per bucket, the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.enabled = (registry or REGISTRY).enabled
+        self._children: Dict[Tuple, object] = {}
+        (registry or REGISTRY).register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """The series for these label values (created on first use)"""
+        if not self.enabled:
+            return _NOOP
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _label_text(self, values: Tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{self._label_text(values)} {_format_value(child.value)}"
+                for values, child in self._children.items()]
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function: Optional[Callable[[], Dict[Tuple, float]]] = None
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], Dict[Tuple, float]]):
+        """Read the gauge at scrape time: `function` returns {label values: value}"""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        if self._function is None:
+            return super()._samples()
+        return [f"{self.name}{self._label_text(tuple(values))} {_format_value(value)}"
+                for values, value in self._function().items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{self._label_text(values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    __slots__ = ("spans", "name", "attributes", "started", "wall_started")
+
+    def __init__(self, spans, name: str, attributes: Dict):
+        self.spans = spans
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.wall_started = time.time()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        span = {
+            "name": self.name,
+            "start": self.wall_started,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 3),
+            **self.attributes
+        }
+        if exc_type is not None:
+            span["error"] = exc_type.__name__
+        self.spans.append(span)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, max_spans: int = TRACE_MAX_SPANS, max_jobs: int = TRACE_MAX_JOBS):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.max_jobs = max_jobs
+        self._jobs: "collections.OrderedDict[str, collections.deque]" = collections.OrderedDict()
+
+    def span(self, job_id: Optional[str], name: str, **attributes):
+        """Context manager recording one timed step of a job"""
+        if not self.enabled or job_id is None:
+            return _NULL_TIMER
+        spans = self._jobs.get(job_id)
+        if spans is None:
+            spans = self._jobs[job_id] = collections.deque(maxlen=self.max_spans)
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return _Span(spans, name, attributes)
+
+    def get_spans(self, job_id: str) -> Optional[List[Dict]]:
+        spans = self._jobs.get(job_id)
+        return list(spans) if spans is not None else None
+
+
+REGISTRY = Registry(enabled=METRICS_ENABLED)
+TRACER = Tracer(enabled=TRACE_ENABLED)
+
+# 1. Stage timings: parse (per record), store (per insert chunk), dedup (per block), claim,
+#    screen (per LLM request), save (per decision written back), prefilter (per job), rank (per ranking)
+STAGE_SECONDS = Histogram("screening_stage_seconds", "Time spent per pipeline stage operation", ["stage"])
+
+# 2. Database requests and ingestion
+DB_REQUEST_SECONDS = Histogram("screening_db_request_seconds", "PostgREST request latency", ["method", "table"])
+DB_REQUEST_ERRORS = Counter("screening_db_request_errors_total", "Failed PostgREST requests", ["method", "table", "status"])
+RECORDS_PARSED = Counter("screening_records_parsed_total", "RIS records parsed", ["outcome"])
+ROWS_STORED = Counter("screening_rows_stored_total", "Study rows inserted", ["outcome"])
+INSERT_RETRIES = Counter("screening_insert_retries_total", "Retried multi-row inserts")
+
+# 3. Claims
+CLAIM_BATCH_SIZE = Histogram("screening_claim_batch_size", "Studies returned per claim", buckets=SIZE_BUCKETS)
+CLAIMS = Counter("screening_claims_total", "Claim requests by result (claimed, partial, empty)", ["result"])
+LEASES = Counter("screening_leases_total", "Study lease events (extended, reclaimed, lost)", ["event"])
+
+# 4. LLM requests, per agent
+LLM_REQUEST_SECONDS = Histogram("screening_llm_request_seconds", "LLM request latency", ["agent"])
+LLM_REQUESTS = Counter("screening_llm_requests_total", "LLM requests", ["agent", "outcome"])
+LLM_TOKENS = Counter("screening_llm_tokens_total", "LLM tokens used", ["agent", "kind"])
+LLM_COST = Counter("screening_llm_cost_usd_total", "Estimated LLM cost in USD", ["agent"])
+LLM_RETRIES = Counter("screening_llm_retries_total", "Retried LLM requests by reason (rate_limited, transient)", ["agent", "reason"])
+LLM_CONCURRENCY_LIMIT = Gauge("screening_llm_concurrency_limit", "Adaptive concurrency limit per API key", ["key"])
+
+# 5. Queue
+DECISIONS = Counter("screening_decisions_total", "Studies decided", ["decision", "source"])
+DEAD_LETTERS = Counter("screening_dead_letters_total", "Studies screening gave up on", ["reason"])
+CASCADE_RESOLUTIONS = Counter("screening_cascade_resolutions_total", "Cascade decisions by the tier that settled them (or unresolved)", ["tier"])
+JOBS = Gauge("screening_jobs", "Jobs by status", ["status"])
+QUEUE_DEPTH = Gauge("screening_queue_depth", "Jobs waiting or being processed")
+WORKERS_IN_FLIGHT = Gauge("screening_workers_in_flight", "Screening workers currently running")
+HTTP_REQUEST_SECONDS = Histogram("screening_http_request_seconds", "API request latency", ["method", "route", "status"])
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing each API request up to its response headers (so streams are not counted whole)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        observed = False
+
+        def _observe(status):
+            nonlocal observed
+            if not observed:
+                observed = True
+                route = getattr(scope.get("route"), "path", "unmatched")
+                HTTP_REQUEST_SECONDS.labels(scope["method"], route, str(status)).observe(time.perf_counter() - started)
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                _observe(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _observe(500)
+
+
+def llm_cost_usd(prompt_tokens: int, completion_tokens: int) -> float:
+    return (prompt_tokens * LLM_PRICE_PROMPT + completion_tokens * LLM_PRICE_COMPLETION) / 1e6
+
+
+def record_llm_usage(agent: str, prompt_tokens: int, completion_tokens: int):
+    """Token and cost counters for one LLM response"""
+    if not REGISTRY.enabled:
+        return
+    LLM_TOKENS.labels(agent, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(agent, "completion").inc(completion_tokens)
+    LLM_COST.labels(agent).inc(llm_cost_usd(prompt_tokens, completion_tokens))
@@ -0,0 +1,138 @@
+# Parallel parsing of RIS uploads in a process pool
+#
+# rispy is pure Python: parsing a large export on the event loop (or in a thread, under the GIL) holds up
+# every other request while it runs. Uploads of one or more files are parsed in worker processes instead:
+#       1. Each file is read in pieces of about PARSE_PIECE_BYTES, cut just after an `ER  -` line so that
+#          every piece holds whole records (a record longer than a piece makes its piece longer)
+#       2. The pieces of all files are parsed in a ProcessPoolExecutor of PARSE_WORKERS processes, at most
+#          PARSE_MAX_PENDING at a time, so a huge upload is never read into memory at once
+#       3. A piece comes back as compact StudyViews (pickled with their StudyColumns blocks, once per block)
+#          and its record errors. Pieces are handed on in upload order: files in the order given, records
+#          in file order, each tagged with its source_file. Errors carry the file name, with record and
+#          line numbers counted from the start of that file
+#
+# PARSE_WORKERS=0 parses the pieces in a thread instead: off the event loop, but still under the GIL.
+
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import multiprocessing
+import os
+from utils.metrics import RECORDS_PARSED
+from utils.risfileparsing import iter_ris_entries
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))  # processes, 0 = parse in a thread
+PARSE_PIECE_BYTES = int(os.getenv("PARSE_PIECE_BYTES", 1024 * 1024))
+PARSE_MAX_PENDING = int(os.getenv("PARSE_MAX_PENDING", 2 * max(PARSE_WORKERS, 1)))  # pieces read ahead
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """The shared parsing processes, started on first use (None when PARSE_WORKERS is 0)"""
+    global _pool
+    if _pool is None and PARSE_WORKERS > 0:
+        # Spawned, not forked: the API process has running threads whose locks a fork could copy held
+        _pool = ProcessPoolExecutor(PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_parse_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+
+
+def record_boundary(buffer: bytes) -> int:
+    """Offset just past the last complete `ER  -` line in `buffer`, 0 if it has none"""
+    end = len(buffer)
+    while True:
+        position = buffer.rfind(b"\nER  -", 0, end)
+        if position < 0:
+            return 0
+        line_end = buffer.find(b"\n", position + 1)
+        if line_end >= 0:
+            return line_end + 1
+        end = position
+
+
+async def read_pieces(reader, piece_bytes: int = PARSE_PIECE_BYTES) -> AsyncIterator[bytes]:
+    """Read an async file-like object in pieces of whole records"""
+    buffer = b""
+    while chunk := await reader.read(piece_bytes):
+        buffer += chunk
+        cut = record_boundary(buffer)
+        if cut:
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+    if buffer:
+        yield buffer
+
+
+def parse_piece(piece: bytes, source_file: Optional[str]) -> Tuple[List[Dict], List[Dict]]:
+    """Parse one piece of whole records (in a pool process): its entries and record errors"""
+    errors: List[Dict] = []
+    entries = list(iter_ris_entries([piece], errors, source_file=source_file))
+    return entries, errors
+
+
+async def aparse_ris_files(
+    files: List[Tuple[str, object]],
+    errors: List[Dict],
+    piece_bytes: int = PARSE_PIECE_BYTES,
+    max_pending: int = PARSE_MAX_PENDING
+) -> AsyncIterator[Dict]:
+    """
+    Parse (filename, async reader) pairs in the process pool, yielding entries in upload order:
+    - Invalid records are appended to `errors` (with their file) and skipped
+    - At most `max_pending` pieces are read and parsing ahead of the consumer
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_parse_pool()
+    pending: Deque[Tuple[asyncio.Future, int, int]] = deque()
+    records_before = [0] * len(files)  # per file, records in the pieces already handed on
+
+    def _submit(piece: bytes, file_index: int, lines_before: int):
+        filename = files[file_index][0]
+        if pool is not None:
+            future = loop.run_in_executor(pool, parse_piece, piece, filename)
+        else:
+            future = asyncio.ensure_future(asyncio.to_thread(parse_piece, piece, filename))
+        pending.append((future, file_index, lines_before))
+
+    async def _next_result() -> List[Dict]:
+        future, file_index, lines_before = pending.popleft()
+        try:
+            entries, piece_errors = await future
+        except BrokenProcessPool:
+            shutdown_parse_pool()  # A pool process died (e.g. killed for memory): the next upload starts a new pool
+            raise
+        first_record = records_before[file_index]
+        records_before[file_index] += len(entries) + len(piece_errors)
+        for error in piece_errors:
+            error.update(file=files[file_index][0], record=error["record"] + first_record, line=error["line"] + lines_before)
+        errors.extend(piece_errors)
+        if pool is not None:
+            # Counted in the pool process, where the metrics are lost
+            RECORDS_PARSED.labels("valid").inc(len(entries))
+            RECORDS_PARSED.labels("invalid").inc(len(piece_errors))
+        return entries
+
+    try:
+        for file_index, (_, reader) in enumerate(files):
+            lines_before = 0
+            async for piece in read_pieces(reader, piece_bytes):
+                _submit(piece, file_index, lines_before)
+                lines_before += piece.count(b"\n")
+                if len(pending) >= max_pending:
+                    for entry in await _next_result():
+                        yield entry
+        while pending:
+            for entry in await _next_result():
+                yield entry
+    finally:
+        for future, _, _ in pending:
+            future.cancel()
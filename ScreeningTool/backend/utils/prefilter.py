@@ -0,0 +1,219 @@
+# Lexical pre-screening before the LLM
+#
+# Trivial exclusions (animal-only work, conference abstracts, the wrong study design) are resolved
+# without an LLM call:
+#       1. Every inclusion/exclusion phrase is tokenized into query terms (stop words dropped)
+#       2. Each study's title + abstract is tokenized once; only occurrences of query terms are kept,
+#          as a sparse documents x terms count matrix (plus every document's length)
+#       3. BM25 term weights (tf saturation, length normalization, IDF over the job) are computed on
+#          the matrix data in one vectorized pass, and multiplied by a terms x phrases matrix
+#       4. A phrase score is the IDF-weighted share of the phrase's terms a study contains, in [0, 1]
+#
+# A study is excluded when its best exclusion-phrase score reaches the threshold and no inclusion
+# phrase scores above the inclusion ceiling. Everything else goes on to the agents. Phrases that
+# contain a negation ("not", "non-", "without", ...) can't be matched lexically and are never used
+# to exclude. A phrase left with a single term once stop words are dropped ("Animal studies" ->
+# "animal") only excludes when the term is in the title: one word anywhere in an abstract is too
+# weak a signal. Term occurrences just after a negation or contrast in the study text ("unlike
+# animal models, ...") are not counted.
+
+from typing import Dict, List, Optional
+import os
+import re
+import numpy as np
+from scipy import sparse
+from models import DecisionType, ScreeningCriteria, ScreeningResult
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Study text is tokenized as bytes: ASCII punctuation and whitespace become separators
+_SEPARATORS = bytes(c if c >= 128 or chr(c).isalnum() else 32 for c in range(256))
+_NEGATIONS = {"no", "non", "not", "without", "except", "excluding", "other", "than"}
+# Words that void the query terms in the few tokens after them, in study text
+_CONTRASTS = {b"no", b"non", b"not", b"without", b"except", b"excluding", b"unlike", b"instead", b"rather"}
+_CONTRAST_WINDOW = 3
+_STOP_WORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "into", "is", "it", "of",
+    "on", "or", "that", "the", "their", "these", "this", "to", "was", "were", "which", "with",
+    "study", "studies", "paper", "papers", "article", "articles", "report", "reports", "research"
+}
+
+
+def _terms(phrase: str) -> List[str]:
+    return [token for token in _TOKEN.findall(phrase.lower()) if token not in _STOP_WORDS]
+
+
+def _variants(term: str) -> List[str]:
+    """Singular/plural forms that count as the same query term"""
+    if term.endswith("ies") and len(term) > 4:
+        stem = term[:-3] + "y"
+    elif term.endswith("s") and not term.endswith("ss") and len(term) > 3:
+        stem = term[:-1]
+    else:
+        stem = term
+    variants = {term, stem, stem + "s", stem + "es"}
+    if stem.endswith("y"):
+        variants.add(stem[:-1] + "ies")
+    return sorted(variants)
+
+
+def _query_hits(columns: Dict[bytes, int], tokens: List[bytes]) -> List[int]:
+    """Query-term columns of the tokens, skipping those just after a negation or contrast"""
+    if _CONTRASTS.isdisjoint(tokens):
+        return list(map(columns.__getitem__, filter(columns.__contains__, tokens)))
+    hits = []
+    voided_until = -1
+    for position, token in enumerate(tokens):
+        if token in _CONTRASTS:
+            voided_until = position + _CONTRAST_WINDOW
+        elif position > voided_until and token in columns:
+            hits.append(columns[token])
+    return hits
+
+
+class LexicalPrefilter:
+    def __init__(
+        self,
+        criteria: ScreeningCriteria,
+        threshold: float = 0.9,
+        max_inclusion: float = 0.5,
+        k1: float = 1.2,
+        b: float = 0.75
+    ):
+        self.threshold = threshold
+        self.max_inclusion = max_inclusion
+        self.k1 = k1
+        self.b = b
+
+        # Query vocabulary: one column per term, shared by all of its plural/singular variants
+        self._columns: Dict[bytes, int] = {}
+        self._term_count = 0
+        self._phrases: List[str] = []
+        self._phrase_terms: List[List[int]] = []
+        self._is_exclusion: List[bool] = []
+        for phrase, is_exclusion in [(p, False) for p in criteria.inclusion] + [(p, True) for p in criteria.exclusion]:
+            tokens = _TOKEN.findall(phrase.lower())
+            terms = _terms(phrase)
+            if not terms or (is_exclusion and _NEGATIONS.intersection(tokens)):
+                continue
+            columns = []
+            for term in terms:
+                column = self._columns.get(term.encode())
+                if column is None:
+                    column = self._term_count
+                    self._term_count += 1
+                    for variant in _variants(term):
+                        self._columns.setdefault(variant.encode(), column)
+                columns.append(column)
+            self._phrases.append(phrase.strip())
+            self._phrase_terms.append(sorted(set(columns)))
+            self._is_exclusion.append(is_exclusion)
+
+        self._ids: List[str] = []
+        self._lengths: List[int] = []
+        self._hits: List[int] = []
+        self._indptr: List[int] = [0]
+        self._title_hits: List[int] = []
+        self._title_indptr: List[int] = [0]
+
+    @classmethod
+    def from_env(cls, criteria: ScreeningCriteria) -> Optional["LexicalPrefilter"]:
+        """Build the pre-filter from PREFILTER_* settings, or None when disabled"""
+        if os.getenv("PREFILTER_ENABLED", "false").lower() != "true":
+            return None
+        return cls(
+            criteria,
+            threshold=float(os.getenv("PREFILTER_THRESHOLD", 0.9)),
+            max_inclusion=float(os.getenv("PREFILTER_MAX_INCLUSION", 0.5))
+        )
+
+    @property
+    def can_exclude(self) -> bool:
+        return any(self._is_exclusion)
+
+    def add(self, study_id: str, title: Optional[str], abstract: Optional[str]):
+        """Tokenize one study, keeping only its length and its query-term occurrences"""
+        title_tokens = _query_hits(self._columns, (title or "").encode("utf-8").lower().translate(_SEPARATORS).split())
+        tokens = f"{title or ''} {abstract or ''}".encode("utf-8").lower().translate(_SEPARATORS).split()
+        self._ids.append(study_id)
+        self._lengths.append(len(tokens))
+        self._hits.extend(_query_hits(self._columns, tokens))
+        self._indptr.append(len(self._hits))
+        self._title_hits.extend(title_tokens)
+        self._title_indptr.append(len(self._title_hits))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def scores(self) -> np.ndarray:
+        """Studies x phrases matrix of IDF-weighted, BM25-saturated term coverage in [0, 1]"""
+        documents = len(self._ids)
+        if not documents or not self._phrases:
+            return np.zeros((documents, len(self._phrases)))
+
+        counts = sparse.csr_matrix(
+            (np.ones(len(self._hits), dtype=np.float32), np.array(self._hits, dtype=np.int32), np.array(self._indptr)),
+            shape=(documents, self._term_count)
+        )
+        counts.sum_duplicates()
+
+        lengths = np.array(self._lengths, dtype=np.float32)
+        document_frequency = np.bincount(counts.indices, minlength=self._term_count)
+        idf = np.log1p((documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+        # BM25 term weight, scaled so one occurrence in an average-length document counts fully
+        rows = np.repeat(np.arange(documents), np.diff(counts.indptr))
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows] / max(lengths.mean(), 1.0))
+        tf = counts.data
+        weights = np.minimum(tf * (self.k1 + 1) / (tf + norm), 1.0)
+        counts.data = weights * idf[counts.indices]
+
+        query = np.zeros((self._term_count, len(self._phrases)))
+        for phrase, columns in enumerate(self._phrase_terms):
+            query[columns, phrase] = 1.0 / max(idf[columns].sum(), 1e-9)
+        return np.asarray(counts @ query)
+
+    def _title_matches(self) -> np.ndarray:
+        """Studies x phrases: whether any of the phrase's terms is in the study's title"""
+        titles = sparse.csr_matrix(
+            (
+                np.ones(len(self._title_hits), dtype=np.float32),
+                np.array(self._title_hits, dtype=np.int32),
+                np.array(self._title_indptr)
+            ),
+            shape=(len(self._ids), self._term_count)
+        )
+        query = np.zeros((self._term_count, len(self._phrases)), dtype=np.float32)
+        for phrase, columns in enumerate(self._phrase_terms):
+            query[columns, phrase] = 1.0
+        return np.asarray(titles @ query) > 0
+
+    def exclusions(self) -> Dict[str, List[str]]:
+        """Study ids to exclude, grouped by the exclusion phrase that matched best"""
+        scores = self.scores()
+        if not scores.size or not self.can_exclude:
+            return {}
+        single_term = np.array([len(columns) == 1 for columns in self._phrase_terms])
+        if single_term.any():
+            scores = np.where(single_term & ~self._title_matches(), 0.0, scores)
+        is_exclusion = np.array(self._is_exclusion)
+        exclusion = scores[:, is_exclusion]
+        best = exclusion.argmax(axis=1)
+        confident = exclusion[np.arange(len(best)), best] >= self.threshold
+        if not is_exclusion.all():
+            confident &= scores[:, ~is_exclusion].max(axis=1) <= self.max_inclusion
+
+        phrases = [phrase for phrase, excluded in zip(self._phrases, self._is_exclusion) if excluded]
+        groups: Dict[str, List[str]] = {}
+        for row in np.flatnonzero(confident).tolist():
+            groups.setdefault(phrases[best[row]], []).append(self._ids[row])
+        return groups
+
+    def result_for(self, phrase: str) -> ScreeningResult:
+        return ScreeningResult(
+            decision=DecisionType.EXCLUDE,
+            confidence=self.threshold,
+            rationale=(
+                f'Excluded by lexical pre-screening: the title/abstract closely matches the exclusion '
+                f'criterion "{phrase}" and does not match the inclusion criteria.'
+            )
+        )
@@ -0,0 +1,64 @@
+# Push-based job progress
+#
+# JobQueue notifies the hub whenever a job changes (a decision recorded, a status change). Notifying is
+# O(subscribers of that job) and only sets an event, so the screening workers never wait on clients.
+# Each subscriber then:
+#       1. Wakes on its event and builds one O(1) snapshot of the job (counters only, no history)
+#       2. Sends only the fields that changed since its last message (a delta)
+#       3. Sleeps for the minimum interval, so any number of decisions in between coalesce into
+#          the next delta and each client gets at most one message per interval
+# A keepalive (an empty delta) is produced when nothing changes for a while, so proxies keep the
+# connection open. The stream ends once the job reaches a final status.
+
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+import asyncio
+from models import JobStatus
+
+FINAL_STATUSES = {JobStatus.COMPLETED, JobStatus.FAILED}
+
+
+class ProgressHub:
+    def __init__(self, min_interval: float = 0.5, keepalive: float = 15.0):
+        self.min_interval = min_interval  # seconds between two messages to one subscriber
+        self.keepalive = keepalive
+        self._subscribers: Dict[str, Set[asyncio.Event]] = {}
+
+    def notify(self, job_id: str):
+        for event in self._subscribers.get(job_id, ()):
+            event.set()
+
+    def subscriber_count(self) -> int:
+        return sum(len(events) for events in self._subscribers.values())
+
+    async def subscribe(self, job_id: str, snapshot: Callable[[], Dict]) -> AsyncIterator[Dict]:
+        """Yield coalesced deltas of `snapshot()` for one job, starting with the full snapshot"""
+        event = asyncio.Event()
+        event.set()
+        self._subscribers.setdefault(job_id, set()).add(event)
+        last: Optional[Dict] = None
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    yield {}
+                    continue
+                event.clear()
+
+                current = snapshot()
+                if last is None:
+                    delta = current
+                else:
+                    delta = {key: value for key, value in current.items() if last.get(key) != value}
+                if delta:
+                    last = current
+                    yield delta
+                if current.get("status") in FINAL_STATUSES:
+                    return
+                await asyncio.sleep(self.min_interval)
+        finally:
+            events = self._subscribers.get(job_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._subscribers[job_id]
@@ -0,0 +1,218 @@
+# Per-API-key rate limiting for LLM requests
+#
+# Every screening agent that uses the same API key (one per key, across all running jobs) shares one
+# KeyRateLimiter. Before each request it waits for:
+#       1. A token bucket of requests per minute (LLM_REQUESTS_PER_MINUTE) and one of tokens per minute
+#          (LLM_TOKENS_PER_MINUTE), both refilled continuously. The token bucket is charged the request's
+#          estimated tokens and settled with the real usage once the answer is back. 0 turns a bucket off
+#       2. A concurrency limit adjusted AIMD-style: +1/limit per success (about +1 per round of requests),
+#          halved on a 429 (at most once per round: only requests started after the last cut can cut
+#          again), between 1 and LLM_MAX_CONCURRENCY
+#       3. The end of any pause a 429 asked for with Retry-After, for every request on the key
+#
+# Failed requests are retried by the agent, one study (or batch) at a time, never the whole job:
+#       - 429, 408, 409, 5xx, timeouts and connection errors: retried up to LLM_MAX_ATTEMPTS times, after
+#         Retry-After when given, else after full-jitter exponential backoff
+#       - other 4xx (e.g. a prompt over the context length): the study alone fails
+#       - 401, 403, 404 (bad key, unknown model): fatal, every study would fail the same way
+
+from typing import Callable, Deque, Dict, Optional
+from collections import deque
+import asyncio
+import hashlib
+import os
+import random
+import time
+
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 0))  # per key, 0 = no limit
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 0))  # per key, 0 = no limit
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 32))  # per key, the AIMD ceiling
+LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", 6))  # per request, the first one included
+LLM_RETRY_BASE_SECONDS = float(os.getenv("LLM_RETRY_BASE_SECONDS", 1.0))
+LLM_RETRY_MAX_SECONDS = float(os.getenv("LLM_RETRY_MAX_SECONDS", 60.0))
+
+RETRYABLE_STATUS = {408, 409, 429}
+FATAL_STATUS = {401, 403, 404}
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0  # refill per second
+        self.tokens = self.capacity
+        self.updated = clock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (a request over capacity waits for a full bucket)"""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.tokens
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float):
+        """Take (or, with a negative amount, give back); the bucket may go into debt"""
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class KeyRateLimiter:
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.name = name
+        self.clock = clock
+        self.requests = TokenBucket(requests_per_minute, clock) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, clock) if tokens_per_minute > 0 else None
+        self.max_concurrency = max(max_concurrency, 1)
+        self.limit = float(self.max_concurrency)  # AIMD concurrency limit
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.rate_limited = 0
+        self._last_cut = float("-inf")
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _bucket_wait(self, tokens: int, now: float) -> float:
+        wait = self.paused_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        return wait
+
+    async def acquire(self, tokens: int) -> float:
+        """Wait for room for one request of about `tokens` tokens; returns when it started"""
+        while True:
+            now = self.clock()
+            wait = self._bucket_wait(tokens, now)
+            if wait <= 0 and self.in_flight < int(self.limit):
+                if self.requests is not None:
+                    self.requests.take(1)
+                if self.tokens is not None:
+                    self.tokens.take(tokens)
+                self.in_flight += 1
+                return now
+            if wait > 0:
+                # A little jitter, so the requests held back by a pause don't all go at once
+                await asyncio.sleep(wait + random.uniform(0, min(wait, 1.0) * 0.1))
+                continue
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._wake()  # Woken just as we were cancelled: pass it on
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def _wake(self):
+        """Wake as many waiting requests as the concurrency limit has room for; they check again"""
+        room = int(self.limit) - self.in_flight
+        while self._waiters and room > 0:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                room -= 1
+
+    def release(self, tokens_used: int = 0, tokens_estimated: int = 0):
+        """End a request, settling the token bucket with the real usage"""
+        self.in_flight -= 1
+        if self.tokens is not None and tokens_used:
+            self.tokens.take(tokens_used - tokens_estimated)
+        self._wake()
+
+    def on_success(self):
+        """Additive increase"""
+        self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+        self._wake()
+
+    def on_rate_limited(self, started_at: float, retry_after: Optional[float] = None):
+        """Multiplicative decrease, once per round of requests, and the pause the API asked for"""
+        self.rate_limited += 1
+        now = self.clock()
+        if started_at >= self._last_cut:
+            self.limit = max(self.limit / 2, 1.0)
+            self._last_cut = now
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+
+    def stats(self) -> Dict:
+        return {
+            "concurrency_limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "rate_limited": self.rate_limited,
+            "paused_for": round(max(self.paused_until - self.clock(), 0.0), 1)
+        }
+
+
+_limiters: Dict[str, KeyRateLimiter] = {}
+
+
+def key_name(api_key: Optional[str]) -> str:
+    """A stable label for an API key that does not reveal it"""
+    return "key-" + hashlib.sha256((api_key or "").encode()).hexdigest()[:8] if api_key else "default"
+
+
+def get_rate_limiter(api_key: Optional[str]) -> KeyRateLimiter:
+    """The limiter shared by every agent using this API key"""
+    name = key_name(api_key)
+    if name not in _limiters:
+        _limiters[name] = KeyRateLimiter(name)
+    return _limiters[name]
+
+
+def rate_limiter_stats() -> Dict[str, Dict]:
+    return {name: limiter.stats() for name, limiter in _limiters.items()}
+
+
+def error_status(error: Exception) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """The wait the API asked for (Retry-After, or OpenAI's retry-after-ms), if any"""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):  # An HTTP date: fall back to backoff
+        pass
+    return None
+
+
+def classify_error(error: Exception) -> str:
+    """rate_limited | transient (retry) | permanent (this request only) | fatal (every request)"""
+    status = error_status(error)
+    if status == 429:
+        return "rate_limited"
+    if status in RETRYABLE_STATUS or (status is not None and status >= 500):
+        return "transient"
+    if status in FATAL_STATUS:
+        return "fatal"
+    if status is not None:
+        return "permanent"
+    # No HTTP status: timeouts and dropped connections are worth another try, anything else is a bug
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)) or type(error).__name__ in (
+        "APITimeoutError", "APIConnectionError", "ReadTimeout", "ConnectTimeout", "RemoteProtocolError"
+    ):
+        return "transient"
+    return "fatal"
+
+
+def backoff_seconds(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Retry-After when given, else full-jitter exponential backoff for the `attempt`th failure"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, min(retry_after, 1.0) * 0.1)
+    return random.uniform(0, min(LLM_RETRY_MAX_SECONDS, LLM_RETRY_BASE_SECONDS * 2 ** (attempt - 1)))
@@ -0,0 +1,311 @@
+# Relevance-ranked screening order and a statistical stopping rule
+#
+# Studies are claimed most-likely-include first, so the includes of a review are found early:
+#       1. At ingest, each study's title + abstract is reduced to hashed term features: every token (stop
+#          words dropped) is hashed (CRC32) into one of 2^20 buckets, and the study keeps its buckets with
+#          their counts, packed as bucket << 4 | min(count, 15) (studies.terms). Nothing leaves the machine.
+#          Parsed studies are hashed a StudyColumns block at a time (term_features_batch: numpy, the CRC of
+#          every token of the block computed byte position by byte position), about 4x faster than per study
+#       2. When a job starts, the features of its studies are loaded into a sparse matrix and weighted by
+#          TF-IDF over the job (1 + log tf, L2-normalized rows)
+#       3. The query is the inclusion criteria (hashed the same way) plus the centroid of the studies
+#          decided include (maybe counts half), minus a quarter of the exclude centroid (Rocchio). Every
+#          RELEVANCE_RERANK_EVERY decisions the studies not yet handed out are scored again (one sparse
+#          matrix-vector product, off the event loop) and claimed in score order
+#
+# Stopping rule (RELEVANCE_STOP_RECALL, off by default):
+#       Ranked screening finds includes ever more slowly. The studies still unscreened were all ranked below
+#       the last RELEVANCE_STOP_WINDOW screened ones, so their include rate is taken to be at most that
+#       window's (include and maybe both count), at its upper confidence bound (Clopper-Pearson,
+#       RELEVANCE_STOP_CONFIDENCE). Recall is then estimated as found / (found + bound x unscreened). Once
+#       that passes the target, the rest of the ranking is excluded without an LLM call, with a rationale
+#       saying so (they can be screened later by re-screening with edited criteria, or reviewed by hand).
+
+from typing import Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter, deque
+import math
+import os
+import zlib
+import numpy as np
+from scipy import sparse
+from scipy.stats import beta
+from models import DecisionType, ScreeningCriteria, ScreeningResult
+from utils.prefilter import _SEPARATORS, _STOP_WORDS
+
+RELEVANCE_RANKING = os.getenv("RELEVANCE_RANKING", "true").lower() == "true"
+RELEVANCE_RERANK_EVERY = int(os.getenv("RELEVANCE_RERANK_EVERY", 100))  # decisions between two rankings
+RELEVANCE_STOP_RECALL = float(os.getenv("RELEVANCE_STOP_RECALL", 0)) or None  # e.g. 0.95; unset = screen everything
+RELEVANCE_STOP_WINDOW = int(os.getenv("RELEVANCE_STOP_WINDOW", 500))  # last ranked decisions the rate is taken from
+RELEVANCE_STOP_CONFIDENCE = float(os.getenv("RELEVANCE_STOP_CONFIDENCE", 0.95))
+
+HASH_BITS = 20
+_COUNT_BITS = 4
+_STOP_TOKENS = {word.encode() for word in _STOP_WORDS}
+
+
+def term_features(*texts: Optional[str]) -> List[int]:
+    """Hashed term counts of some text, packed as sorted bucket << 4 | min(count, 15)"""
+    tokens = " ".join(text or "" for text in texts).encode("utf-8").lower().translate(_SEPARATORS).split()
+    mask = (1 << HASH_BITS) - 1
+    counts = Counter(zlib.crc32(token) & mask for token in tokens if token not in _STOP_TOKENS and len(token) > 1)
+    limit = (1 << _COUNT_BITS) - 1
+    return sorted(bucket << _COUNT_BITS | min(count, limit) for bucket, count in counts.items())
+
+
+def _crc_table() -> np.ndarray:
+    table = np.arange(256, dtype=np.uint32)
+    for _ in range(8):
+        table = np.where(table & 1, (table >> 1) ^ np.uint32(0xEDB88320), table >> 1)
+    return table
+
+
+_CRC_TABLE = _crc_table()  # zlib's CRC-32, a byte at a time
+_VECTOR_BYTES = 24  # longer tokens (URLs, chemical names) are few: they are hashed one by one
+_STOP_HASHES = np.array(sorted(zlib.crc32(token) for token in _STOP_TOKENS), dtype=np.uint32)
+
+
+def term_features_batch(texts: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    term_features of many texts at once: all their packed features (uint32) back to back, and the
+    end of each text's features in them. Tokens are matched to stop words by their CRC32
+    """
+    encoded = [text.encode("utf-8") for text in texts]
+    data = np.frombuffer(b" ".join(encoded).lower().translate(_SEPARATORS), dtype=np.uint8)
+    text_starts = np.cumsum([0] + [len(text) + 1 for text in encoded[:-1]])
+
+    # Every separator is a space once translated
+    edges = np.flatnonzero(np.diff(data != 32, prepend=False, append=False))
+    starts, lengths = edges[0::2], edges[1::2] - edges[0::2]
+    keep = lengths > 1
+    starts, lengths = starts[keep], lengths[keep]
+
+    # Longest tokens first, so the tokens still being hashed at each byte position are a prefix
+    order = np.argsort(-np.minimum(lengths, 255).astype(np.int16), kind="stable")
+    positions, sorted_lengths = starts[order], lengths[order]
+    crc = np.full(len(positions), 0xFFFFFFFF, dtype=np.uint32)
+    longest = min(int(sorted_lengths[0]), _VECTOR_BYTES) if len(sorted_lengths) else 0
+    for active in np.searchsorted(-sorted_lengths, -np.arange(1, longest + 1), side="right").tolist():
+        current = crc[:active]
+        index = data[positions[:active]] ^ current.astype(np.uint8)
+        current >>= 8
+        current ^= _CRC_TABLE[index]
+        positions[:active] += 1
+    crc ^= np.uint32(0xFFFFFFFF)
+    if longest == _VECTOR_BYTES:
+        raw = data.tobytes()
+        for row in np.flatnonzero(sorted_lengths > _VECTOR_BYTES).tolist():
+            start = int(starts[order[row]])
+            crc[row] = zlib.crc32(raw[start:start + int(sorted_lengths[row])])
+    hashes = np.empty_like(crc)
+    hashes[order] = crc
+
+    content = ~np.isin(hashes, _STOP_HASHES)
+    text_rows = np.searchsorted(text_starts, starts[content], side="right") - 1
+    mask = (1 << HASH_BITS) - 1
+    keys = np.sort(text_rows.astype(np.int64) << HASH_BITS | (hashes[content] & mask))
+    firsts = np.flatnonzero(np.diff(keys, prepend=-1))
+    counts = np.diff(firsts, append=len(keys))
+    keys = keys[firsts]
+    packed = ((keys & mask) << _COUNT_BITS | np.minimum(counts, (1 << _COUNT_BITS) - 1)).astype(np.uint32)
+    return packed, np.searchsorted(keys >> HASH_BITS, np.arange(len(texts)), side="right")
+
+
+def _include_like(decision: str) -> bool:
+    return decision in (DecisionType.INCLUDE.value, DecisionType.MAYBE.value)
+
+
+class RelevanceRanker:
+    def __init__(
+        self,
+        criteria: ScreeningCriteria,
+        rerank_every: int = RELEVANCE_RERANK_EVERY,
+        stop_recall: Optional[float] = RELEVANCE_STOP_RECALL,
+        stop_window: int = RELEVANCE_STOP_WINDOW,
+        stop_confidence: float = RELEVANCE_STOP_CONFIDENCE
+    ):
+        self.rerank_every = rerank_every
+        self.stop_recall = stop_recall
+        self.stop_window = stop_window
+        self.stop_confidence = stop_confidence
+        self._query_terms = term_features(*criteria.inclusion)
+
+        self._ids: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._buckets: List[int] = []
+        self._counts: List[int] = []
+        self._indptr: List[int] = [0]
+        self._decisions: Dict[int, str] = {}  # row -> decision, for the studies decided before ranking
+
+        self._matrix: Optional[sparse.csr_matrix] = None
+        self._sums: Dict[str, np.ndarray] = {}
+        self._labelled = {decision.value: 0 for decision in DecisionType}
+        self._taken: Optional[np.ndarray] = None  # rows handed out (or decided before ranking)
+        self._order = np.zeros(0, dtype=np.int64)
+        self._next = 0
+        self._since_rerank = 0
+        self._reranking = False
+        self._window: Deque[bool] = deque(maxlen=stop_window)
+        self.found = 0  # include and maybe decisions so far
+        self.undecided = 0
+        self.stopped = False
+        self.stats = {
+            "studies": 0,
+            "reranks": 0,
+            "ranked_decisions": 0,
+            "includes_found": 0,
+            "window_include_rate": None,
+            "estimated_recall": None,
+            "stop_recall": stop_recall,
+            "stopped_after": None,  # ranked decisions when the stopping rule ended the job
+            "not_screened": 0  # studies the stopping rule excluded
+        }
+
+    def add(self, study_id: str, terms: Optional[Iterable[int]], decision: Optional[str] = None):
+        """One study of the job, with its decision if it already has one (studies without terms rank last)"""
+        row = len(self._ids)
+        self._ids.append(study_id)
+        self._rows[study_id] = row
+        for packed in terms or ():
+            self._buckets.append(packed >> _COUNT_BITS)
+            self._counts.append(packed & ((1 << _COUNT_BITS) - 1))
+        self._indptr.append(len(self._buckets))
+        if decision is not None:
+            self._decisions[row] = decision
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def build(self):
+        """Weight the features and rank the undecided studies (after the last add)"""
+        documents = len(self._ids)
+        width = 1 << HASH_BITS
+        counts = np.array(self._counts, dtype=np.float32)
+        matrix = sparse.csr_matrix(
+            (1 + np.log(np.maximum(counts, 1)), np.array(self._buckets, dtype=np.int32), np.array(self._indptr)),
+            shape=(documents, width)
+        )
+        document_frequency = np.bincount(matrix.indices, minlength=width)
+        self._idf = (np.log((1 + documents) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix.data *= self._idf[matrix.indices]
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        matrix = sparse.csr_matrix(sparse.diags(1 / np.maximum(norms, 1e-9)) @ matrix)
+        self._matrix = matrix
+        self._buckets, self._counts, self._indptr = [], [], [0]
+
+        query = np.zeros(width, dtype=np.float32)
+        for packed in self._query_terms:
+            query[packed >> _COUNT_BITS] = self._idf[packed >> _COUNT_BITS]
+        self._criteria = query / max(float(np.linalg.norm(query)), 1e-9)
+        self._sums = {decision.value: np.zeros(width, dtype=np.float32) for decision in DecisionType}
+
+        self._taken = np.zeros(documents, dtype=bool)
+        for row, decision in self._decisions.items():
+            self._taken[row] = True
+            self._learn(row, decision)
+        self.undecided = documents - len(self._decisions)
+        self._decisions = {}
+        self.stats["studies"] = documents
+        self.rerank()
+
+    def _learn(self, row: int, decision: str):
+        start, end = self._matrix.indptr[row], self._matrix.indptr[row + 1]
+        self._sums[decision][self._matrix.indices[start:end]] += self._matrix.data[start:end]
+        self._labelled[decision] += 1
+        if _include_like(decision):
+            self.found += 1
+            self.stats["includes_found"] = self.found
+
+    def _query(self) -> np.ndarray:
+        query = self._criteria.copy()
+        for decision, weight in ((DecisionType.INCLUDE, 1.0), (DecisionType.MAYBE, 0.5), (DecisionType.EXCLUDE, -0.25)):
+            if self._labelled[decision.value]:
+                query += weight * self._sums[decision.value] / self._labelled[decision.value]
+        return query
+
+    def rerank(self):
+        """Score every study not yet handed out against the current query (safe to run in a thread)"""
+        try:
+            available = np.flatnonzero(~self._taken)
+            scores = self._matrix[available] @ self._query()
+            order = available[np.argsort(-scores, kind="stable")]
+            self._order, self._next = order, 0
+            self.stats["reranks"] += 1
+        finally:
+            self._reranking = False
+
+    def start_rerank(self) -> bool:
+        """True (to one caller) when enough decisions came in since the last ranking; run rerank() next"""
+        if self._reranking or self._since_rerank < self.rerank_every or self._matrix is None:
+            return False
+        self._reranking = True
+        self._since_rerank = 0
+        return True
+
+    def take(self, count: int) -> List[str]:
+        """Hand out the next `count` studies in rank order"""
+        taken = []
+        while len(taken) < count and self._next < len(self._order):
+            row = int(self._order[self._next])
+            self._next += 1
+            if not self._taken[row]:
+                self._taken[row] = True
+                taken.append(self._ids[row])
+        return taken
+
+    def observe(self, study_id: str, decision: str):
+        """Learn from a decision on one of the job's studies"""
+        row = self._rows.get(study_id)
+        if row is None or self._matrix is None:
+            return
+        self._learn(row, decision)
+        self.undecided -= 1
+        self._since_rerank += 1
+        self._window.append(_include_like(decision))
+        self.stats["ranked_decisions"] += 1
+
+    def estimated_recall(self) -> Optional[float]:
+        """Found / (found + the includes the unscreened studies may still hold), once the window is full"""
+        if len(self._window) < self.stop_window or not self.found:
+            return None
+        hits = sum(self._window)
+        rate_bound = 1.0 if hits >= len(self._window) else float(
+            beta.ppf(self.stop_confidence, hits + 1, len(self._window) - hits)
+        )
+        self.stats["window_include_rate"] = round(hits / len(self._window), 4)
+        recall = self.found / (self.found + rate_bound * max(self.undecided, 0))
+        self.stats["estimated_recall"] = round(recall, 4)
+        return recall
+
+    def should_stop(self) -> bool:
+        if self.stopped or self.stop_recall is None or self._matrix is None:
+            return False
+        recall = self.estimated_recall()
+        return recall is not None and recall >= self.stop_recall
+
+    def stop(self) -> List[str]:
+        """End ranked screening: hand out (to be excluded) every study not handed out yet"""
+        self.stopped = True
+        self.stats["stopped_after"] = self.stats["ranked_decisions"]
+        remainder = [self._ids[row] for row in np.flatnonzero(~self._taken).tolist()]
+        self._taken[:] = True
+        self.stats["not_screened"] = len(remainder)
+        return remainder
+
+    def resume(self, study_ids: List[str]):
+        """Undo stop() when excluding the studies it handed out failed: they are ranked again"""
+        for study_id in study_ids:
+            self._taken[self._rows[study_id]] = False
+        self.stopped = False
+        self.stats["stopped_after"] = None
+        self.stats["not_screened"] = 0
+
+    def stop_result(self) -> ScreeningResult:
+        recall = self.stats["estimated_recall"] or 0.0
+        return ScreeningResult(
+            decision=DecisionType.EXCLUDE,
+            confidence=round(recall, 2),
+            rationale=(
+                f"Not screened: ranked below the stopping point, reached after an estimated "
+                f"{math.floor(recall * 100)}% of the includes had been found."
+            )
+        )
@@ -0,0 +1,172 @@
+# Streaming export of screening results
+#
+# Studies are paged out of the `studies` table one decision at a time (keyset pagination on id), and
+# every page is written out before the next one is fetched, so memory does not grow with the review:
+#       RIS:   each record is rewritten from the raw `metadata` column (the rispy entry stored at
+#              upload), so exported records carry every original field, plus N1 notes with the
+#              screening decision and rationale (and, for a duplicate, the study it duplicates)
+#       JSON:  JSON Lines, one study per line
+#       Excel: an openpyxl write-only workbook (rows go straight to a temporary file, not into
+#              memory); the finished file is then streamed in chunks
+# Output is flushed in ~64 KB pieces, so the first bytes of RIS and JSON Lines leave after the first page.
+# Duplicates found at upload carry their representative's decision; they are only exported when asked
+# for (include_duplicates), since they were never screened on their own.
+
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+import asyncio
+import json
+import re
+import tempfile
+from rispy.writer import RisWriter
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # Only needed for Excel exports
+    Workbook = None
+
+FLUSH_SIZE = 64 * 1024
+DECISIONS = ("include", "exclude", "maybe")
+EXPORT_COLUMNS = "id,duplicate_of,title,abstract,keywords,decision,decision_rationale,source_file,metadata"
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "ris": ("application/x-research-info-systems", "ris"),
+    "json": ("application/x-ndjson", "jsonl"),
+    "excel": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx")
+}
+
+EXCEL_HEADER = [
+    "id", "decision", "decision_rationale", "title", "abstract", "keywords", "authors", "year", "doi", "source_file",
+    "duplicate_of"
+]
+_EXCEL_CELL_LIMIT = 32767
+_ILLEGAL_EXCEL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+class _RecordWriter(RisWriter):
+    """RIS writer without the numbered header rispy puts above each record"""
+
+    def set_header(self, count):
+        return None
+
+
+_RIS_WRITER = _RecordWriter()
+
+
+async def iter_results(
+    db, job_id: str, decisions: Iterable[str] = DECISIONS, include_duplicates: bool = False
+) -> AsyncIterator[Dict]:
+    """Every decided study of the job, grouped by decision"""
+    for decision in decisions:
+        async for row in db.iter_decided_studies(
+            job_id, columns=EXPORT_COLUMNS, decision=decision, include_duplicates=include_duplicates
+        ):
+            yield row
+
+
+async def _buffered(pieces: AsyncIterator[str]) -> AsyncIterator[bytes]:
+    buffer: List[str] = []
+    size = 0
+    async for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= FLUSH_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def _screening_notes(row: Dict) -> List[str]:
+    """N1 lines telling the records apart once imported into a reference manager"""
+    notes = [f"Screening decision: {row.get('decision')}"]
+    if row.get("decision_rationale"):
+        notes.append("Screening rationale: " + " ".join(str(row["decision_rationale"]).split()))
+    if row.get("duplicate_of"):
+        notes.append(f"Screening: duplicate of {row['duplicate_of']}")
+    return notes
+
+
+def export_ris(rows: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    async def _records():
+        async for row in rows:
+            metadata = dict(row.get("metadata") or {"title": row.get("title"), "abstract": row.get("abstract")})
+            metadata["notes"] = list(metadata.get("notes") or []) + _screening_notes(row)
+            yield _RIS_WRITER.formats([metadata])
+    return _buffered(_records())
+
+
+def export_jsonl(rows: AsyncIterator[Dict]) -> AsyncIterator[bytes]:
+    async def _lines():
+        async for row in rows:
+            yield json.dumps(row, ensure_ascii=False, default=str) + "\n"
+    return _buffered(_lines())
+
+
+def _excel_cell(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, list):
+        value = "; ".join(str(item) for item in value)
+    return _ILLEGAL_EXCEL_CHARS.sub("", str(value))[:_EXCEL_CELL_LIMIT]
+
+
+def _excel_row(row: Dict) -> List:
+    metadata = row.get("metadata") or {}
+    return [
+        _excel_cell(row.get("id")),
+        _excel_cell(row.get("decision")),
+        _excel_cell(row.get("decision_rationale")),
+        _excel_cell(row.get("title")),
+        _excel_cell(row.get("abstract")),
+        _excel_cell(row.get("keywords")),
+        _excel_cell(metadata.get("authors") or metadata.get("first_authors")),
+        _excel_cell(metadata.get("year") or metadata.get("publication_year")),
+        _excel_cell(metadata.get("doi")),
+        _excel_cell(row.get("source_file")),
+        _excel_cell(row.get("duplicate_of"))
+    ]
+
+
+async def export_excel(rows: AsyncIterator[Dict], page_size: int = 1000) -> AsyncIterator[bytes]:
+    """Write rows into a write-only workbook a page at a time, then stream the saved file"""
+    if Workbook is None:
+        raise RuntimeError("The openpyxl package is required for Excel exports")
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Screening results")
+    sheet.append(EXCEL_HEADER)
+
+    def _append(page):
+        for values in page:
+            sheet.append(values)
+
+    page = []
+    async for row in rows:
+        page.append(_excel_row(row))
+        if len(page) >= page_size:
+            await asyncio.to_thread(_append, page)
+            page = []
+    await asyncio.to_thread(_append, page)
+
+    with tempfile.TemporaryFile() as output:
+        await asyncio.to_thread(workbook.save, output)
+        output.seek(0)
+        while True:
+            chunk = await asyncio.to_thread(output.read, FLUSH_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def export_results(
+    db, job_id: str, format: str, decision: Optional[str] = None, include_duplicates: bool = False
+) -> AsyncIterator[bytes]:
+    """Byte stream of the job's results in `format`, optionally for one decision only"""
+    rows = iter_results(db, job_id, [decision] if decision else DECISIONS, include_duplicates)
+    if format == "ris":
+        return export_ris(rows)
+    if format == "json":
+        return export_jsonl(rows)
+    if format == "excel":
+        return export_excel(rows)
+    raise ValueError(f"Unsupported export format: {format}")
@@ -5,59 +5,295 @@
 # Each entry is one complete study from the RIS file, and we transform each one into a parsed_entry that matches our Supabase database columns
 
 # supabase table:
-#       Column A: Complete study metadata. This would contain all the raw metadata for each study, possibly stored as a JSON or TEXT field.  
-#       Column B: Title. Extracted from the metadata for quick access and searchability.  
-#       Column C: Abstract. Also extracted for easy access and analysis.  
-#       Column D: Keywords. Could be stored as an array (`TEXT[]` in PostgreSQL) for efficient searching and filtering.  
-#       Column E: Decision. ENUM type with values `'include'`, `'exclude'`, or `'maybe'`.  
+#       Column A: Complete study metadata. This would contain all the raw metadata for each study, possibly stored as a JSON or TEXT field.
+#       Column B: Title. Extracted from the metadata for quick access and searchability.
+#       Column C: Abstract. Also extracted for easy access and analysis.
+#       Column D: Keywords. Could be stored as an array (`TEXT[]` in PostgreSQL) for efficient searching and filtering.
+#       Column E: Decision. ENUM type with values `'include'`, `'exclude'`, or `'maybe'`.
 #       Column F: Decision rationale. A TEXT field to store the AI’s reasoning for its decision.
 
+# Streaming:
+#       Uploads are read in byte chunks and cut into records at `ER  -` lines, so only one record
+#       is ever decoded and handed to rispy at a time. Each record is yielded once it is complete,
+#       and a broken record is reported (with the line it starts on) instead of failing the whole file.
 
+# Compact entries:
+#       By default each entry is appended to a StudyColumns block (utils/studycolumns.py) and yielded
+#       as a StudyView, which reads like the dict below for a fraction of its memory. The full metadata
+#       dict is only rebuilt when the row is written. Pass compact=False for plain dicts.
+#       Compact entries are yielded a block (BLOCK_ROWS records) at a time, once the block has hashed the
+#       term features of all its rows in one go (utils/relevance.py); plain dicts are hashed one by one.
 
-from typing import List, Dict
+# Source files:
+#       Pass source_file to tag every entry with the file it came from (when one upload merges the
+#       exports of several databases). utils/parallelparsing.py parses such uploads in a process pool.
+
+# Screening text:
+#       Each entry also carries the text the agents will send for it, normalized and cut to a token
+#       budget, and its token count (utils/screeningtext.py), so neither is worked out again per LLM call.
+
+
+
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+import codecs
+import time
 import rispy
 from datetime import datetime
+from utils.metrics import RECORDS_PARSED, STAGE_SECONDS
+from utils.relevance import term_features
+from utils.screeningtext import compile_screening_text
+from utils.studycolumns import BLOCK_ROWS, StudyColumns
+
+CHUNK_SIZE = 64 * 1024  # bytes read from the upload per iteration
+
+START_TAG = "TY  -"
+END_TAG = "ER  -"
+
+# Metric series used for every record
+_PARSE_SECONDS = STAGE_SECONDS.labels("parse")
+_VALID_RECORDS = RECORDS_PARSED.labels("valid")
+_INVALID_RECORDS = RECORDS_PARSED.labels("invalid")
+
+
+class RISRecordSplitter:
+    """
+    Incrementally decode RIS bytes and split them into records:
+    - Keeps only the current partial line and the current record in memory
+    - Yields (start_line, lines) for every record terminated by `ER  -`
+    """
+
+    def __init__(self, encoding: str = "utf-8-sig"):
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        self._pending = ""  # Trailing partial line from the previous chunk
+        self._line_no = 0
+        self._record: Optional[List[str]] = None
+        self._record_start = 0
+
+    def feed(self, chunk: bytes) -> Iterator[Tuple[int, List[str]]]:
+        """Consume a chunk of bytes and yield every record it completes"""
+        lines = (self._pending + self._decoder.decode(chunk)).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            record = self._push_line(line.rstrip("\r"))
+            if record:
+                yield record
+
+    def close(self) -> Iterator[Tuple[int, List[str]]]:
+        """Flush the final line; an unterminated record is yielded as-is so it can be reported"""
+        tail = self._pending + self._decoder.decode(b"", final=True)
+        self._pending = ""
+        if tail:
+            record = self._push_line(tail.rstrip("\r"))
+            if record:
+                yield record
+        if self._record:
+            record, self._record = self._record, None
+            yield self._record_start, record
+
+    def _push_line(self, line: str) -> Optional[Tuple[int, List[str]]]:
+        self._line_no += 1
+
+        if self._record is None:
+            # Anything between records (blank lines, export headers) is skipped
+            if line.startswith(START_TAG):
+                self._record = [line]
+                self._record_start = self._line_no
+            return None
+
+        self._record.append(line)
+        if line.startswith(END_TAG):
+            record, self._record = self._record, None
+            return self._record_start, record
+        return None
+
+
+def _build_entry(entry: Dict, columns: Optional[StudyColumns] = None) -> Dict:
+    """Transform one rispy entry into the database-ready format (a row of `columns` when given)"""
+    # Embase exports use T1/N2 instead of TI/AB, which rispy maps to primary_title/notes_abstract
+    title_key = 'title' if entry.get('title') else 'primary_title'
+    abstract_key = 'abstract' if entry.get('abstract') else 'notes_abstract'
+    title = entry.get(title_key)
+    abstract = entry.get(abstract_key)
+
+    # 3. Validate that required fields exist
+    if not title or not abstract:
+        raise ValueError("missing required field: title or abstract")
+
+    # The text the agents will send, and its token count (utils/screeningtext.py)
+    screening_text, screening_tokens = compile_screening_text(title, abstract, entry.get('keywords'))
+
+    if columns is not None:
+        # The block computes the term features of its rows in batches
+        return columns.append(
+            entry, title_key, title.strip(), abstract_key, abstract.strip(), screening_text, screening_tokens
+        )
+
+    # 4. Create a database-ready format for each entry
+    return {
+        # Store complete original entry as JSON
+        'metadata': entry,  # Column A: All original RIS data
+
+        # Extract and clean specific fields needed for AI screening
+        'title': title.strip(),  # Column B: Clean title
+        'abstract': abstract.strip(),  # Column C: Clean abstract
+        'keywords': [kw.strip() for kw in entry.get('keywords', [])],  # Column D: List of keywords
+        'terms': term_features(title, abstract),  # Hashed term features, for ranking (utils/relevance.py)
+        'screening_text': screening_text,  # Normalized, truncated prompt text for the agents
+        'screening_tokens': screening_tokens,
+
+        # Add fields for AI decisions (initially empty)
+        'decision': None,  # Column E: Will be filled by AI (include/exclude/maybe)
+        'decision_rationale': None,  # Column F: AI's reasoning
+    }
+
+
+def _parse_record(
+    index: int, start_line: int, lines: List[str], errors: Optional[List[Dict]], columns: Optional[StudyColumns] = None
+) -> Optional[Dict]:
+    """Parse a single record, recording (rather than raising) any problem with it"""
+    started = time.perf_counter()
+    try:
+        if not lines[-1].startswith(END_TAG):
+            raise ValueError("record is not terminated by 'ER  -'")
+
+        # rispy.loads converts the RIS format into a list of dictionaries (here: exactly one)
+        entries = rispy.loads("\n".join(lines))
+        if len(entries) != 1:
+            raise ValueError(f"expected one record, found {len(entries)}")
+
+        entry = _build_entry(entries[0], columns)
+        _VALID_RECORDS.inc()
+        return entry
+
+    except Exception as e:
+        _INVALID_RECORDS.inc()
+        if errors is not None:
+            errors.append({
+                "record": index + 1,
+                "line": start_line,
+                "error": str(e)
+            })
+        return None
+
+    finally:
+        _PARSE_SECONDS.observe(time.perf_counter() - started)
+
+
+class _ColumnBlocks:
+    """
+    Hands out StudyColumns blocks of BLOCK_ROWS rows, so finished blocks can be freed. Compact entries
+    are held back until their block is full, then finished (term features in one batch) and released
+    """
+
+    def __init__(self, compact: bool, source_file: Optional[str] = None):
+        self.compact = compact
+        self.source_file = source_file
+        self.current: Optional[StudyColumns] = None
+        self._held: List[Dict] = []
+
+    def next(self) -> Optional[StudyColumns]:
+        if not self.compact:
+            return None
+        if self.current is None or len(self.current) >= BLOCK_ROWS:
+            self.current = StudyColumns(source_file=self.source_file)
+        return self.current
+
+    def ready(self, entry: Dict) -> List[Dict]:
+        """The entries that can be yielded now that `entry` was parsed"""
+        if not self.compact:
+            return [entry]
+        self._held.append(entry)
+        return self.flush() if len(self.current) >= BLOCK_ROWS else []
+
+    def flush(self) -> List[Dict]:
+        """Finish the current block and release its entries"""
+        if self.current is not None:
+            self.current.finish()
+        held, self._held = self._held, []
+        return held
+
+
+def iter_ris_entries(
+    chunks: Iterable[bytes], errors: Optional[List[Dict]] = None, compact: bool = True, source_file: Optional[str] = None
+) -> Iterator[Dict]:
+    """
+    Parse RIS bytes into database-ready entries, one record at a time:
+    - Accepts any iterable of byte chunks (file reads, network frames)
+    - Invalid records are appended to `errors` and skipped
+    - Entries are compact StudyViews unless `compact` is False
+    - Every entry is tagged with `source_file`, when given
+    """
+    splitter = RISRecordSplitter()
+    blocks = _ColumnBlocks(compact, source_file)
+    index = 0
+
+    def _records() -> Iterator[Tuple[int, List[str]]]:
+        for chunk in chunks:
+            yield from splitter.feed(chunk)
+        yield from splitter.close()
+
+    for start_line, lines in _records():
+        parsed_entry = _parse_record(index, start_line, lines, errors, blocks.next())
+        index += 1
+        if parsed_entry is not None:
+            if source_file is not None and not compact:
+                parsed_entry["source_file"] = source_file
+            yield from blocks.ready(parsed_entry)
+    yield from blocks.flush()
+
+
+async def aiter_ris_entries(
+    chunks: AsyncIterable[bytes], errors: Optional[List[Dict]] = None, compact: bool = True
+) -> AsyncIterator[Dict]:
+    """Async counterpart of iter_ris_entries for uploads read from the request stream"""
+    splitter = RISRecordSplitter()
+    blocks = _ColumnBlocks(compact)
+    index = 0
+
+    async for chunk in chunks:
+        for start_line, lines in splitter.feed(chunk):
+            parsed_entry = _parse_record(index, start_line, lines, errors, blocks.next())
+            index += 1
+            if parsed_entry is not None:
+                for entry in blocks.ready(parsed_entry):
+                    yield entry
+
+    for start_line, lines in splitter.close():
+        parsed_entry = _parse_record(index, start_line, lines, errors, blocks.next())
+        index += 1
+        if parsed_entry is not None:
+            for entry in blocks.ready(parsed_entry):
+                yield entry
+    for entry in blocks.flush():
+        yield entry
+
+
+async def aread_chunks(reader, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    """Read an async file-like object (e.g. FastAPI's UploadFile) chunk by chunk"""
+    while chunk := await reader.read(chunk_size):
+        yield chunk
+
+
+def iter_bytes(content: bytes, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Slice an in-memory buffer into chunks: each chunk is copied out as it is needed, never the whole buffer at once"""
+    view = memoryview(content)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size].tobytes()
+
 
 async def parse_ris_file(content: bytes) -> List[Dict]:
     """
     Parse RIS file into database-ready format:
     - Stores complete metadata as JSON
     - Extracts key fields for AI screening
+    Entries are plain dicts: the compact StudyViews are for the ingestion pipeline, which streams them
     """
-    # 1. Parse the RIS file content into Python objects (list of dictionaries)
-    try:
-        # rispy.loads converts the RIS format into a list of dictionaries
-        entries = rispy.loads(content.decode())
-        # Initialize empty list to store our processed entries
-        parsed_entries = []
-        
-        # 2. Process each entry from the RIS file
-        for idx, entry in enumerate(entries):
-            # 3. Validate that required fields exist
-            if not entry.get('title') or not entry.get('abstract'):
-                raise ValueError(f"Entry {idx+1} missing required field: title or abstract")
-            
-            # 4. Create a database-ready format for each entry
-            parsed_entry = {
-                # Store complete original entry as JSON
-                'metadata': entry,  # Column A: All original RIS data
-                
-                # Extract and clean specific fields needed for AI screening
-                'title': entry.get('title', '').strip(),  # Column B: Clean title
-                'abstract': entry.get('abstract', '').strip(),  # Column C: Clean abstract
-                'keywords': [kw.strip() for kw in entry.get('keywords', [])],  # Column D: List of keywords
-                
-                # Add fields for AI decisions (initially empty)
-                'decision': None,  # Column E: Will be filled by AI (include/exclude/maybe)
-                'decision_rationale': None,  # Column F: AI's reasoning
-            }
-            
-            # 5. Add the processed entry to our list
-            parsed_entries.append(parsed_entry)
-            
-        # 6. Return all processed entries
-        return parsed_entries
-
-    # 7. Error handling
-    except Exception as e:
-        raise ValueError(f"RIS validation failed: {str(e)}") 
\ No newline at end of file
+    errors: List[Dict] = []
+    parsed_entries = list(iter_ris_entries(iter_bytes(content), errors, compact=False))
+
+    # 7. Error handling: every broken record is reported with the line it starts on
+    if errors:
+        details = "; ".join(f"Entry {e['record']} (line {e['line']}): {e['error']}" for e in errors)
+        raise ValueError(f"RIS validation failed: {details}")
+
+    return parsed_entries
@@ -0,0 +1,146 @@
+# Sharing screening capacity between concurrent jobs
+#
+# JobQueue admits at most max_concurrent_jobs jobs at a time (the rest wait, highest priority first).
+# The admitted jobs then share the global worker capacity:
+#       1. Every LLM call (one study, or one packed batch) holds a slot from WorkerSlots.
+#          SCREENING_MAX_WORKERS slots in total (0 = no global limit). Unset, JobQueue sizes it to the LLM
+#          concurrency of its API keys: one key's worth of SCREENING_WORKERS_PER_JOB per key. Raise
+#          SCREENING_WORKERS_PER_JOB to match so a lone job can use them all
+#       2. A freed slot goes to the job with the fewest slots in use per unit of weight (weighted
+#          max-min fairness), ties to the job served least so far. A 500-study review admitted next to
+#          an 80k-study one gets its share as soon as one LLM call finishes, instead of queueing behind it
+#       3. Capacity is never left idle: a job can use more than its share while nobody else is waiting
+#
+# estimate_start_times turns the running jobs' ETAs into a rough start time for each waiting job.
+
+from typing import Deque, Dict, List, Optional
+from collections import deque
+from contextlib import asynccontextmanager
+import asyncio
+import heapq
+import os
+
+SCREENING_MAX_WORKERS = int(os.environ["SCREENING_MAX_WORKERS"]) if os.getenv("SCREENING_MAX_WORKERS") else None
+
+
+class _JobShare:
+    __slots__ = ("weight", "in_use", "granted", "waiters")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.in_use = 0
+        self.granted = 0  # slots handed out so far, for tie-breaks
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+class WorkerSlots:
+    def __init__(self, slots: int = 0):
+        self.slots = slots or None  # None: unlimited
+        self.in_use = 0
+        self._jobs: Dict[str, _JobShare] = {}
+
+    def register(self, job_id: str, weight: float = 1.0):
+        self._jobs.setdefault(job_id, _JobShare(max(weight, 0.01)))
+
+    def unregister(self, job_id: str):
+        share = self._jobs.pop(job_id, None)
+        if share is None:
+            return
+        for waiter in share.waiters:
+            waiter.cancel()
+        self.in_use -= share.in_use
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, job_id: str):
+        """Hold one of the job's slots for the duration of the block"""
+        await self.acquire(job_id)
+        try:
+            yield
+        finally:
+            self.release(job_id)
+
+    async def acquire(self, job_id: str):
+        self.register(job_id)
+        share = self._jobs[job_id]
+        if self.slots is None or self.in_use < self.slots:
+            self._take(share)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        share.waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Granted just as we were cancelled: pass the slot on
+                self.release(job_id)
+            elif waiter in share.waiters:
+                share.waiters.remove(waiter)
+            raise
+
+    def release(self, job_id: str):
+        share = self._jobs.get(job_id)
+        if share is None or share.in_use == 0:
+            return
+        share.in_use -= 1
+        self.in_use -= 1
+        self._grant()
+
+    def _take(self, share: _JobShare):
+        share.in_use += 1
+        share.granted += 1
+        self.in_use += 1
+
+    def _grant(self):
+        """Hand free slots to waiting jobs, the furthest below their weighted share first"""
+        while self.slots is None or self.in_use < self.slots:
+            waiting = [share for share in self._jobs.values() if share.waiters]
+            if not waiting:
+                return
+            share = min(waiting, key=lambda s: (s.in_use / s.weight, s.granted / s.weight))
+            waiter = share.waiters.popleft()
+            if waiter.cancelled():
+                continue
+            self._take(share)
+            waiter.set_result(None)
+
+    def in_use_by(self, job_id: str) -> int:
+        share = self._jobs.get(job_id)
+        return share.in_use if share else 0
+
+    def stats(self) -> Dict:
+        return {
+            "slots": self.slots,
+            "in_use": self.in_use,
+            "waiting": sum(len(share.waiters) for share in self._jobs.values())
+        }
+
+
+def estimate_start_times(
+    running_remaining: List[Optional[float]],
+    waiting_sizes: List[int],
+    seconds_per_study: Optional[float],
+    concurrency: int
+) -> List[Optional[float]]:
+    """
+    Seconds until each waiting job (in queue order) is admitted: a job starts when the earliest
+    running one finishes. None once an estimate depends on a job with no ETA yet.
+    """
+    finishes = []
+    for remaining in running_remaining:
+        if remaining is None:
+            return [None] * len(waiting_sizes)
+        finishes.append(remaining)
+    # Admission slots that are free right now
+    finishes.extend([0.0] * max(concurrency - len(finishes), 0))
+    heapq.heapify(finishes)
+
+    starts: List[Optional[float]] = []
+    for size in waiting_sizes:
+        start = heapq.heappop(finishes)
+        starts.append(round(start, 1))
+        if seconds_per_study is None:
+            # The next ones also start after this one, whose length is unknown
+            return starts + [None] * (len(waiting_sizes) - len(starts))
+        heapq.heappush(finishes, start + size * seconds_per_study)
+    return starts
@@ -0,0 +1,138 @@
+# Screening text compiled at ingest, with its token count
+#
+# The agents' prompt for a study used to be rebuilt from its title, abstract and keywords on every call,
+# with no idea of its length. It is now compiled once, while the record is parsed (in the parsing processes):
+#       1. Whitespace is collapsed, and copyright boilerplate ("© 2019 Elsevier Ltd. All rights reserved.",
+#          "(PsycInfo Database Record (c) 2023 APA, all rights reserved)") is cut from the end of the abstract:
+#          only whole trailing sentences that open with it, never the abstract's first sentence
+#       2. Keywords are stripped and deduplicated regardless of case (the first spelling is kept)
+#       3. The text is laid out the way the agents send it (Title / Abstract / Keywords) and its tokens are
+#          counted: with tiktoken (SCREENING_TOKEN_ENCODING) when it is installed, else estimated from the
+#          length (CHARS_PER_TOKEN)
+#       4. Text over SCREENING_TEXT_TOKEN_BUDGET is cut: the abstract first, at the last whole word that fits,
+#          then keywords from the end; the title is kept whole. "[truncated]" marks the cut, and the same
+#          record always compiles to the same text
+#
+# studies.screening_text and studies.screening_tokens hold the result: the agents send the text as is, batch
+# packing uses the count, and the job estimate (POST /api/screen/{job_id}/estimate) adds the counts up.
+
+from typing import List, Optional, Tuple
+import os
+import re
+
+try:
+    import tiktoken
+except ImportError:  # Token counts are estimated from the text length instead
+    tiktoken = None
+
+SCREENING_TEXT_TOKEN_BUDGET = int(os.getenv("SCREENING_TEXT_TOKEN_BUDGET", 1500))  # per study, 0 = no limit
+SCREENING_TOKEN_ENCODING = os.getenv("SCREENING_TOKEN_ENCODING", "o200k_base")  # the gpt-4o family's encoding
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+
+TRUNCATED = "[truncated]"
+_BOILERPLATE_TAIL = 400  # characters at the end of an abstract searched for boilerplate
+_BOILERPLATE = re.compile(
+    r"\(?(?:copyright\b|©|\(c\) ?(?:\d{4}|the author)|all rights reserved"
+    r"|this article is protected by copyright|psycinfo database record)",
+    re.IGNORECASE
+)
+_SENTENCE_START = re.compile(r"(?<=[.!?]) (?=\S)")
+
+_encoding = None  # tiktoken encoding, loaded on first use; False when it cannot be
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = False
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding(SCREENING_TOKEN_ENCODING)
+            except Exception:  # e.g. no network access to fetch the encoding on first use
+                pass
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // CHARS_PER_TOKEN + 1
+    return len(encoding.encode_ordinary(text))
+
+
+def normalize_text(text: Optional[str]) -> str:
+    return " ".join((text or "").split())
+
+
+def strip_boilerplate(abstract: str) -> str:
+    """Cut the trailing sentences that are copyright lines from an abstract (normalized whitespace)"""
+    tail = max(len(abstract) - _BOILERPLATE_TAIL, 0)
+    end = len(abstract)
+    while True:
+        # The last sentence before `end`. The first sentence is never cut, so the abstract cannot empty,
+        # and an abstract that is nothing but boilerplate is kept whole
+        last = None
+        for last in _SENTENCE_START.finditer(abstract, tail, end):
+            pass
+        if last is None and not tail and _BOILERPLATE.match(abstract, 0, end):
+            return abstract
+        if last is None or not _BOILERPLATE.match(abstract, last.end(), end):
+            return abstract[:end].rstrip()
+        end = last.start()
+
+
+def dedupe_keywords(keywords: Optional[List[str]]) -> List[str]:
+    seen = set()
+    unique = []
+    for keyword in keywords or []:
+        keyword = normalize_text(keyword)
+        if keyword and keyword.casefold() not in seen:
+            seen.add(keyword.casefold())
+            unique.append(keyword)
+    return unique
+
+
+def _layout(title: str, abstract: str, keywords: List[str]) -> str:
+    return f"Title: {title}\nAbstract: {abstract}\nKeywords: {', '.join(keywords)}"
+
+
+def _truncate(text: str, tokens: int) -> str:
+    """The longest start of `text` within `tokens` tokens that ends on a whole word"""
+    if tokens <= 0:
+        return ""
+    encoding = _get_encoding()
+    if encoding is None:
+        cut = text[:(tokens - 1) * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode_ordinary(text)[:tokens]).rstrip("�")
+    if len(cut) < len(text) and not text[len(cut)].isspace():
+        cut = cut.rsplit(" ", 1)[0] if " " in cut else ""
+    return cut.rstrip(" ,;:")
+
+
+def compile_screening_text(
+    title: Optional[str],
+    abstract: Optional[str],
+    keywords: Optional[List[str]],
+    token_budget: int = SCREENING_TEXT_TOKEN_BUDGET
+) -> Tuple[str, int]:
+    """The study's screening text, cut to `token_budget` tokens, and its token count"""
+    title = normalize_text(title)
+    abstract = strip_boilerplate(normalize_text(abstract))
+    keywords = dedupe_keywords(keywords)
+    text = _layout(title, abstract, keywords)
+    tokens = count_tokens(text)
+    if not token_budget or tokens <= token_budget:
+        return text, tokens
+
+    while keywords and count_tokens(_layout(title, TRUNCATED, keywords)) > token_budget:
+        keywords = keywords[:-1]
+    room = token_budget - count_tokens(_layout(title, TRUNCATED, keywords))
+    while True:
+        # Tokens do not quite add up across the cut: shrink until the whole text fits
+        kept = _truncate(abstract, room)
+        text = _layout(title, f"{kept} {TRUNCATED}" if kept else TRUNCATED, keywords)
+        tokens = count_tokens(text)
+        if tokens <= token_budget or not kept:
+            return text, tokens
+        room -= tokens - token_budget
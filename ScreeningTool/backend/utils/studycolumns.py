@@ -0,0 +1,290 @@
+# Compact, column-oriented storage for parsed studies
+#
+# A parsed study used to be a dict holding the whole rispy entry (a dict of strings and lists) next to
+# copies of its title, abstract and keywords: several kilobytes of Python objects per study. Between
+# parsing and storage, studies are now appended to a StudyColumns block instead:
+#       1. Each row's title and abstract (UTF-8) and the rest of its rispy entry (authors, journal,
+#          year, ..., marshalled: rispy only produces strings, lists and dicts; its unknown_tag
+#          defaultdict is kept as a plain dict) are zlib-compressed together into one blob
+#          (STUDY_ZLIB_LEVEL, 0 = stored as is: faster, about half as compact). The blobs sit back to
+#          back in one buffer, found by offsets. The title, abstract and keywords are taken out of the
+#          entry when they equal the extracted values and put back when the metadata dict is
+#          materialized, i.e. only when the row is written
+#       2. DOIs, read for every row by deduplication, are kept uncompressed in a buffer of their own
+#       3. Keywords are interned per block: each row holds 4-byte ids into the block's keyword table
+#       4. Ids and duplicate_of are 16-byte UUIDs
+#       5. The file the rows were parsed from (source_file) is one value for the whole block
+#       6. Hashed term features (utils/relevance.py) are packed 4-byte ints, computed for the rows appended
+#          since the last time in one batch: when the block is finished (full, or the last of a stream),
+#          pickled, or read
+#       7. The screening text (utils/screeningtext.py) goes into the row's blob after the abstract: it mostly
+#          repeats the title and abstract, which zlib turns into back-references. Its token count is a 4-byte int
+#
+# Each study is handed around as a StudyView (two slots: the block and the row), which reads like the
+# old dict (view["title"], view.get("metadata"), view["id"] = ...), so deduplication and storage work
+# on either. Views keep their block alive; a block is freed once its last view has been stored.
+
+from typing import Dict, Iterator, List, Optional
+from array import array
+from collections.abc import Mapping
+import marshal
+import os
+import uuid
+import zlib
+from utils.relevance import term_features_batch
+
+BLOCK_ROWS = 1024  # rows per StudyColumns block when parsing a stream
+
+_NO_ID = bytes(16)
+STUDY_ZLIB_LEVEL = int(os.getenv("STUDY_ZLIB_LEVEL", 1))  # level 1 is about as small as 6 on abstracts, and faster
+
+# Metadata fields moved into the columns, one bit each
+_MOVED_TITLE = {"title": 1, "primary_title": 2}
+_MOVED_ABSTRACT = {"abstract": 4, "notes_abstract": 8}
+_MOVED_KEYWORDS = 16
+
+
+def _first(value) -> Optional[str]:
+    if isinstance(value, list):
+        value = value[0] if value else None
+    return value if isinstance(value, str) else None
+
+
+class StudyColumns:
+    def __init__(self, zlib_level: int = STUDY_ZLIB_LEVEL, source_file: Optional[str] = None):
+        self.zlib_level = zlib_level
+        self.source_file = source_file
+        self._blobs = bytearray()  # one compressed blob per row: title, abstract, the rest of the entry
+        self._blob_ends = array("Q")
+        self._field_ends = array("I")  # 3 per row, in the uncompressed blob: end of title, abstract, screening text
+        self._dois = bytearray()
+        self._doi_ends = array("Q")
+        self._keyword_ids = array("I")
+        self._keyword_ends = array("I")  # 1 per row
+        self._keyword_table: Dict[str, int] = {}
+        self._keywords: List[str] = []
+        self._terms = array("I")
+        self._term_ends = array("Q")  # 1 per row, once its terms are computed
+        self._pending_terms: List[str] = []  # title and abstract of the rows appended since
+        self._screening_tokens = array("I")
+        self._moved = bytearray()  # 1 per row: which metadata fields live in the columns
+        self._ids = bytearray()  # 16 bytes per row, zeros while unset
+        self._duplicate_of = bytearray()
+        self._last_blob = (-1, b"")  # rows are read field by field, in order: decompress each once
+
+    def __len__(self) -> int:
+        return len(self._moved)
+
+    def append(
+        self,
+        entry: Dict,
+        title_key: str,
+        title: str,
+        abstract_key: str,
+        abstract: str,
+        screening_text: str = "",
+        screening_tokens: int = 0
+    ) -> "StudyView":
+        """Add a rispy entry whose title and abstract (stripped) were read from `title_key` and `abstract_key`"""
+        rest = dict(entry)
+        moved = 0
+        if rest.get(title_key) == title:
+            del rest[title_key]
+            moved |= _MOVED_TITLE[title_key]
+        if rest.get(abstract_key) == abstract:
+            del rest[abstract_key]
+            moved |= _MOVED_ABSTRACT[abstract_key]
+
+        keywords = [keyword.strip() for keyword in entry.get("keywords") or []]
+        if isinstance(rest.get("keywords"), list) and rest["keywords"] == keywords:
+            del rest["keywords"]
+            moved |= _MOVED_KEYWORDS
+        for key, value in rest.items():
+            if isinstance(value, dict) and type(value) is not dict:
+                rest[key] = dict(value)
+
+        # Everything that can fail happens before the first column grows, so a bad entry leaves no trace
+        encoded_title, encoded_abstract = title.encode("utf-8"), abstract.encode("utf-8")
+        encoded_text = screening_text.encode("utf-8")
+        blob = encoded_title + encoded_abstract + encoded_text + marshal.dumps(rest)
+        doi = (_first(entry.get("doi")) or "").encode("utf-8")
+
+        for keyword in keywords:
+            keyword_id = self._keyword_table.get(keyword)
+            if keyword_id is None:
+                keyword_id = self._keyword_table[keyword] = len(self._keywords)
+                self._keywords.append(keyword)
+            self._keyword_ids.append(keyword_id)
+        self._keyword_ends.append(len(self._keyword_ids))
+        self._pending_terms.append(f"{title} {abstract}")
+        self._dois += doi
+        self._doi_ends.append(len(self._dois))
+        self._screening_tokens.append(screening_tokens)
+        self._field_ends.append(len(encoded_title))
+        self._field_ends.append(len(encoded_title) + len(encoded_abstract))
+        self._field_ends.append(len(encoded_title) + len(encoded_abstract) + len(encoded_text))
+        self._blobs += zlib.compress(blob, self.zlib_level) if self.zlib_level else blob
+        self._blob_ends.append(len(self._blobs))
+        self._moved.append(moved)
+        self._ids += _NO_ID
+        self._duplicate_of += _NO_ID
+        return StudyView(self, len(self._moved) - 1)
+
+    def _blob(self, row: int) -> bytes:
+        if self._last_blob[0] == row:
+            return self._last_blob[1]
+        start = self._blob_ends[row - 1] if row else 0
+        blob = bytes(self._blobs[start:self._blob_ends[row]])
+        if self.zlib_level:
+            blob = zlib.decompress(blob)
+        self._last_blob = (row, blob)
+        return blob
+
+    def _text_field(self, row: int, field: int) -> str:
+        start = self._field_ends[row * 3 + field - 1] if field else 0
+        return self._blob(row)[start:self._field_ends[row * 3 + field]].decode("utf-8")
+
+    def title(self, row: int) -> str:
+        return self._text_field(row, 0)
+
+    def abstract(self, row: int) -> str:
+        return self._text_field(row, 1)
+
+    def screening_text(self, row: int) -> str:
+        return self._text_field(row, 2)
+
+    def screening_tokens(self, row: int) -> int:
+        return self._screening_tokens[row]
+
+    def doi(self, row: int) -> Optional[str]:
+        start = self._doi_ends[row - 1] if row else 0
+        return self._dois[start:self._doi_ends[row]].decode("utf-8") or None
+
+    def keywords(self, row: int) -> List[str]:
+        start = self._keyword_ends[row - 1] if row else 0
+        table = self._keywords
+        return [table[keyword_id] for keyword_id in self._keyword_ids[start:self._keyword_ends[row]]]
+
+    def finish(self):
+        """Compute the term features of the rows appended since the last call"""
+        if not self._pending_terms:
+            return
+        packed, ends = term_features_batch(self._pending_terms)
+        offset = len(self._terms)
+        self._terms.frombytes(packed.tobytes())
+        self._term_ends.extend((ends + offset).tolist())
+        self._pending_terms = []
+
+    def terms(self, row: int) -> List[int]:
+        if row >= len(self._term_ends):
+            self.finish()
+        start = self._term_ends[row - 1] if row else 0
+        return self._terms[start:self._term_ends[row]].tolist()
+
+    def metadata(self, row: int) -> Dict:
+        """Rebuild the row's complete rispy entry (a new dict on every call)"""
+        blob = self._blob(row)
+        title_end, abstract_end, text_end = self._field_ends[row * 3:row * 3 + 3]
+        entry = marshal.loads(blob[text_end:])
+        moved = self._moved[row]
+        for key, bit in _MOVED_TITLE.items():
+            if moved & bit:
+                entry[key] = blob[:title_end].decode("utf-8")
+        for key, bit in _MOVED_ABSTRACT.items():
+            if moved & bit:
+                entry[key] = blob[title_end:abstract_end].decode("utf-8")
+        if moved & _MOVED_KEYWORDS:
+            entry["keywords"] = self.keywords(row)
+        return entry
+
+    def _get_id(self, column: bytearray, row: int) -> Optional[str]:
+        value = bytes(column[row * 16:row * 16 + 16])
+        return str(uuid.UUID(bytes=value)) if value != _NO_ID else None
+
+    def _set_id(self, column: bytearray, row: int, value: Optional[str]):
+        column[row * 16:row * 16 + 16] = uuid.UUID(str(value)).bytes if value else _NO_ID
+
+    def __getstate__(self) -> Dict:
+        # Blocks parsed in another process come back with their terms computed there
+        self.finish()
+        return self.__dict__
+
+    def __iter__(self) -> Iterator["StudyView"]:
+        for row in range(len(self)):
+            yield StudyView(self, row)
+
+    def nbytes(self) -> int:
+        """Bytes held by the columns themselves"""
+        return (
+            len(self._blobs) + len(self._dois) + len(self._moved) + len(self._ids) + len(self._duplicate_of)
+            + self._blob_ends.itemsize * len(self._blob_ends) + self._field_ends.itemsize * len(self._field_ends)
+            + self._doi_ends.itemsize * len(self._doi_ends)
+            + self._keyword_ids.itemsize * len(self._keyword_ids) + self._keyword_ends.itemsize * len(self._keyword_ends)
+            + sum(len(keyword) for keyword in self._keywords)
+            + self._terms.itemsize * len(self._terms) + self._term_ends.itemsize * len(self._term_ends)
+            + self._screening_tokens.itemsize * len(self._screening_tokens)
+        )
+
+
+class StudyView(Mapping):
+    """One study of a StudyColumns block, read like the parsed-entry dict it replaces"""
+
+    __slots__ = ("_columns", "_row")
+
+    KEYS = (
+        "id", "duplicate_of", "metadata", "title", "abstract", "keywords", "doi", "terms", "screening_text",
+        "screening_tokens", "source_file", "decision", "decision_rationale"
+    )
+
+    def __init__(self, columns: StudyColumns, row: int):
+        self._columns = columns
+        self._row = row
+
+    def __getitem__(self, key: str):
+        columns, row = self._columns, self._row
+        if key == "title":
+            return columns.title(row)
+        if key == "abstract":
+            return columns.abstract(row)
+        if key == "keywords":
+            return columns.keywords(row)
+        if key == "doi":
+            return columns.doi(row)
+        if key == "metadata":
+            return columns.metadata(row)
+        if key == "id":
+            return columns._get_id(columns._ids, row)
+        if key == "duplicate_of":
+            return columns._get_id(columns._duplicate_of, row)
+        if key == "terms":
+            return columns.terms(row)
+        if key == "screening_text":
+            return columns.screening_text(row)
+        if key == "screening_tokens":
+            return columns.screening_tokens(row)
+        if key == "source_file":
+            return columns.source_file
+        if key in ("decision", "decision_rationale"):
+            return None
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Optional[str]):
+        """Only the ids are set after parsing (by deduplication)"""
+        if key == "id":
+            self._columns._set_id(self._columns._ids, self._row, value)
+        elif key == "duplicate_of":
+            self._columns._set_id(self._columns._duplicate_of, self._row, value)
+        else:
+            raise KeyError(f"{key} is read-only on a parsed study")
+
+    def __contains__(self, key) -> bool:
+        return key in self.KEYS
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.KEYS)
+
+    def __len__(self) -> int:
+        return len(self.KEYS)
+
+    def __repr__(self) -> str:
+        return f"<StudyView {self._row}: {self['title'][:40]!r}>"
@@ -1,5 +1,6 @@
-from typing import List, Dict
-from utils.risfileparsing import parse_ris_file
+from typing import AsyncIterable, AsyncIterator, List, Dict, Tuple
+from utils.parallelparsing import aparse_ris_files
+from utils.risfileparsing import parse_ris_file, aiter_ris_entries
 from models import ScreeningCriteria
 
 async def validate_ris_file(content: bytes) -> List[Dict]:
@@ -16,6 +17,26 @@ async def validate_ris_file(content: bytes) -> List[Dict]:
     except Exception as e:
         raise ValueError(f"Invalid RIS file: {str(e)}")
 
+async def validate_ris_stream(chunks: AsyncIterable[bytes], errors: List[Dict]) -> AsyncIterator[Dict]:
+    """Validate a streamed RIS file record by record, collecting per-record errors"""
+    valid_count = 0
+    async for entry in aiter_ris_entries(chunks, errors):
+        valid_count += 1
+        yield entry
+
+    if not valid_count:
+        raise ValueError("Invalid RIS file: No valid entries found in RIS file")
+
+async def validate_ris_files(files: List[Tuple[str, object]], errors: List[Dict]) -> AsyncIterator[Dict]:
+    """Validate several RIS files, parsed in parallel and merged in upload order, collecting per-record errors"""
+    valid_count = 0
+    async for entry in aparse_ris_files(files, errors):
+        valid_count += 1
+        yield entry
+
+    if not valid_count:
+        raise ValueError("Invalid RIS file: No valid entries found in the uploaded files")
+
 async def validate_criteria(criteria: ScreeningCriteria) -> bool:
     """Validate screening criteria"""
     if not criteria.inclusion:
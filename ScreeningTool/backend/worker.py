@@ -0,0 +1,197 @@
+"""
+Screening worker process
+------------------------
+
+Screens the jobs published through the broker (broker.py), outside the API
+process. Run as many as needed, on as many machines as needed: they share
+nothing but the broker and the database.
+
+Each worker polls the broker's active jobs (and wakes up at once when one
+is published) and runs the usual JobQueue claim loops on up to --jobs of
+them. Studies are leased through the database (schema.sql), so workers
+never screen the same study twice, and the leases of a worker that dies
+are taken over by the others once they expire. A job is retired from the
+broker by the first worker that finds it has nothing left undecided; every
+worker then drops it. A job published again (e.g. screened again with
+edited criteria) is picked up afresh, under its new criteria version.
+
+The lexical prefilter runs once per job (and criteria version), on the
+worker that takes its lock. The other workers wait for its summary on the
+broker before they claim anything, so no LLM call is spent on a study the
+prefilter is about to exclude.
+
+Usage (from backend/):
+    SCREENING_BROKER=redis://localhost:6379/0 python -m worker --jobs 3 --workers-per-job 4
+"""
+
+from typing import Callable, Dict, Optional
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+from models import JobStatus, ScreeningCriteria
+from database import close_db
+from broker import BrokerJobStore, create_broker
+from job_queue import JobQueue
+from utils.prefilter import LexicalPrefilter
+
+PREFILTER_LOCK_TTL = float(os.getenv("PREFILTER_LOCK_TTL", 600))  # seconds one worker has to prefilter a job
+
+
+class ScreeningWorker:
+    def __init__(
+        self,
+        broker,
+        db=None,
+        agent_factory: Optional[Callable] = None,
+        max_jobs: int = 3,
+        workers_per_job: Optional[int] = None,
+        poll_interval: float = 2.0,
+        name: Optional[str] = None
+    ):
+        self.broker = broker
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.queue = JobQueue(db=db, agent_factory=agent_factory, job_store=BrokerJobStore(broker))
+        if workers_per_job:
+            self.queue.workers_per_job = workers_per_job
+        self.max_jobs = max_jobs
+        self.poll_interval = poll_interval  # seconds between two looks at the active jobs
+        self.running: Dict[str, asyncio.Task] = {}
+        self._last_started: Dict[str, float] = {}
+        self._enqueued_at: Dict[str, float] = {}  # per job, when the spec its job dict was built from was published
+
+    async def run(self, stop: Optional[asyncio.Event] = None):
+        """Pick up active jobs until `stop` is set, then hand back every claim held"""
+        stop = stop or asyncio.Event()
+        try:
+            while not stop.is_set():
+                specs = await self.broker.active_jobs()
+                self._forget_retired({spec["job_id"] for spec in specs})
+                for spec in specs:
+                    self._start(spec)
+                await self.broker.wait_for_jobs(self.poll_interval)
+        finally:
+            for task in self.running.values():
+                task.cancel()
+            await asyncio.gather(*self.running.values(), return_exceptions=True)
+
+    def _forget_retired(self, active_ids):
+        """Drop the jobs the broker no longer lists (finished, by this worker or another)"""
+        for job_id in list(self.queue.jobs):
+            if job_id not in active_ids and job_id not in self.running:
+                self.queue.forget_job(job_id)
+                self.queue.job_store.forget(job_id)
+                self._last_started.pop(job_id, None)
+                self._enqueued_at.pop(job_id, None)
+
+    def _start(self, spec: Dict):
+        job_id = spec["job_id"]
+        if job_id in self.running or len(self.running) >= self.max_jobs:
+            return
+        # A job whose last studies are leased by other workers is looked at again
+        # once per poll interval, not in a tight loop
+        if time.monotonic() - self._last_started.get(job_id, float("-inf")) < self.poll_interval:
+            return
+        self._last_started[job_id] = time.monotonic()
+        task = asyncio.create_task(self._run_job(spec))
+        self.running[job_id] = task
+        task.add_done_callback(lambda _: self.running.pop(job_id, None))
+
+    async def _run_job(self, spec: Dict):
+        job_id = spec["job_id"]
+        job = self.queue.jobs.get(job_id)
+        version = spec.get("criteria_version", 1)
+        republished = self._enqueued_at.get(job_id) != spec.get("enqueued_at")
+        if job is None or job["criteria_version"] != version or republished:
+            # First seen, or published again since: screen under the spec's criteria, not the ones cached
+            self.queue.forget_job(job_id)
+            self.queue.job_store.forget(job_id)
+            job = await self.queue.add_job(
+                job_id, ScreeningCriteria(**spec["criteria"]), spec["total_studies"], version
+            )
+            self._enqueued_at[job_id] = spec.get("enqueued_at")
+        job["retry_count"] = 0
+
+        await self._wait_for_prefilter(job)
+
+        await self.broker.mark_started(job_id)
+        await self.broker.increment(job_id, {"claim_loops": self.queue.workers_per_job})
+        follower = asyncio.create_task(self._follow_shared_progress(job))
+        try:
+            await self.queue.process_job(job)
+        finally:
+            follower.cancel()
+            await self.broker.increment(job_id, {"claim_loops": -self.queue.workers_per_job})
+
+        if job["status"] == JobStatus.FAILED:
+            await self.broker.finish(job_id, JobStatus.FAILED.value, job["last_error"])
+            return
+        # Studies still leased by another worker are that worker's to finish (or ours to reclaim later)
+        db = await self.queue._get_db()
+        if await db.count_studies(job_id, undecided_only=True) == 0:
+            await self.broker.finish(job_id, JobStatus.COMPLETED.value)
+
+    async def _wait_for_prefilter(self, job: Dict):
+        """
+        Return once the job's prefilter has run on another worker (taking its summary), or once this
+        worker holds the prefilter lock, in which case process_job runs it. A lock left by a worker that
+        died expires after PREFILTER_LOCK_TTL, and the next worker to look takes it over.
+        """
+        prefilter = LexicalPrefilter.from_env(job["criteria"])
+        if job["prefilter"] is not None or prefilter is None or not prefilter.can_exclude:
+            return
+        lock = f"prefilter:{job['id']}:{job['criteria_version']}"
+        while True:
+            remote = await self.broker.get_status(job["id"])
+            if remote and remote.get("prefilter"):
+                job["prefilter"] = remote["prefilter"]
+                return
+            if await self.broker.acquire(lock, PREFILTER_LOCK_TTL):
+                return
+            await asyncio.sleep(self.poll_interval)
+
+    async def _follow_shared_progress(self, job: Dict):
+        """Keep the job's progress across all workers at hand, so claims are sized by the global share"""
+        while True:
+            remote = await self.broker.get_status(job["id"])
+            if remote:
+                job["shared_progress"] = {
+                    "processed_studies": remote["processed_studies"],
+                    "claim_loops": max(remote["claim_loops"], 1)
+                }
+            await asyncio.sleep(self.poll_interval)
+
+
+async def main(args):
+    broker = create_broker()
+    if broker is None:
+        raise SystemExit("Set SCREENING_BROKER (e.g. redis://localhost:6379/0) to run a worker")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+
+    worker = ScreeningWorker(
+        broker,
+        max_jobs=args.jobs,
+        workers_per_job=args.workers_per_job,
+        poll_interval=args.poll_interval
+    )
+    print(f"Screening worker {worker.name} waiting for jobs")
+    try:
+        await worker.run(stop)
+    finally:
+        worker.queue.job_store.close()
+        await broker.close()
+        await close_db()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screening worker")
+    parser.add_argument("--jobs", type=int, default=3, help="jobs screened at the same time")
+    parser.add_argument("--workers-per-job", type=int, default=0, help="claim loops per job (default: SCREENING_WORKERS_PER_JOB)")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="seconds between looks at the active jobs")
+    asyncio.run(main(parser.parse_args()))
@@ -6,7 +6,57 @@ import { Card } from '@/components/ui/card';
 import { Upload, Loader2 } from 'lucide-react';
 import { useToast } from "@/hooks/use-toast"
 
-const MAX_FILE_SIZE = 10 * 1024 * 1024; // 10MB
+const INGEST_POLL_INTERVAL = 1000; // ms
+const STUDIES_PAGE_SIZE = 500; // the largest page /api/studies returns
+
+// The upload is accepted with 202 and ingested in the background: wait for the
+// ingest to finish, then load every stored study, a page at a time
+async function uploadRisFile(risFile: File) {
+  const formData = new FormData();
+  formData.append('file', risFile);
+  
+  const response = await fetch('/api/upload', {
+    method: 'POST',
+    body: formData,
+  });
+  
+  if (!response.ok) {
+    const errorData = await response.json();
+    throw new Error(errorData.detail || 'Upload failed');
+  }
+  
+  const { job_id } = await response.json();
+  
+  let ingest;
+  while (true) {
+    const statusResponse = await fetch(`/api/upload/${job_id}`);
+    ingest = await statusResponse.json();
+    if (!statusResponse.ok) {
+      throw new Error(ingest.detail || 'Upload failed');
+    }
+    if (ingest.status === 'failed') {
+      throw new Error(ingest.error || 'Upload failed');
+    }
+    if (ingest.status === 'completed') {
+      break;
+    }
+    await new Promise(resolve => setTimeout(resolve, INGEST_POLL_INTERVAL));
+  }
+  
+  const studies: any[] = [];
+  let cursor: string | null = null;
+  do {
+    const after: string = cursor ? `&after=${encodeURIComponent(cursor)}` : '';
+    const studiesResponse = await fetch(`/api/studies/${job_id}?limit=${STUDIES_PAGE_SIZE}${after}`);
+    const page = await studiesResponse.json();
+    if (!studiesResponse.ok) {
+      throw new Error(page.detail || 'Could not load the uploaded studies');
+    }
+    studies.push(...page.studies);
+    cursor = page.next_cursor;
+  } while (cursor);
+  return { jobId: job_id, ingest, studies };
+}
 
 export function FileUpload() {
   const { setStudies, setStage } = useWorkflow();
@@ -24,11 +74,6 @@ export function FileUpload() {
       return false;
     }
 
-    if (file.size > MAX_FILE_SIZE) {
-      setError('File size exceeds 10MB limit');
-      return false;
-    }
-
     return true;
   };
 
@@ -47,27 +92,14 @@ export function FileUpload() {
         setIsLoading(true);
         setError(null);
         
-        const formData = new FormData();
-        formData.append('file', risFile);
-        
-        const response = await fetch('/api/upload', {
-          method: 'POST',
-          body: formData,
-        });
-        
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(errorData.detail || 'Upload failed');
-        }
-        
-        const data = await response.json();
-        setStudies(data.validated_entries);
+        const data = await uploadRisFile(risFile);
+        setStudies(data.studies);
         setStage('criteria');
         
         // Show success toast
         toast({
           title: "File Upload Successful",
-          description: `Successfully processed ${data.study_count} studies from ${risFile.name}`,
+          description: `Successfully processed ${data.ingest.parsed} studies from ${risFile.name}`,
           variant: "default",
         });
 
@@ -107,27 +139,14 @@ export function FileUpload() {
         setIsLoading(true);
         setError(null);
         
-        const formData = new FormData();
-        formData.append('file', risFile);
-        
-        const response = await fetch('/api/upload', {
-          method: 'POST',
-          body: formData,
-        });
-        
-        if (!response.ok) {
-          const errorData = await response.json();
-          throw new Error(errorData.detail || 'Upload failed');
-        }
-        
-        const data = await response.json();
-        setStudies(data.validated_entries);
+        const data = await uploadRisFile(risFile);
+        setStudies(data.studies);
         setStage('criteria');
         
         // Show success toast
         toast({
           title: "File Upload Successful",
-          description: `Successfully processed ${data.study_count} studies from ${risFile.name}`,
+          description: `Successfully processed ${data.ingest.parsed} studies from ${risFile.name}`,
           variant: "default",
         });
 